@@ -34,6 +34,7 @@ import os.path
 
 from .gui import ORStoolsDialog
 from .proc import provider, ENDPOINTS, DEFAULT_SETTINGS
+from .utils import configmanager
 
 
 class ORStools:
@@ -102,6 +103,6 @@ class ORStools:
                     prov["endpoints"] = ENDPOINTS
                     settings["providers"][i] = prov
             if changed:
-                s.setValue("ORStools/config", settings)
+                configmanager.write_config(settings)
         else:
-            s.setValue("ORStools/config", DEFAULT_SETTINGS)
+            configmanager.write_config(DEFAULT_SETTINGS)
@@ -54,14 +54,23 @@ ADVANCED_PARAMETERS = [
     "INPUT_AVOID_BORDERS",
     "INPUT_AVOID_COUNTRIES",
     "INPUT_AVOID_POLYGONS",
+    "INPUT_AVOID_POLYGONS_TOLERANCE",
     "INPUT_SMOOTHING",
     "EXTRA_INFO",
     "CSV_FACTOR",
     "CSV_COLUMN",
+    "MERGE_EXTRA_INFO",
+    "INPUT_MAX_CROW_DISTANCE",
+    "INPUT_EXCLUDE_SAME_ID",
+    "INPUT_SKIP_REVERSE_PAIRS",
 ]
 
 LOCATION_TYPES = ["start", "destination"]
 
+SYMMETRIC_MODES = ["Off", "Mirror upper triangle", "Unique pairs only"]
+
+GRAPH_MODES = ["Shortest paths (Dijkstra)", "Shortest paths (bidirectional)", "Cost trees"]
+
 EXTRA_INFOS = [
     "steepness",
     "suitability",
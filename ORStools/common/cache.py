@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ ORStools
+                                 A QGIS plugin
+ QGIS client to query openrouteservice
+                              -------------------
+        begin                : 2017-02-01
+        git sha              : $Format:%H$
+        copyright            : (C) 2021 by HeiGIT gGmbH
+        email                : support@openrouteservice.heigit.org
+ ***************************************************************************/
+
+ This plugin provides access to openrouteservice API functionalities
+ (https://openrouteservice.org), developed and
+ maintained by the openrouteservice team of HeiGIT gGmbH, Germany. By using
+ this plugin you agree to the ORS terms of service
+ (https://openrouteservice.org/terms-of-service/).
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Optional
+
+from qgis.core import QgsApplication
+
+CACHE_FILE_NAME = "response_cache.sqlite"
+# Least recently used responses are evicted beyond this size
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+# Expired responses are deleted every this many puts, get treats them as missing anyway
+EXPIRE_EVERY_PUTS = 100
+
+
+class ResponseCache:
+    """Persistent cache of API responses in a single SQLite file.
+
+    Responses are stored zlib-compressed and keyed by :meth:`make_key`. Entries
+    older than the TTL are treated as missing and deleted from time to time, and the
+    least recently used ones are evicted when the file grows beyond its maximum size.
+    """
+
+    def __init__(
+        self, path: str, max_bytes: int = CACHE_MAX_BYTES, ttl: int = CACHE_TTL_SECONDS
+    ) -> None:
+        """
+        :param path: path of the SQLite file, created if it doesn't exist.
+        :type path: str
+
+        :param max_bytes: maximum size of all stored responses.
+        :type max_bytes: int
+
+        :param ttl: seconds after which a response expires.
+        :type ttl: int
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                base_url TEXT,
+                response BLOB,
+                size INTEGER,
+                created REAL,
+                accessed REAL
+            )"""
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_created ON responses (created)"
+        )
+        self._connection.commit()
+        self._size = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(base_url: str, url: str, post_json: Optional[dict]) -> str:
+        """
+        Build the cache key of a request. The id of the request body is ignored,
+        as it only serves to identify features in the output.
+
+        :param base_url: base URL of the provider
+        :type base_url: str
+
+        :param url: endpoint path including the query string
+        :type url: str
+
+        :param post_json: request body
+        :type post_json: dict or None
+
+        :returns: hex digest identifying the request
+        :rtype: str
+        """
+        body = {k: v for k, v in (post_json or {}).items() if k != "id"}
+        canonical = json.dumps(
+            [base_url.rstrip("/"), url, body], sort_keys=True, separators=(",", ":"), default=str
+        )
+
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Returns the cached response or None if it is missing or expired.
+
+        :param key: cache key of the request
+        :type key: str
+
+        :rtype: dict or None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+
+            self._connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+            self.hits += 1
+
+        return json.loads(zlib.decompress(row[0]).decode())
+
+    def put(self, key: str, base_url: str, response: dict) -> None:
+        """
+        Store a response and evict the least recently used ones if the cache is full.
+
+        :param key: cache key of the request
+        :type key: str
+
+        :param base_url: base URL of the provider, used to clear a single provider
+        :type base_url: str
+
+        :param response: parsed API response
+        :type response: dict
+        """
+        blob = zlib.compress(json.dumps(response, separators=(",", ":")).encode())
+        now = time.time()
+        with self._lock:
+            old = self._connection.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, base_url.rstrip("/"), blob, len(blob), now, now),
+            )
+            self._size += len(blob) - (old[0] if old else 0)
+            self._puts += 1
+            if self._puts % EXPIRE_EVERY_PUTS == 0:
+                self._expire()
+            if self._size > self.max_bytes:
+                self._evict()
+            self._connection.commit()
+
+    def clear(self, base_url: Optional[str] = None) -> None:
+        """
+        Remove all responses, or only those of one provider.
+
+        :param base_url: base URL of the provider to clear, all if None
+        :type base_url: str or None
+        """
+        with self._lock:
+            if base_url is None:
+                self._connection.execute("DELETE FROM responses")
+            else:
+                self._connection.execute(
+                    "DELETE FROM responses WHERE base_url = ?", (base_url.rstrip("/"),)
+                )
+            self._connection.commit()
+            self._size = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+            self._connection.execute("VACUUM")
+
+    def stats(self) -> dict:
+        """
+        Returns number of entries, their size in bytes and the session's hits and misses.
+
+        :rtype: dict
+        """
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+        return dict(entries=entries, bytes=self._size, hits=self.hits, misses=self.misses)
+
+    def _expire(self) -> None:
+        """Delete the expired responses."""
+        expired = self._connection.execute(
+            "DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,)
+        )
+        if expired.rowcount:
+            self._size = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+
+    def _evict(self) -> None:
+        """Delete expired and least recently used responses until the cache fits."""
+        self._expire()
+        if self._size <= self.max_bytes:
+            return
+
+        # Make some room at once instead of evicting on every following put
+        excess = self._size - int(self.max_bytes * 0.9)
+        evicted = []
+        for key, size in self._connection.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        ):
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+            self._size -= size
+
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Returns the response cache shared by all clients, stored in the QGIS profile folder.
+
+    :rtype: ResponseCache
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            folder = os.path.join(QgsApplication.qgisSettingsDirPath(), "ORStools")
+            os.makedirs(folder, exist_ok=True)
+            _cache = ResponseCache(os.path.join(folder, CACHE_FILE_NAME))
+
+    return _cache
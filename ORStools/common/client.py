@@ -29,21 +29,33 @@
 
 import json
 import random
+import time
 from datetime import datetime, timedelta
-from typing import Union, Dict, List, Optional
+from typing import Any, Union, Dict, Generator, Iterable, List, Optional, Tuple
 from urllib.parse import urlencode
 
 
 from qgis.PyQt.QtCore import QObject, pyqtSignal, QUrl, QTimer, QEventLoop
 from qgis.PyQt.QtNetwork import QNetworkRequest, QNetworkReply
-from qgis.core import QgsSettings, QgsBlockingNetworkRequest
+from qgis.core import (
+    QgsSettings,
+    QgsBlockingNetworkRequest,
+    QgsNetworkAccessManager,
+    QgsNetworkReplyContent,
+)
 from requests.utils import unquote_unreserved
 
 from ORStools import __version__
 from ORStools.utils import exceptions, configmanager, logger
+from .cache import ResponseCache, get_response_cache
+from .metrics import RunMetrics
+from .rate_limiter import RATE_LIMIT_HEADERS, get_rate_limiter, seconds_until_reset
 
 _USER_AGENT = f"ORSQGISClient@v{__version__}"
 
+# Errors which only concern a single request and therefore shouldn't abort a batch
+RECOVERABLE_ERRORS = (exceptions.ApiError, exceptions.InvalidKey, exceptions.GenericServerError)
+
 
 class Client(QObject):
     """Performs requests to the ORS API services.
@@ -74,6 +86,11 @@ class Client(QObject):
         self.base_url = provider["base_url"]
         self.ENV_VARS = provider.get("ENV_VARS")
         self.timeout = provider.get("timeout")
+        self.concurrent_requests = max(1, int(provider.get("concurrent_requests", 1)))
+        # Responses are only cached on disk if the provider opted in
+        self.cache = get_response_cache() if provider.get("cache") else None
+        # Replaced by the metrics of the processing run using the client
+        self.metrics = RunMetrics()
 
         self.headers = {
             "User-Agent": _USER_AGENT,
@@ -112,10 +129,19 @@ class Client(QObject):
         :raises: Various ApiError exceptions based on HTTP status codes
         """
 
-        if post_json is not None:
-            result = blocking_request.post(request, json.dumps(post_json).encode())
-        else:
-            result = blocking_request.get(request)
+        body = json.dumps(post_json).encode() if post_json is not None else None
+        start = time.perf_counter()
+        with self.metrics.timer("network"):
+            if body is not None:
+                result = blocking_request.post(request, body)
+            else:
+                result = blocking_request.get(request)
+        self.metrics.add_request(
+            request.url().path(),
+            time.perf_counter() - start,
+            len(body or b""),
+            blocking_request.reply().content().size(),
+        )
 
         if result != QgsBlockingNetworkRequest.NoError:
             self._check_status(blocking_request.reply())
@@ -154,13 +180,16 @@ class Client(QObject):
         """
         first_request_time = datetime.now()
 
-        authed_url = self._generate_auth_url(url, params)
-        self.url = self.base_url + authed_url
-
-        request = QNetworkRequest(QUrl(self.url))
+        request = self._create_request(url, params)
 
-        for header, value in self.headers.items():
-            request.setRawHeader(header.encode(), value.encode())
+        cache_key = self._get_cache_key(url, params, post_json)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.log(f"url: {self.url}\nResponse taken from cache.", 0)
+                self.metrics.count("cache_hits")
+                return cached
+            self.metrics.count("cache_misses")
 
         blocking_request = QgsBlockingNetworkRequest()
 
@@ -168,12 +197,16 @@ class Client(QObject):
 
         logger.log(f"url: {self.url}\nParameters: {json.dumps(post_json, indent=2)}", 0)
 
+        rate_limiter = get_rate_limiter(self.base_url, url)
         content = None
 
         for i in range(max_retries):
             try:
+                with self.metrics.timer("rate_limit_wait"):
+                    self._sleep(rate_limiter.reserve())
                 reply = self._request(post_json, blocking_request, request)
                 content = reply.content().data().decode()
+                rate_limiter.update(self._get_rate_limit_headers(reply))
                 break
 
             except exceptions.OverQueryLimit as e:
@@ -181,13 +214,14 @@ class Client(QObject):
                     raise exceptions.Timeout()
 
                 logger.log(f"{e.__class__.__name__}: {str(e)}", 1)
+                self.metrics.count("retries")
 
-                delay_seconds = self.get_delay_seconds(i)
+                delay_seconds = self._get_over_query_limit_delay(e, i)
+                rate_limiter.on_over_query_limit(delay_seconds)
                 self.overQueryLimit.emit(delay_seconds)
 
-                loop = QEventLoop()
-                QTimer.singleShot(delay_seconds * 1000, loop.quit)
-                loop.exec()
+                with self.metrics.timer("retry_wait"):
+                    self._sleep(delay_seconds)
 
             except exceptions.ApiError as e:
                 if post_json:
@@ -201,13 +235,252 @@ class Client(QObject):
                 self.settings.setValue("qgis/networkAndProxy/userAgent", self.user_agent)
 
         # Write env variables if successful
+        self._write_env_vars(reply)
+
+        with self.metrics.timer("parse_json"):
+            response = json.loads(content)
+        if cache_key:
+            self.cache.put(cache_key, self.base_url, response)
+
+        return response
+
+    def fetch_concurrently(
+        self,
+        url: str,
+        params: dict,
+        requests: Iterable[Tuple[Any, dict]],
+        max_concurrent: Optional[int] = None,
+        max_retries: int = 100,
+    ) -> Generator[Tuple[Any, Union[dict, Exception]], None, None]:
+        """Fetch many POST requests to the same endpoint with several requests in flight.
+
+        Requests are sent through QgsNetworkAccessManager without blocking, so up to
+        ``max_concurrent`` of them are processed by the server at the same time. Results
+        are yielded in the order of ``requests``. Over query limit errors are retried
+        per request with the same delays as :meth:`fetch_with_retry`.
+
+        Errors concerning a single request (see RECOVERABLE_ERRORS) are yielded in
+        place of the response, so a batch can report them and carry on. All other
+        errors, e.g. a timeout or an unreachable server, are raised.
+
+        :param url: API endpoint path (e.g., "/v2/directions/driving-car/geojson")
+        :type url: str
+        :param params: URL query parameters
+        :type params: dict
+        :param requests: (key, post_json) tuples, the key is handed back with the result.
+            May be a lazy iterable, it is only consumed as fast as requests can be sent.
+        :type requests: iterable
+        :param max_concurrent: Maximum number of requests in flight, defaults to the
+            provider's concurrent_requests setting
+        :type max_concurrent: int or None
+        :param max_retries: Maximum number of retry attempts per request
+        :type max_retries: int
+        :return: Generator of (key, parsed JSON response or exception) tuples
+        :rtype: generator
+        :raises exceptions.Timeout: When the retries of a request exceed the configured timeout
+        """
+        max_concurrent = max(1, max_concurrent or self.concurrent_requests)
+        # Don't let finished responses pile up when a slow request blocks the output order
+        window = max_concurrent * 4
+
+        manager = QgsNetworkAccessManager.instance()
+        rate_limiter = get_rate_limiter(self.base_url, url)
+        loop = QEventLoop()
+
+        pending = iter(enumerate(requests))
+        exhausted = False
+        in_flight = {}  # index -> QNetworkReply, None while waiting for a retry
+        finished = {}  # index -> (key, response or exception)
+        sent = {}  # index -> (endpoint, send time, request size)
+        retries = {}
+        first_request_times = {}  # index -> time of the first attempt
+        fatal = []
+        next_index = 0
+
+        def dispatch(index: int, key: Any, post_json: dict) -> None:
+            first_request_times[index] = datetime.now()
+            wait = rate_limiter.reserve()
+            if wait > 0:
+                # keep the slot reserved until the request is sent, its token is taken already
+                in_flight[index] = None
+                QTimer.singleShot(int(wait * 1000), lambda: resubmit(index, key, post_json))
+            else:
+                submit(index, key, post_json)
+
+        def submit(index: int, key: Any, post_json: dict) -> None:
+            request = self._create_request(url, params)
+            logger.log(f"url: {self.url}\nParameters: {json.dumps(post_json, indent=2)}", 0)
+            body = json.dumps(post_json).encode()
+            sent[index] = (request.url().path(), time.perf_counter(), len(body))
+            reply = manager.post(request, body)
+            in_flight[index] = reply
+            reply.finished.connect(lambda: on_finished(index, key, post_json, reply))
+
+        def resubmit(index: int, key: Any, post_json: dict) -> None:
+            # the batch might have been closed while waiting
+            if index in in_flight and in_flight[index] is None:
+                submit(index, key, post_json)
+
+        def on_finished(index: int, key: Any, post_json: dict, reply: QNetworkReply) -> None:
+            if in_flight.get(index) is not reply:
+                # aborted on shutdown
+                return
+
+            content = QgsNetworkReplyContent(reply)
+            content.setContent(reply.readAll())
+            reply.deleteLater()
+
+            endpoint, start, size = sent.pop(index)
+            self.metrics.add_request(
+                endpoint, time.perf_counter() - start, size, content.content().size()
+            )
+
+            try:
+                if reply.error() != QNetworkReply.NetworkError.NoError:
+                    self._check_status(content)
+                with self.metrics.timer("parse_json"):
+                    result = json.loads(content.content().data().decode())
+                rate_limiter.update(self._get_rate_limit_headers(content))
+                self._write_env_vars(content)
+
+                cache_key = self._get_cache_key(url, params, post_json)
+                if cache_key:
+                    self.cache.put(cache_key, self.base_url, result)
+
+            except exceptions.OverQueryLimit as e:
+                retries[index] = retries.get(index, 0) + 1
+                retry_time = datetime.now() - first_request_times[index]
+                if retries[index] >= max_retries or retry_time > timedelta(seconds=self.timeout):
+                    fatal.append(exceptions.Timeout())
+                    loop.quit()
+                    return
+
+                logger.log(f"{e.__class__.__name__}: {str(e)}", 1)
+                self.metrics.count("retries")
+
+                delay_seconds = self._get_over_query_limit_delay(e, retries[index] - 1)
+                rate_limiter.on_over_query_limit(delay_seconds)
+                self.overQueryLimit.emit(delay_seconds)
+
+                # keep the slot reserved until the retry is sent
+                in_flight[index] = None
+                QTimer.singleShot(delay_seconds * 1000, lambda: resubmit(index, key, post_json))
+                return
+
+            except RECOVERABLE_ERRORS as e:
+                logger.log(
+                    f"Feature ID {post_json.get('id')} caused a {e.__class__.__name__}: {str(e)}", 2
+                )
+                result = e
+
+            except Exception as e:
+                fatal.append(e)
+                result = e
+
+            del in_flight[index]
+            first_request_times.pop(index, None)
+            retries.pop(index, None)
+            finished[index] = (key, result)
+            loop.quit()
+
+        try:
+            while True:
+                if fatal:
+                    raise fatal[0]
+
+                while (
+                    not exhausted
+                    and len(in_flight) < max_concurrent
+                    and len(in_flight) + len(finished) < window
+                ):
+                    try:
+                        index, (key, post_json) = next(pending)
+                    except StopIteration:
+                        exhausted = True
+                        break
+
+                    cache_key = self._get_cache_key(url, params, post_json)
+                    cached = self.cache.get(cache_key) if cache_key else None
+                    if cached is not None:
+                        self.metrics.count("cache_hits")
+                        finished[index] = (key, cached)
+                    else:
+                        if cache_key:
+                            self.metrics.count("cache_misses")
+                        dispatch(index, key, post_json)
+
+                if next_index in finished:
+                    yield finished.pop(next_index)
+                    next_index += 1
+                    continue
+
+                if exhausted and not in_flight:
+                    break
+
+                # the parsing of the received responses is timed as parse_json
+                with self.metrics.timer("network"):
+                    loop.exec()
+
+        finally:
+            replies = [reply for reply in in_flight.values() if reply is not None]
+            in_flight.clear()
+            for reply in replies:
+                reply.abort()
+                reply.deleteLater()
+
+            # Reset to old value
+            self.settings.setValue("qgis/networkAndProxy/userAgent", self.user_agent)
+
+    def _create_request(self, url: str, params: dict) -> QNetworkRequest:
+        """Build an authenticated network request for an API endpoint.
+
+        :param url: API endpoint path
+        :type url: str
+        :param params: URL query parameters
+        :type params: dict
+        :return: Network request with URL and headers set
+        :rtype: QNetworkRequest
+        """
+        authed_url = self._generate_auth_url(url, params)
+        self.url = self.base_url + authed_url
+
+        request = QNetworkRequest(QUrl(self.url))
+
+        for header, value in self.headers.items():
+            request.setRawHeader(header.encode(), value.encode())
+
+        return request
+
+    def _get_cache_key(self, url: str, params: dict, post_json: Optional[dict]) -> Optional[str]:
+        """Cache key of a request, None if caching is disabled for this provider.
+
+        :param url: API endpoint path
+        :type url: str
+        :param params: URL query parameters
+        :type params: dict
+        :param post_json: JSON payload for POST requests
+        :type post_json: dict or None
+        :return: Cache key or None
+        :rtype: str or None
+        """
+        if self.cache is None:
+            return None
+
+        return ResponseCache.make_key(
+            self.base_url, self._generate_auth_url(url, params), post_json
+        )
+
+    def _write_env_vars(self, reply: QgsNetworkReplyContent) -> None:
+        """Write the quota headers of a successful reply to the environment.
+
+        :param reply: Network reply content of a successful request
+        :type reply: QgsNetworkReplyContent
+        """
         if self.ENV_VARS:
             for env_var in self.ENV_VARS:
                 header_value = reply.rawHeader(self.ENV_VARS[env_var].encode()).data().decode()
                 configmanager.write_env_var(env_var, header_value)
 
-        return json.loads(content)
-
     def get_delay_seconds(self, retry_counter: int) -> int:
         """Calculate delay before next retry attempt.
 
@@ -230,6 +503,58 @@ class Client(QObject):
         logger.log(f"Retry Counter: {retry_counter}, Delay: {delay_seconds:.2f}s", 1)
         return int(delay_seconds)
 
+    def _get_over_query_limit_delay(
+        self, error: exceptions.OverQueryLimit, retry_counter: int
+    ) -> int:
+        """Delay before retrying a request which exceeded the quota.
+
+        The server's Retry-After or quota reset time is used if it sent one,
+        otherwise the backoff of :meth:`get_delay_seconds`.
+
+        :param error: The over query limit error of the request
+        :type error: exceptions.OverQueryLimit
+        :param retry_counter: Zero-based retry attempt number
+        :type retry_counter: int
+        :return: Delay in seconds before next retry
+        :rtype: int
+        """
+        if error.retry_after is not None:
+            logger.log(f"Retry Counter: {retry_counter}, Delay: {error.retry_after:.2f}s", 1)
+            return int(error.retry_after) + 1
+        return self.get_delay_seconds(retry_counter)
+
+    @staticmethod
+    def _get_rate_limit_headers(reply: QgsNetworkReplyContent) -> Dict[str, Optional[float]]:
+        """Parse the quota headers of a reply.
+
+        :param reply: Network reply to read the headers from
+        :type reply: QgsNetworkReplyContent
+        :return: Values of RATE_LIMIT_HEADERS, None for missing or invalid headers
+        :rtype: dict
+        """
+        headers = dict()
+        for name, header in RATE_LIMIT_HEADERS.items():
+            try:
+                headers[name] = float(reply.rawHeader(header.encode()).data().decode())
+            except (TypeError, ValueError, AttributeError):
+                headers[name] = None
+
+        return headers
+
+    @staticmethod
+    def _sleep(seconds: float) -> None:
+        """Wait without blocking the event loop.
+
+        :param seconds: Seconds to wait
+        :type seconds: float
+        """
+        if seconds <= 0:
+            return
+
+        loop = QEventLoop()
+        QTimer.singleShot(int(seconds * 1000), loop.quit)
+        loop.exec()
+
     def _check_status(self, reply: QNetworkReply) -> None:
         """Check HTTP response status and raise appropriate exceptions.
 
@@ -252,7 +577,11 @@ class Client(QObject):
         elif status_code == 403:
             raise exceptions.InvalidKey(str(status_code), message)
         elif status_code == 429:
-            raise exceptions.OverQueryLimit(str(status_code), message)
+            headers = self._get_rate_limit_headers(reply)
+            retry_after = headers["retry_after"]
+            if retry_after is None and headers["remaining"] == 0 and headers["reset"]:
+                retry_after = seconds_until_reset(headers["reset"])
+            raise exceptions.OverQueryLimit(str(status_code), message, retry_after)
         # Internal error message for Bad Request
         elif 400 <= status_code < 500:
             raise exceptions.ApiError(str(status_code), message)
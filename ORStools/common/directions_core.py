@@ -28,18 +28,25 @@
 """
 
 from itertools import product
-from qgis.core import QgsPoint, QgsPointXY, QgsGeometry, QgsFeature, QgsFields, QgsField
-from typing import List, Generator, Tuple, Any, Optional
+from qgis.core import QgsPointXY, QgsFeature, QgsFields, QgsField
+from typing import List, Generator, Tuple, Any, Optional, Callable, Iterator
 
 from qgis.PyQt.QtCore import QMetaType
 
-from ORStools.utils import convert, logger
+from ORStools.utils import convert, geometry, logger
+from ORStools.utils.spatial import group_by_location, haversine
 from ORStools.utils.wrapper import create_qgs_field
 
 
-def get_request_point_features(route_dict: dict, row_by_row: str) -> Generator[List, Tuple, None]:
+def get_request_point_features(
+    route_dict: dict,
+    row_by_row: str,
+    nearest: Optional[List[List[int]]] = None,
+    pair_filter: Optional[Callable[[int, int], bool]] = None,
+) -> Generator[List, Tuple, None]:
     """
-    Processes input point features depending on the layer to layer relation in directions settings
+    Processes input point features depending on the layer to layer relation in directions settings.
+    Pairs are generated lazily, so memory doesn't grow with the number of routes.
 
     :param route_dict: all coordinates and ID field values of start and end point layers
     :type route_dict: dict
@@ -47,32 +54,209 @@ def get_request_point_features(route_dict: dict, row_by_row: str) -> Generator[L
     :param row_by_row: Specifies whether row-by-row relation or all-by-all has been used.
     :type row_by_row: str
 
+    :param nearest: in all-by-all mode, only route from each start point to the end points
+        with these indices, e.g. from spatial.get_nearest
+    :type nearest: list
+
+    :param pair_filter: called with the start and end index of each pair, pairs are skipped
+        if it returns False. See get_pair_filter.
+    :type pair_filter: callable
+
     :returns: tuple of coordinates and ID field value for each routing feature in route_dict
     :rtype: tuple
     """
+    start, end = route_dict["start"], route_dict["end"]
+
+    for i, j in _get_valid_pair_indices(route_dict, row_by_row, nearest, pair_filter):
+        coordinates = [
+            [round(x, 6), round(y, 6)] for x, y in (start["geometries"][i], end["geometries"][j])
+        ]
+        values = (start["values"][i], end["values"][j])
+
+        yield coordinates, values
+
+
+def get_unique_request_point_features(
+    route_dict: dict,
+    row_by_row: str,
+    nearest: Optional[List[List[int]]] = None,
+    pair_filter: Optional[Callable[[int, int], bool]] = None,
+) -> Generator[Tuple[List, List[Tuple]], None, None]:
+    """
+    Like get_request_point_features, but pairs of co-located start and end points, i.e. with
+    the same coordinates after rounding, are yielded once with the ID field values of all of
+    them. The route of such a pair only has to be requested once.
 
-    locations_list = list(
-        product(route_dict["start"]["geometries"], route_dict["end"]["geometries"])
+    :returns: tuple of coordinates and the ID field values of all pairs with these coordinates
+    :rtype: tuple
+    """
+    start, end = route_dict["start"], route_dict["end"]
+
+    if row_by_row == "Row-by-Row" or nearest is not None:
+        pairs = dict()
+        for coordinates, values in get_request_point_features(
+            route_dict, row_by_row, nearest, pair_filter
+        ):
+            pairs.setdefault(tuple(map(tuple, coordinates)), []).append(values)
+
+        for coordinates, values in pairs.items():
+            yield [list(location) for location in coordinates], values
+        return
+
+    # all-by-all: pair the unique locations instead of collecting all pairs
+    start_groups = group_by_location(
+        ((point.x(), point.y()), i) for i, point in enumerate(start["geometries"])
+    )
+    end_groups = group_by_location(
+        ((point.x(), point.y()), j) for j, point in enumerate(end["geometries"])
     )
-    values_list = list(product(route_dict["start"]["values"], route_dict["end"]["values"]))
+    for start_location, start_indices in start_groups.items():
+        for end_location, end_indices in end_groups.items():
+            # Skip if first and last location are the same
+            if start_location == end_location:
+                continue
+            values = [
+                (start["values"][i], end["values"][j])
+                for i in start_indices
+                for j in end_indices
+                if not pair_filter or pair_filter(i, j)
+            ]
+            if values:
+                yield [list(start_location), list(end_location)], values
+
+
+def count_request_point_features(
+    route_dict: dict,
+    row_by_row: str,
+    nearest: Optional[List[List[int]]] = None,
+    pair_filter: Optional[Callable[[int, int], bool]] = None,
+) -> int:
+    """
+    Counts the routes get_request_point_features will yield with the same arguments,
+    without generating them.
+
+    :returns: number of routes
+    :rtype: int
+    """
+    return sum(1 for _ in _get_valid_pair_indices(route_dict, row_by_row, nearest, pair_filter))
+
+
+def get_pair_filter(
+    route_dict: dict,
+    row_by_row: str,
+    nearest: Optional[List[List[int]]] = None,
+    max_distance: Optional[float] = None,
+    exclude_same_id: bool = False,
+    skip_reverse: bool = False,
+) -> Optional[Callable[[int, int], bool]]:
+    """
+    Builds a filter for the start and end index pairs of get_request_point_features.
+
+    :param route_dict: all coordinates and ID field values of start and end point layers
+    :type route_dict: dict
+
+    :param row_by_row: Specifies whether row-by-row relation or all-by-all has been used.
+    :type row_by_row: str
+
+    :param nearest: end point indices per start point, if only these are routed
+    :type nearest: list
+
+    :param max_distance: skip pairs further apart than this straight-line distance in meters
+    :type max_distance: float
+
+    :param exclude_same_id: skip pairs whose start and end ID field values are equal
+    :type exclude_same_id: bool
+
+    :param skip_reverse: of two pairs with swapped ID field values, only keep the one whose
+        start value sorts first, e.g. if start and end layer are the same
+    :type skip_reverse: bool
+
+    :returns: filter returning True for pairs to keep, None if nothing is filtered
+    :rtype: callable
+    """
+    if not (max_distance or exclude_same_id or skip_reverse):
+        return None
+
+    start, end = route_dict["start"], route_dict["end"]
+
+    if skip_reverse:
+        if row_by_row == "Row-by-Row" or nearest is not None:
+            requested = {
+                (str(start["values"][i]), str(end["values"][j]))
+                for i, j in _get_pair_indices(route_dict, row_by_row, nearest)
+            }
+
+            def has_reverse(a: str, b: str) -> bool:
+                return (b, a) in requested
+        else:
+            # all-by-all contains the reverse of every pair with values of both layers
+            start_values = set(map(str, start["values"]))
+            end_values = set(map(str, end["values"]))
+
+            def has_reverse(a: str, b: str) -> bool:
+                return b in start_values and a in end_values
+
+    def pair_filter(i: int, j: int) -> bool:
+        start_value, end_value = start["values"][i], end["values"][j]
+        if exclude_same_id and start_value == end_value:
+            return False
+
+        if max_distance:
+            start_point, end_point = start["geometries"][i], end["geometries"][j]
+            distance = haversine(start_point.x(), start_point.y(), end_point.x(), end_point.y())
+            if distance > max_distance:
+                return False
+
+        if skip_reverse:
+            a, b = str(start_value), str(end_value)
+            if b < a and has_reverse(a, b):
+                return False
+
+        return True
+
+    return pair_filter
+
+
+def _get_pair_indices(
+    route_dict: dict, row_by_row: str, nearest: Optional[List[List[int]]] = None
+) -> Iterator[Tuple[int, int]]:
+    """Lazily generates the start and end index of all pairs of a layer relation."""
+    start_amount = len(route_dict["start"]["geometries"])
+    end_amount = len(route_dict["end"]["geometries"])
 
     # If row-by-row in two-layer mode, then only zip the locations
     if row_by_row == "Row-by-Row":
-        locations_list = list(
-            zip(route_dict["start"]["geometries"], route_dict["end"]["geometries"])
-        )
+        return ((i, i) for i in range(min(start_amount, end_amount)))
 
-        values_list = list(zip(route_dict["start"]["values"], route_dict["end"]["values"]))
+    if nearest is not None:
+        return ((i, j) for i, destinations in enumerate(nearest) for j in destinations)
 
-    for properties in zip(locations_list, values_list):
-        # Skip if first and last location are the same
-        if properties[0][0] == properties[0][-1]:
-            continue
+    return product(range(start_amount), range(end_amount))
 
-        coordinates = [[round(x, 6), round(y, 6)] for x, y in properties[0]]
-        values = properties[1]
 
-        yield coordinates, values
+def _get_valid_pair_indices(
+    route_dict: dict,
+    row_by_row: str,
+    nearest: Optional[List[List[int]]] = None,
+    pair_filter: Optional[Callable[[int, int], bool]] = None,
+) -> Generator[Tuple[int, int], None, None]:
+    """Generates the pairs to be routed, i.e. the ones that pass the filter and don't start
+    and end at the same location."""
+    for i, j in _get_pair_indices(route_dict, row_by_row, nearest):
+        if _is_valid_pair(route_dict, i, j, pair_filter):
+            yield i, j
+
+
+def _is_valid_pair(
+    route_dict: dict, i: int, j: int, pair_filter: Optional[Callable[[int, int], bool]] = None
+) -> bool:
+    """Whether a pair passes the filter and doesn't start and end at the same location."""
+    # Skip if first and last location are the same, once rounded like the request
+    start, end = route_dict["start"]["geometries"][i], route_dict["end"]["geometries"][j]
+    if (round(start.x(), 6), round(start.y(), 6)) == (round(end.x(), 6), round(end.y(), 6)):
+        return False
+
+    return not pair_filter or pair_filter(i, j)
 
 
 def get_fields(
@@ -83,6 +267,7 @@ def get_fields(
     line: bool = False,
     extra_info: list = [],
     two_layers: bool = False,
+    merge_runs: bool = False,
 ) -> QgsField:
     """
     Builds output fields for directions response layer.
@@ -102,6 +287,9 @@ def get_fields(
     :param line: Specifies whether the output feature is a line or a point
     :type line: boolean
 
+    :param merge_runs: Adds the length field of merged extra info runs
+    :type merge_runs: boolean
+
     :returns: fields object to set attributes of output layer
     :rtype: QgsFields
     """
@@ -123,6 +311,8 @@ def get_fields(
         if info in ["waytype", "surface", "waycategory", "roadaccessrestrictions", "steepness"]:
             field_type = QMetaType.Type.QString
         fields.append(create_qgs_field(info.upper(), field_type))
+    if extra_info and merge_runs:
+        fields.append(create_qgs_field("LENGTH_KM", QMetaType.Type.Double))
 
     return fields
 
@@ -164,8 +354,7 @@ def get_output_feature_directions(
     coordinates = response_mini["geometry"]["coordinates"]
     distance = response_mini["properties"]["summary"]["distance"]
     duration = response_mini["properties"]["summary"]["duration"]
-    qgis_coords = [QgsPoint(x, y, z) for x, y, z in coordinates]
-    feat.setGeometry(QgsGeometry.fromPolyline(qgis_coords))
+    feat.setGeometry(geometry.line_from_coordinates(coordinates))
     feat.setAttributes(
         [
             f"{distance / 1000:.3f}",
@@ -205,8 +394,7 @@ def get_output_features_optimization(
     polyline = response_mini["geometry"]
     distance = response_mini["distance"]
     duration = response_mini["cost"]
-    qgis_coords = [QgsPointXY(x, y) for x, y in convert.decode_polyline(polyline)]
-    feat.setGeometry(QgsGeometry.fromPolylineXY(qgis_coords))
+    feat.setGeometry(geometry.from_wkb(convert.polylines_to_wkb([polyline])[0]))
     feat.setAttributes(
         [
             f"{distance / 1000:.3f}",
@@ -265,8 +453,30 @@ def build_default_parameters(
 
 
 def get_extra_info_features_directions(
-    response: dict, extra_info_order: List[str], to_from_values: Optional[list] = None
+    response: dict,
+    extra_info_order: List[str],
+    to_from_values: Optional[list] = None,
+    merge_runs: bool = False,
 ):
+    """
+    Build output features of the extra info of a route, by default one per route segment.
+
+    :param response: API response object
+    :type response: dict
+
+    :param extra_info_order: requested extra infos, in the order of the output fields
+    :type extra_info_order: list of str
+
+    :param to_from_values: ID values of start and end point, for directions from two point layers
+    :type to_from_values: list
+
+    :param merge_runs: build one feature per run of consecutive segments whose extra info values
+        are all identical, with its length in km as last attribute
+    :type merge_runs: bool
+
+    :returns: output features
+    :rtype: list of QgsFeature
+    """
     extra_info_order = [
         key if key != "waytype" else "waytypes" for key in extra_info_order
     ]  # inconsistency in API
@@ -274,32 +484,80 @@ def get_extra_info_features_directions(
     coordinates = response_mini["geometry"]["coordinates"]
     feats = list()
     extra_info = response_mini["properties"]["extras"]
-    extras_list = {i: [] for i in extra_info_order}
+
+    # decode every run of an extra info once instead of per segment
+    runs = dict()
     for key in extra_info_order:
         try:
             values = extra_info[key]["values"]
         except KeyError:
             logger.log(f"{key} is not available as extra_info.")
-            continue
-        for val in values:
-            for i in range(val[0], val[1]):
-                value = convert.decode_extrainfo(key, val[2])
-                extras_list[key].append(value)
+            values = []
+        decoded = convert.decode_extrainfo_values(key, [value for _, _, value in values])
+        runs[key] = [(start, end, value) for (start, end, _), value in zip(values, decoded)]
+
+    segments = _get_extra_info_segments(runs.values(), len(coordinates), merge_runs)
+    extras_list = {key: _get_segment_values(runs[key], segments) for key in extra_info_order}
 
-    for i in range(len(coordinates) - 1):
+    for i, (start, end) in enumerate(segments):
         feat = QgsFeature()
-        qgis_coords = [QgsPoint(x, y, z) for x, y, z in coordinates[i : i + 2]]
-        feat.setGeometry(QgsGeometry.fromPolyline(qgis_coords))
-        attrs = list()
-        for j in extras_list:
-            extra = extras_list[j]
-            attr = extra[i]
-            attrs.append(attr)
+        feat.setGeometry(geometry.line_from_coordinates(coordinates[start : end + 1]))
+        attrs = [extras_list[key][i] for key in extra_info_order]
 
         if to_from_values:  # for directions from two point layers
             attrs = [to_from_values[0], to_from_values[1]] + attrs
+        if merge_runs:
+            length = sum(
+                haversine(*a[:2], *b[:2])
+                for a, b in zip(coordinates[start:end], coordinates[start + 1 : end + 1])
+            )
+            attrs.append(round(length / 1000, 3))
         feat.setAttributes(attrs)
 
         feats.append(feat)
 
     return feats
+
+
+def _get_extra_info_segments(
+    runs: Iterator[List[Tuple[int, int, Any]]], coordinates_amount: int, merge_runs: bool
+) -> List[Tuple[int, int]]:
+    """
+    Start and end vertex index of the output features of a route's extra info.
+
+    :param runs: decoded [start, end, value] runs of every extra info
+    :param coordinates_amount: number of route vertices
+    :param merge_runs: split the route only where the value of any extra info changes
+    """
+    if not merge_runs:
+        return [(i, i + 1) for i in range(coordinates_amount - 1)]
+
+    boundaries = {0, coordinates_amount - 1}
+    for key_runs in runs:
+        for start, end, _ in key_runs:
+            boundaries.update((start, end))
+    boundaries = sorted(b for b in boundaries if 0 <= b < coordinates_amount)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _get_segment_values(
+    key_runs: List[Tuple[int, int, Any]], segments: List[Tuple[int, int]]
+) -> List[Any]:
+    """
+    Value of an extra info for each of the ascending segments, None where the route has none.
+
+    :param key_runs: decoded [start, end, value] runs of the extra info, ascending
+    :param segments: start and end vertex index of the output features
+    """
+    values = []
+    run = 0
+    for start, _ in segments:
+        while run < len(key_runs) and key_runs[run][1] <= start:
+            run += 1
+        if run < len(key_runs) and key_runs[run][0] <= start:
+            values.append(key_runs[run][2])
+        else:
+            values.append(None)
+
+    return values
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ ORStools
+                                 A QGIS plugin
+ QGIS client to query openrouteservice
+                              -------------------
+        begin                : 2017-02-01
+        git sha              : $Format:%H$
+        copyright            : (C) 2021 by HeiGIT gGmbH
+        email                : support@openrouteservice.heigit.org
+ ***************************************************************************/
+
+ This plugin provides access to openrouteservice API functionalities
+ (https://openrouteservice.org), developed and
+ maintained by the openrouteservice team of HeiGIT gGmbH, Germany. By using
+ this plugin you agree to the ORS terms of service
+ (https://openrouteservice.org/terms-of-service/).
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from typing import Dict, List, Optional, Set, Tuple
+
+# [[x_min, y_min], [x_max, y_max]] of a tile in WGS84
+Tile = List[List[float]]
+
+# from ID, to ID, weight, from location and to location of an edge
+Edge = Tuple[int, int, float, List[float], List[float]]
+
+
+class NetworkMerger:
+    """Merges the exported networks of the tiles of an extent.
+
+    Each node is returned once by its ID, each edge once by its nodes. Nodes on or beyond
+    a tile's border can be exported with several tiles, so can the edges between them or
+    leading to them. Only the locations of border nodes are kept to look up nodes a tile
+    references but doesn't contain.
+    """
+
+    def __init__(self) -> None:
+        self.node_ids: Set[int] = set()
+        self.border_nodes: Dict[int, List[float]] = dict()
+        self.edge_keys: Set[Tuple[int, int]] = set()
+        # edges with a node that was not exported (yet), with the locations known so far
+        self.pending_edges: List[
+            Tuple[int, int, float, Optional[List[float]], Optional[List[float]]]
+        ] = list()
+
+    def add_tile(
+        self, tile: Tile, response: dict
+    ) -> Tuple[List[Tuple[int, List[float]]], List[Edge]]:
+        """
+        Adds the export response of a tile.
+
+        :param tile: extent of the tile
+        :type tile: list
+
+        :param response: export response with nodes and edges
+        :type response: dict
+
+        :returns: (node ID, location) of the nodes and the edges not returned before
+        :rtype: tuple
+        """
+        (x_min, y_min), (x_max, y_max) = tile
+
+        def inside(location: List[float]) -> bool:
+            return x_min < location[0] < x_max and y_min < location[1] < y_max
+
+        locations = dict()
+        nodes = []
+        for node in response["nodes"]:
+            node_id, location = node["nodeId"], node["location"]
+            locations[node_id] = location
+            if not inside(location):
+                self.border_nodes[node_id] = location
+            if node_id not in self.node_ids:
+                self.node_ids.add(node_id)
+                nodes.append((node_id, location))
+
+        candidates = self.pending_edges + [
+            (edge["fromId"], edge["toId"], edge["weight"], None, None) for edge in response["edges"]
+        ]
+        self.pending_edges = []
+        edges = []
+        for from_id, to_id, weight, from_location, to_location in candidates:
+            from_location = (
+                from_location or locations.get(from_id) or self.border_nodes.get(from_id)
+            )
+            to_location = to_location or locations.get(to_id) or self.border_nodes.get(to_id)
+            if from_location is None or to_location is None:
+                self.pending_edges.append((from_id, to_id, weight, from_location, to_location))
+                continue
+
+            if (from_id, to_id) in self.edge_keys:
+                continue
+            self.edge_keys.add((from_id, to_id))
+
+            edges.append((from_id, to_id, weight, from_location, to_location))
+
+        return nodes, edges
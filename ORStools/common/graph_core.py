@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ ORStools
+                                 A QGIS plugin
+ QGIS client to query openrouteservice
+                              -------------------
+        begin                : 2017-02-01
+        git sha              : $Format:%H$
+        copyright            : (C) 2021 by HeiGIT gGmbH
+        email                : support@openrouteservice.heigit.org
+ ***************************************************************************/
+
+ This plugin provides access to openrouteservice API functionalities
+ (https://openrouteservice.org), developed and
+ maintained by the openrouteservice team of HeiGIT gGmbH, Germany. By using
+ this plugin you agree to the ORS terms of service
+ (https://openrouteservice.org/terms-of-service/).
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from heapq import heappop, heappush
+from math import cos, inf, radians
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Arrays of a graph file
+GRAPH_ARRAYS = ["node_ids", "coordinates", "offsets", "targets", "weights"]
+
+
+class Graph:
+    """
+    Directed network in compressed sparse row (CSR) form, e.g. from the network export.
+
+    Nodes are indexed 0 to n - 1. The edges leaving node i are targets[offsets[i]:offsets[i + 1]]
+    with their weights. node_ids holds the IDs of the nodes in the exported network and
+    coordinates their WGS84 [lon, lat] locations.
+
+    Graph files are NumPy archives (.npz) with these five arrays.
+    """
+
+    def __init__(
+        self,
+        node_ids: "np.ndarray",
+        coordinates: "np.ndarray",
+        offsets: "np.ndarray",
+        targets: "np.ndarray",
+        weights: "np.ndarray",
+    ) -> None:
+        """
+        :raises ImportError: if NumPy is not available
+        """
+        if np is None:
+            raise ImportError("Graph files require NumPy.")
+
+        self.node_ids = node_ids
+        self.coordinates = coordinates
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        # plain lists are a lot faster to index in the search loops than arrays
+        self._forward = (offsets.tolist(), targets.tolist(), weights.tolist())
+        self._backward = None
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    @classmethod
+    def from_network(
+        cls,
+        nodes: Iterable[Tuple[int, List[float]]],
+        edges: Iterable[Tuple[int, int, float]],
+    ) -> "Graph":
+        """
+        Builds a graph from the exported nodes and edges.
+
+        :param nodes: (node ID, location) of every node
+        :type nodes: list
+
+        :param edges: (from ID, to ID, weight) of every edge
+        :type edges: list
+
+        :raises ImportError: if NumPy is not available
+        :raises ValueError: if an edge references a node that is not in nodes
+
+        :rtype: Graph
+        """
+        if np is None:
+            raise ImportError("Graph files require NumPy.")
+
+        nodes = list(nodes)
+        edges = list(edges)
+        node_ids = np.array([node_id for node_id, _ in nodes], dtype=np.int64)
+        coordinates = np.array([location[:2] for _, location in nodes], dtype=float).reshape(-1, 2)
+        from_ids = np.array([edge[0] for edge in edges], dtype=np.int64)
+        to_ids = np.array([edge[1] for edge in edges], dtype=np.int64)
+        weights = np.array([edge[2] for edge in edges], dtype=np.float32)
+
+        order = np.argsort(node_ids)
+        sorted_ids = node_ids[order]
+
+        def get_index(ids: "np.ndarray") -> "np.ndarray":
+            positions = np.minimum(np.searchsorted(sorted_ids, ids), max(len(sorted_ids) - 1, 0))
+            if len(ids) and (not len(sorted_ids) or np.any(sorted_ids[positions] != ids)):
+                raise ValueError("The edges reference nodes which are not in the network.")
+            return order[positions]
+
+        sources = get_index(from_ids)
+        targets = get_index(to_ids).astype(np.int32)
+
+        edge_order = np.argsort(sources, kind="stable")
+        offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(nodes)), out=offsets[1:])
+
+        return cls(node_ids, coordinates, offsets, targets[edge_order], weights[edge_order])
+
+    @classmethod
+    def load(cls, path: str) -> "Graph":
+        """
+        Reads a graph file.
+
+        :param path: path of the .npz file
+        :type path: str
+
+        :raises ImportError: if NumPy is not available
+        :raises OSError: if the file can't be read
+        :raises ValueError: if the file is not a graph file
+
+        :rtype: Graph
+        """
+        if np is None:
+            raise ImportError("Graph files require NumPy.")
+
+        with np.load(path) as arrays:
+            missing = [name for name in GRAPH_ARRAYS if name not in arrays.files]
+            if missing:
+                raise ValueError(f"{path} is not a graph file, it misses {', '.join(missing)}.")
+            return cls(*(arrays[name] for name in GRAPH_ARRAYS))
+
+    def save(self, path: str) -> None:
+        """
+        Writes the graph to a compressed NumPy archive.
+
+        :param path: path of the .npz file
+        :type path: str
+        """
+        np.savez_compressed(
+            path,
+            node_ids=self.node_ids,
+            coordinates=self.coordinates,
+            offsets=self.offsets,
+            targets=self.targets,
+            weights=self.weights,
+        )
+
+    def nearest_node(self, x: float, y: float) -> int:
+        """
+        Returns the index of the node closest to a WGS84 location.
+
+        :param x: longitude
+        :type x: float
+
+        :param y: latitude
+        :type y: float
+
+        :rtype: int
+        """
+        dx = (self.coordinates[:, 0] - x) * cos(radians(y))
+        dy = self.coordinates[:, 1] - y
+        return int(np.argmin(dx * dx + dy * dy))
+
+    def _adjacency(self, backward: bool = False) -> Tuple[List[int], List[int], List[float]]:
+        """Returns offsets, targets and weights of the edges leaving, or entering, the nodes."""
+        if not backward:
+            return self._forward
+
+        if self._backward is None:
+            sources = np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.offsets))
+            edge_order = np.argsort(self.targets, kind="stable")
+            offsets = np.zeros(len(self) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.targets, minlength=len(self)), out=offsets[1:])
+            self._backward = (
+                offsets.tolist(),
+                sources[edge_order].tolist(),
+                self.weights[edge_order].tolist(),
+            )
+        return self._backward
+
+    def cost_tree(
+        self,
+        source: int,
+        max_cost: Optional[float] = None,
+        targets: Optional[Iterable[int]] = None,
+    ) -> Tuple[Dict[int, float], Dict[int, int]]:
+        """
+        Runs Dijkstra's algorithm from a node, the one-to-many search of the graph.
+
+        :param source: index of the start node
+        :type source: int
+
+        :param max_cost: stops at nodes more expensive to reach, unlimited if None
+        :type max_cost: float
+
+        :param targets: stops once all of these node indices are reached
+        :type targets: list
+
+        :returns: cost and predecessor of every reached node
+        :rtype: tuple
+        """
+        offsets, edge_targets, weights = self._adjacency()
+        max_cost = inf if max_cost is None else max_cost
+        remaining: Optional[Set[int]] = set(targets) if targets is not None else None
+
+        costs = {source: 0.0}
+        predecessors = {}
+        settled = set()
+        heap = [(0.0, source)]
+        while heap:
+            cost, node = heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            if remaining is not None:
+                remaining.discard(node)
+                if not remaining:
+                    break
+
+            for k in range(offsets[node], offsets[node + 1]):
+                neighbour = edge_targets[k]
+                new_cost = cost + weights[k]
+                if new_cost <= max_cost and new_cost < costs.get(neighbour, inf):
+                    costs[neighbour] = new_cost
+                    predecessors[neighbour] = node
+                    heappush(heap, (new_cost, neighbour))
+
+        # nodes reached but not settled yet may still get cheaper
+        costs = {node: costs[node] for node in settled}
+        return costs, {node: predecessors[node] for node in settled if node != source}
+
+    def shortest_path(self, source: int, target: int) -> Tuple[Optional[float], List[int]]:
+        """
+        Runs a bidirectional Dijkstra search between two nodes, which settles a lot fewer
+        nodes than a search from the source only.
+
+        :param source: index of the start node
+        :type source: int
+
+        :param target: index of the end node
+        :type target: int
+
+        :returns: cost and node indices of the shortest path, (None, []) if the target
+            can't be reached
+        :rtype: tuple
+        """
+        if source == target:
+            return 0.0, [source]
+
+        adjacency = (self._adjacency(), self._adjacency(backward=True))
+        costs = ({source: 0.0}, {target: 0.0})
+        predecessors = ({}, {})
+        settled = (set(), set())
+        heaps = ([(0.0, source)], [(0.0, target)])
+
+        best, meeting = inf, None
+        while heaps[0] and heaps[1]:
+            # no path through unsettled nodes can be cheaper than the best one found
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+
+            # expand the smaller of the forward and backward search
+            side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+            cost, node = heappop(heaps[side])
+            if node in settled[side]:
+                continue
+            settled[side].add(node)
+
+            offsets, edge_targets, weights = adjacency[side]
+            other_costs = costs[1 - side]
+            for k in range(offsets[node], offsets[node + 1]):
+                neighbour = edge_targets[k]
+                new_cost = cost + weights[k]
+                if new_cost < costs[side].get(neighbour, inf):
+                    costs[side][neighbour] = new_cost
+                    predecessors[side][neighbour] = node
+                    heappush(heaps[side], (new_cost, neighbour))
+                if neighbour in other_costs and new_cost + other_costs[neighbour] < best:
+                    best = new_cost + other_costs[neighbour]
+                    meeting = neighbour
+
+        if meeting is None:
+            return None, []
+
+        forward = self.get_path(predecessors[0], meeting)
+        backward = self.get_path(predecessors[1], meeting)
+        return best, forward + backward[::-1][1:]
+
+    @staticmethod
+    def get_path(predecessors: Dict[int, int], node: int) -> List[int]:
+        """
+        Follows the predecessors of a cost tree back from a node.
+
+        :param predecessors: predecessor of every reached node, see cost_tree
+        :type predecessors: dict
+
+        :param node: index of the last node of the path
+        :type node: int
+
+        :returns: node indices from the start of the tree to node
+        :rtype: list
+        """
+        path = [node]
+        while path[-1] in predecessors:
+            path.append(predecessors[path[-1]])
+        return path[::-1]
@@ -27,14 +27,12 @@
  ***************************************************************************/
 """
 
-from typing import Any, Generator
+from typing import Any, Generator, Optional
 
 from qgis.core import (
     QgsMapLayer,
-    QgsPointXY,
     QgsFeature,
     QgsFields,
-    QgsGeometry,
     QgsStyle,
     QgsSymbol,
     QgsSimpleFillSymbolLayer,
@@ -45,6 +43,7 @@ from qgis.core import (
 from qgis.PyQt.QtCore import QMetaType
 from qgis.PyQt.QtGui import QColor
 
+from ORStools.utils import geometry
 from ORStools.utils.wrapper import create_qgs_field
 
 # import processing
@@ -118,7 +117,7 @@ class Isochrones:
         return fields
 
     def get_features(
-        self, response: dict, id_field_value: Any
+        self, response: dict, id_field_value: Any, id_field_values: Optional[list] = None
     ) -> Generator[QgsFeature, None, None]:
         """
         Generator to return output isochrone features from response.
@@ -129,6 +128,13 @@ class Isochrones:
         :param id_field_value: Value of ID field.
         :type id_field_value: any
 
+        :param id_field_values: ID field values of all locations of a multi-location request,
+            in the order of the requested locations. Looked up by the group_index of each
+            isochrone and takes precedence over id_field_value. If a location is shared by
+            several features, its entry is the list of their values and the isochrone is
+            yielded for each of them.
+        :type id_field_values: list
+
         :returns: output feature
         :rtype: QgsFeature
         """
@@ -138,25 +144,30 @@ class Isochrones:
         for isochrone in sorted(
             response["features"], key=lambda x: x["properties"]["value"], reverse=True
         ):
-            feat = QgsFeature()
             coordinates = isochrone["geometry"]["coordinates"]
             iso_value = isochrone["properties"]["value"]
             center = isochrone["properties"]["center"]
             total_pop = isochrone["properties"].get("total_pop")
-            qgis_coords = [QgsPointXY(x, y) for x, y in coordinates[0]]
-            feat.setGeometry(QgsGeometry.fromPolygonXY([qgis_coords]))
-            feat.setAttributes(
-                [
-                    id_field_value,
-                    center[0],
-                    center[1],
-                    int(iso_value / self.factor),
-                    self.profile,
-                    total_pop,
-                ]
-            )
-
-            yield feat
+            values = id_field_value
+            if id_field_values is not None:
+                values = id_field_values[isochrone["properties"].get("group_index", 0)]
+            polygon = geometry.polygon_from_rings(coordinates)
+
+            for value in values if isinstance(values, list) else [values]:
+                feat = QgsFeature()
+                feat.setGeometry(polygon)
+                feat.setAttributes(
+                    [
+                        value,
+                        center[0],
+                        center[1],
+                        int(iso_value / self.factor),
+                        self.profile,
+                        total_pop,
+                    ]
+                )
+
+                yield feat
 
     # def calculate_difference(self, dest_id, context):
     #     """Something goes wrong here.. The parent algorithm can't see the dissolved layer.."""
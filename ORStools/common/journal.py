@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ ORStools
+                                 A QGIS plugin
+ QGIS client to query openrouteservice
+                              -------------------
+        begin                : 2017-02-01
+        git sha              : $Format:%H$
+        copyright            : (C) 2021 by HeiGIT gGmbH
+        email                : support@openrouteservice.heigit.org
+ ***************************************************************************/
+
+ This plugin provides access to openrouteservice API functionalities
+ (https://openrouteservice.org), developed and
+ maintained by the openrouteservice team of HeiGIT gGmbH, Germany. By using
+ this plugin you agree to the ORS terms of service
+ (https://openrouteservice.org/terms-of-service/).
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Generator, Iterable, Optional
+
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import QgsFeature
+
+from ORStools.utils import geometry
+
+
+class RequestJournal:
+    """Append-only journal of completed requests and the features built from them.
+
+    Each line of the JSON lines file holds the key of a request and its output features,
+    with geometries as hex encoded WKB. The first line identifies the algorithm that
+    wrote the journal. A run can be resumed from the journal by replaying its features
+    into the new output and skipping all requests whose keys are contained.
+    """
+
+    def __init__(self, path: str, algorithm: str, resume: bool = False) -> None:
+        """
+        :param path: path of the journal file
+        :type path: str
+
+        :param algorithm: name of the algorithm writing the journal
+        :type algorithm: str
+
+        :param resume: continue an existing journal instead of starting a new one
+        :type resume: bool
+
+        :raises ValueError: if the journal to resume was written by another algorithm
+        """
+        self.path = path
+        self.algorithm = algorithm
+        self.keys = set()
+
+        if resume and os.path.isfile(path):
+            header = None
+            for entry in self._read_entries():
+                if header is None:
+                    header = entry
+                    continue
+                self.keys.add(entry["key"])
+
+            if header is None or header.get("algorithm") != algorithm:
+                raise ValueError(
+                    f"The journal {path} was not written by the algorithm {algorithm}."
+                )
+            self._file = open(path, "a", encoding="utf-8")
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+            self._write_line({"algorithm": algorithm})
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @staticmethod
+    def make_key(url: str, post_json: dict, values: Any = None) -> str:
+        """
+        Build the journal key of a request.
+
+        :param url: endpoint path
+        :type url: str
+
+        :param post_json: request body
+        :type post_json: dict
+
+        :param values: values identifying the output features of the request, e.g. the ID
+            field values, so identical requests for different features are told apart
+        :type values: any
+
+        :returns: hex digest identifying the request
+        :rtype: str
+        """
+        canonical = json.dumps(
+            [url, post_json, values], sort_keys=True, separators=(",", ":"), default=str
+        )
+
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def write(self, key: str, features: Iterable[QgsFeature]) -> None:
+        """
+        Records a completed request with its output features.
+
+        :param key: key of the request, see make_key
+        :type key: str
+
+        :param features: output features built from the response
+        :type features: list of QgsFeature
+        """
+        self._write_line(
+            {
+                "key": key,
+                "features": [
+                    {
+                        "wkb": bytes(feat.geometry().asWkb()).hex() if feat.hasGeometry() else None,
+                        "attributes": feat.attributes(),
+                    }
+                    for feat in features
+                ],
+            }
+        )
+        self.keys.add(key)
+
+    def replay(self) -> Generator[QgsFeature, None, None]:
+        """
+        Generator of all features recorded in the journal.
+
+        :returns: recorded output features
+        :rtype: QgsFeature
+        """
+        for entry in self._read_entries():
+            for recorded in entry.get("features", []):
+                feat = QgsFeature()
+                if recorded["wkb"]:
+                    feat.setGeometry(geometry.from_wkb(bytes.fromhex(recorded["wkb"])))
+                feat.setAttributes(recorded["attributes"])
+
+                yield feat
+
+    def close(self) -> None:
+        """Closes the journal file."""
+        if not self._file.closed:
+            self._file.close()
+
+    def remove(self) -> None:
+        """Closes and deletes the journal file, e.g. once all requests completed."""
+        self.close()
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+    def _write_line(self, entry: dict) -> None:
+        self._file.write(json.dumps(entry, default=self._serialize) + "\n")
+        # make completed requests survive a crash of QGIS
+        self._file.flush()
+
+    def _read_entries(self) -> Generator[dict, None, None]:
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # last line of a journal interrupted while writing
+                    continue
+
+    @staticmethod
+    def _serialize(value: Any) -> Optional[str]:
+        """Serializes attribute values JSON doesn't know, like NULL or dates."""
+        if isinstance(value, QVariant) and value.isNull():
+            return None
+        return str(value)
+
+
+def get_journal_path(output_path: str) -> Optional[str]:
+    """
+    Returns the default journal path next to an output file, None for outputs that aren't
+    files, e.g. temporary layers.
+
+    :param output_path: destination of an algorithm output
+    :type output_path: str
+
+    :rtype: str or None
+    """
+    if not output_path or output_path.startswith("memory:") or "://" in output_path:
+        return None
+
+    # strip layer options, e.g. of GeoPackages
+    file_path = output_path.split("|")[0]
+    if not os.path.isabs(file_path):
+        return None
+
+    return f"{os.path.splitext(file_path)[0]}.journal.jsonl"
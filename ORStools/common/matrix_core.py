@@ -0,0 +1,592 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ ORStools
+                                 A QGIS plugin
+ QGIS client to query openrouteservice
+                              -------------------
+        begin                : 2017-02-01
+        git sha              : $Format:%H$
+        copyright            : (C) 2021 by HeiGIT gGmbH
+        email                : support@openrouteservice.heigit.org
+ ***************************************************************************/
+
+ This plugin provides access to openrouteservice API functionalities
+ (https://openrouteservice.org), developed and
+ maintained by the openrouteservice team of HeiGIT gGmbH, Germany. By using
+ this plugin you agree to the ORS terms of service
+ (https://openrouteservice.org/terms-of-service/).
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+import os
+from math import isqrt
+from typing import Any, Callable, Generator, List, Optional, Sequence, Tuple
+
+from qgis.core import QgsFeature
+
+from ORStools.common.client import RECOVERABLE_ERRORS, Client
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# A tile is a block of consecutive source rows and a range or sorted list of destination
+# columns of the matrix
+Tile = Tuple[range, Sequence[int]]
+
+# Number of matrix cells converted to features at once when writing a row block
+WRITE_BLOCK_CELLS = 50000
+
+
+def get_tiles(
+    sources_amount: int, destinations_amount: int, max_routes: int, symmetric: bool = False
+) -> List[Tile]:
+    """
+    Splits a sources x destinations matrix into tiles of at most max_routes cells each.
+
+    Tiles are kept close to square, which keeps the number of locations sent per route low,
+    but are widened along an axis the matrix doesn't fill. Tiles are ordered row block by
+    row block, so the rows of a block are complete once all its tiles have been received.
+
+    A symmetric matrix is split into square tiles of which only those on and above the
+    diagonal are returned.
+
+    :param sources_amount: number of matrix rows
+    :type sources_amount: int
+
+    :param destinations_amount: number of matrix columns
+    :type destinations_amount: int
+
+    :param max_routes: maximum number of routes (sources x destinations) per request
+    :type max_routes: int
+
+    :param symmetric: whether only the upper triangle of a square matrix is needed
+    :type symmetric: bool
+
+    :returns: list of (rows, columns) tuples
+    :rtype: list
+    """
+    max_routes = max(1, max_routes)
+
+    if symmetric:
+        side = max(1, min(sources_amount, isqrt(max_routes)))
+        return [
+            (
+                range(row_start, min(row_start + side, sources_amount)),
+                range(column_start, min(column_start + side, sources_amount)),
+            )
+            for row_start in range(0, sources_amount, side)
+            for column_start in range(row_start, sources_amount, side)
+        ]
+
+    columns = max(1, min(destinations_amount, isqrt(max_routes)))
+    rows = max(1, min(sources_amount, max_routes // columns))
+    # use up the remaining routes if the rows didn't fill the tile
+    columns = max(1, min(destinations_amount, max_routes // rows))
+
+    return [
+        (
+            range(row_start, min(row_start + rows, sources_amount)),
+            range(column_start, min(column_start + columns, destinations_amount)),
+        )
+        for row_start in range(0, sources_amount, rows)
+        for column_start in range(0, destinations_amount, columns)
+    ]
+
+
+def get_nearest_tiles(nearest: List[List[int]], max_routes: int) -> List[Tile]:
+    """
+    Groups consecutive sources into tiles requesting the union of their nearest destinations,
+    as long as the tile stays within max_routes.
+
+    :param nearest: destination indices per source, e.g. from spatial.get_nearest
+    :type nearest: list
+
+    :param max_routes: maximum number of routes (sources x destinations) per request
+    :type max_routes: int
+
+    :returns: list of (rows, columns) tuples with columns as sorted lists
+    :rtype: list
+    """
+    tiles = []
+    start = 0
+    columns = set()
+    for s, destinations in enumerate(nearest):
+        union = columns.union(destinations)
+        if s > start and (s - start + 1) * len(union) > max_routes:
+            tiles.append((range(start, s), sorted(columns)))
+            start = s
+            union = set(destinations)
+        columns = union
+
+    if start < len(nearest):
+        tiles.append((range(start, len(nearest)), sorted(columns)))
+
+    # sources without any destination don't need a request
+    return [(rows, columns) for rows, columns in tiles if columns]
+
+
+def get_tile_params(
+    tile: Tile, sources: List[List[float]], destinations: List[List[float]]
+) -> dict:
+    """
+    Builds the matrix request body of a single tile.
+
+    If sources and destinations are the same list, a tile on the diagonal sends its
+    locations only once.
+
+    :param tile: rows and columns of the tile
+    :type tile: tuple
+
+    :param sources: [lon, lat] of all matrix sources
+    :type sources: list
+
+    :param destinations: [lon, lat] of all matrix destinations
+    :type destinations: list
+
+    :returns: matrix request parameters
+    :rtype: dict
+    """
+    rows, columns = tile
+    if sources is destinations and rows == columns:
+        return {
+            "locations": [sources[i] for i in rows],
+            "sources": list(range(len(rows))),
+            "destinations": list(range(len(rows))),
+            "metrics": ["duration", "distance"],
+            "id": f"Matrix_{rows.start}_{columns[0]}",
+        }
+
+    return {
+        "locations": [sources[i] for i in rows] + [destinations[j] for j in columns],
+        "sources": list(range(len(rows))),
+        "destinations": list(range(len(rows), len(rows) + len(columns))),
+        "metrics": ["duration", "distance"],
+        "id": f"Matrix_{rows.start}_{columns[0]}",
+    }
+
+
+def get_row_blocks(
+    ors_client: Client,
+    url: str,
+    sources: List[List[float]],
+    destinations: List[List[float]],
+    max_routes: int,
+    report_error: Optional[Callable[[str], None]] = None,
+    symmetric: bool = False,
+    nearest: Optional[List[List[int]]] = None,
+) -> Generator[Tuple[range, List[List[Optional[float]]], List[List[Optional[float]]]], None, None]:
+    """
+    Requests the tiles of a matrix concurrently and stitches them to complete row blocks.
+
+    A tile failing with a recoverable error is requested once more on its own. If it still
+    fails, the error is reported and its cells stay empty (None), the other tiles are
+    unaffected.
+
+    :param ors_client: client to send the requests with
+    :type ors_client: Client
+
+    :param url: matrix endpoint path including the profile
+    :type url: str
+
+    :param sources: [lon, lat] of all matrix sources
+    :type sources: list
+
+    :param destinations: [lon, lat] of all matrix destinations
+    :type destinations: list
+
+    :param max_routes: maximum number of routes (sources x destinations) per request
+    :type max_routes: int
+
+    :param report_error: called with a message for each tile that finally failed
+    :type report_error: callable
+
+    :param symmetric: only request the tiles on and above the diagonal of a matrix whose
+        sources and destinations are the same list. Cells below the tiles stay empty.
+    :type symmetric: bool
+
+    :param nearest: only request the given destination indices per source. All other cells
+        stay empty and sources without destinations are left out.
+    :type nearest: list
+
+    :returns: generator of (rows, durations, distances) with the row block's values in
+        seconds and meters, as len(rows) x len(destinations) arrays with NaN for empty cells.
+        Nested lists with None for empty cells if NumPy is not available.
+    :rtype: generator
+    """
+    if nearest is not None:
+        tiles = get_nearest_tiles(nearest, max_routes)
+    else:
+        tiles = get_tiles(len(sources), len(destinations), max_routes, symmetric)
+    requests = ((tile, get_tile_params(tile, sources, destinations)) for tile in tiles)
+
+    block_rows = None
+    durations = distances = []
+    for (rows, columns), response in ors_client.fetch_concurrently(url, {}, requests):
+        if rows != block_rows:
+            if block_rows is not None:
+                yield block_rows, durations, distances
+            block_rows = rows
+            durations = _empty_block(len(rows), len(destinations))
+            distances = _empty_block(len(rows), len(destinations))
+
+        if isinstance(response, Exception):
+            try:
+                response = ors_client.fetch_with_retry(
+                    url, {}, post_json=get_tile_params((rows, columns), sources, destinations)
+                )
+            except RECOVERABLE_ERRORS as e:
+                if report_error:
+                    report_error(
+                        f"Sources {rows.start}-{rows.stop - 1} to destinations "
+                        f"{columns[0]}-{columns[-1]} caused a "
+                        f"{e.__class__.__name__}: {str(e)}"
+                    )
+                continue
+
+        for block, values in (
+            (durations, response["durations"]),
+            (distances, response["distances"]),
+        ):
+            if np is not None:
+                # None becomes NaN
+                block[:, _get_index(columns)] = np.array(values, dtype=float)
+            elif isinstance(columns, range):
+                for row, row_values in zip(block, values):
+                    row[columns.start : columns.stop] = row_values
+            else:
+                for row, row_values in zip(block, values):
+                    for column, value in zip(columns, row_values):
+                        row[column] = value
+
+        if nearest is not None:
+            # a tile requests the destinations of all its sources, keep each source's own
+            for block in (durations, distances):
+                for i, s in enumerate(rows):
+                    own = set(nearest[s])
+                    for column in columns:
+                        if column not in own:
+                            block[i][column] = np.nan if np is not None else None
+
+    if block_rows is not None:
+        yield block_rows, durations, distances
+
+
+def get_features(
+    rows: range,
+    durations: Any,
+    distances: Any,
+    sources_ids: List[Any],
+    destinations_ids: List[Any],
+    symmetric_mode: str = "Off",
+    nearest: Optional[List[List[int]]] = None,
+) -> Generator[List[QgsFeature], None, None]:
+    """
+    Converts a row block to output features with durations in hours and distances in
+    kilometers, in chunks of about WRITE_BLOCK_CELLS features to be added to a sink at once.
+
+    :param rows: matrix rows of the block
+    :type rows: range
+
+    :param durations: durations in seconds of the block as returned by get_row_blocks
+    :type durations: numpy.ndarray or list
+
+    :param distances: distances in meters of the block as returned by get_row_blocks
+    :type distances: numpy.ndarray or list
+
+    :param sources_ids: ID values of all matrix sources
+    :type sources_ids: list
+
+    :param destinations_ids: ID values of all matrix destinations
+    :type destinations_ids: list
+
+    :param symmetric_mode: one of SYMMETRIC_MODES. Unless "Off", only the cells above the
+        diagonal are written, once per pair or mirrored to both directions.
+    :type symmetric_mode: str
+
+    :param nearest: only write the given destination indices per source
+    :type nearest: list
+
+    :returns: generator of feature lists
+    :rtype: generator
+    """
+    chunk_rows = max(1, WRITE_BLOCK_CELLS // max(1, len(destinations_ids)))
+
+    for start in range(0, len(rows), chunk_rows):
+        stop = min(start + chunk_rows, len(rows))
+        if np is not None:
+            durations_h = _to_list(durations[start:stop] / 3600)
+            distances_km = _to_list(distances[start:stop] / 1000)
+        else:
+            durations_h = [
+                [d / 3600 if d is not None else None for d in row] for row in durations[start:stop]
+            ]
+            distances_km = [
+                [d / 1000 if d is not None else None for d in row] for row in distances[start:stop]
+            ]
+
+        features = []
+        for s, durations_row, distances_row in zip(rows[start:stop], durations_h, distances_km):
+            source_id = sources_ids[s]
+            # cells on and below the diagonal of a symmetric matrix are not requested
+            if nearest is not None:
+                columns = nearest[s]
+            else:
+                first = s + 1 if symmetric_mode != "Off" else 0
+                columns = range(first, len(destinations_ids))
+
+            for d in columns:
+                feat = QgsFeature()
+                feat.setAttributes(
+                    [source_id, destinations_ids[d], durations_row[d], distances_row[d]]
+                )
+                features.append(feat)
+
+                if symmetric_mode == "Mirror upper triangle":
+                    feat = QgsFeature()
+                    feat.setAttributes(
+                        [sources_ids[d], destinations_ids[s], durations_row[d], distances_row[d]]
+                    )
+                    features.append(feat)
+
+        yield features
+
+
+def _get_index(columns: Sequence[int]) -> Any:
+    """Returns an index selecting the given columns of an array."""
+    if isinstance(columns, range):
+        return slice(columns.start, columns.stop)
+    return list(columns)
+
+
+def _empty_block(rows_amount: int, columns_amount: int) -> Any:
+    """Returns a rows x columns block of empty matrix cells."""
+    if np is not None:
+        return np.full((rows_amount, columns_amount), np.nan)
+    return [[None] * columns_amount for _ in range(rows_amount)]
+
+
+def _to_list(values: "np.ndarray") -> List[List[Optional[float]]]:
+    """Converts an array to nested lists, replacing NaN by None."""
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+class ArrayWriter:
+    """
+    Writes the row blocks of a matrix to a binary file as they are received.
+
+    The file format is chosen by extension:
+
+    - .npz: compressed NumPy archive with durations, distances, sources_ids and
+      destinations_ids arrays. Holds the whole matrix in memory until closed.
+    - .npy: memory-mapped float32 array of shape (2, sources, destinations) with durations
+      and distances, plus a <name>.ids.json sidecar with the ID values.
+    - .parquet: one row per pair with source_id, destination_id, duration and distance.
+      Requires pyarrow.
+
+    Durations are in seconds, distances in meters and empty cells are NaN.
+    """
+
+    FORMATS = [".npz", ".npy", ".parquet"]
+
+    def __init__(
+        self,
+        path: str,
+        sources_ids: List[Any],
+        destinations_ids: List[Any],
+        symmetric_mode: str = "Off",
+        nearest: Optional[List[List[int]]] = None,
+    ) -> None:
+        """
+        :param path: output file path, its extension determines the format
+        :type path: str
+
+        :param sources_ids: ID values of all matrix sources
+        :type sources_ids: list
+
+        :param destinations_ids: ID values of all matrix destinations
+        :type destinations_ids: list
+
+        :param symmetric_mode: one of SYMMETRIC_MODES, see get_features
+        :type symmetric_mode: str
+
+        :param nearest: destination indices per source if only those were requested. The
+            Parquet table only gets these pairs, the arrays are NaN for all other cells.
+        :type nearest: list
+
+        :raises ImportError: if NumPy, or pyarrow for Parquet, is not available
+        :raises ValueError: if the file extension is not supported
+        """
+        self.path = path
+        self.extension = os.path.splitext(path)[1].lower()
+        self.sources_ids = sources_ids
+        self.destinations_ids = destinations_ids
+        self.symmetric_mode = symmetric_mode
+        self.nearest = nearest
+
+        if self.extension not in self.FORMATS:
+            raise ValueError(
+                f"Unsupported matrix file format '{self.extension}', use one of {self.FORMATS}."
+            )
+        if np is None:
+            raise ImportError("Writing matrix files requires NumPy.")
+
+        shape = (2, len(sources_ids), len(destinations_ids))
+        self.arrays = None
+        self.parquet = None
+        if self.extension == ".npz":
+            self.arrays = np.full(shape, np.nan, dtype=np.float32)
+        elif self.extension == ".npy":
+            self.arrays = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=shape)
+            self.arrays[:] = np.nan
+            with open(self.get_ids_path(path), "w") as f:
+                json.dump(
+                    {
+                        "arrays": ["duration", "distance"],
+                        "sources_ids": sources_ids,
+                        "destinations_ids": destinations_ids,
+                    },
+                    f,
+                    default=str,
+                )
+        else:
+            if pa is None:
+                raise ImportError("Writing Parquet files requires pyarrow.")
+            self.parquet_sources = self._to_arrow(sources_ids)
+            self.parquet_destinations = self._to_arrow(destinations_ids)
+            schema = pa.schema(
+                [
+                    ("source_id", self.parquet_sources.type),
+                    ("destination_id", self.parquet_destinations.type),
+                    ("duration", pa.float32()),
+                    ("distance", pa.float32()),
+                ]
+            )
+            self.parquet = pq.ParquetWriter(path, schema)
+
+    @staticmethod
+    def get_ids_path(path: str) -> str:
+        """Returns the path of the ID sidecar of a .npy matrix file."""
+        return f"{os.path.splitext(path)[0]}.ids.json"
+
+    @staticmethod
+    def _to_arrow(ids: List[Any]) -> "pa.Array":
+        """Converts ID values to an Arrow array, as strings if their type can't be inferred."""
+        try:
+            return pa.array(ids)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return pa.array([str(i) for i in ids])
+
+    @staticmethod
+    def _to_numpy(ids: List[Any]) -> "np.ndarray":
+        """Converts ID values to an array, as strings if they aren't numbers or strings."""
+        ids_array = np.array(ids)
+        if ids_array.dtype == object:
+            ids_array = np.array([str(i) for i in ids])
+        return ids_array
+
+    def write(self, rows: range, durations: "np.ndarray", distances: "np.ndarray") -> None:
+        """
+        Writes a row block as returned by get_row_blocks.
+
+        :param rows: matrix rows of the block
+        :type rows: range
+
+        :param durations: durations in seconds of the block
+        :type durations: numpy.ndarray
+
+        :param distances: distances in meters of the block
+        :type distances: numpy.ndarray
+        """
+        block = np.stack([durations, distances]).astype(np.float32)
+
+        if self.symmetric_mode != "Off":
+            # keep the cells above the diagonal only
+            columns = np.arange(block.shape[2])
+            below = columns[None, :] <= np.arange(rows.start, rows.stop)[:, None]
+            block[:, below] = np.nan
+
+        if self.parquet is not None:
+            self._write_parquet(rows, block)
+            return
+
+        if self.symmetric_mode == "Off":
+            self.arrays[:, rows.start : rows.stop, :] = block
+            return
+
+        upper = block[:, :, rows.start :]
+        if self.symmetric_mode == "Mirror upper triangle":
+            # complete the diagonal square and mirror the block below the diagonal
+            square = upper[:, :, : len(rows)]
+            square[:] = np.where(np.isnan(square), square.transpose(0, 2, 1), square)
+            self.arrays[:, rows.stop :, rows.start : rows.stop] = upper[
+                :, :, len(rows) :
+            ].transpose(0, 2, 1)
+        self.arrays[:, rows.start : rows.stop, rows.start :] = upper
+
+    def _write_parquet(self, rows: range, block: "np.ndarray") -> None:
+        """Appends the pairs of a row block in long format to the Parquet file."""
+        if self.nearest is not None:
+            source_index = np.array(
+                [i for i, s in enumerate(rows) for _ in self.nearest[s]], dtype=int
+            )
+            destination_index = np.array([d for s in rows for d in self.nearest[s]], dtype=int)
+        else:
+            source_index, destination_index = np.indices(block.shape[1:]).reshape(2, -1)
+
+        if self.symmetric_mode != "Off":
+            above = destination_index > source_index + rows.start
+            source_index, destination_index = source_index[above], destination_index[above]
+        durations = block[0, source_index, destination_index]
+        distances = block[1, source_index, destination_index]
+        source_index = source_index + rows.start
+
+        columns = [(source_index, destination_index, durations, distances)]
+        if self.symmetric_mode == "Mirror upper triangle":
+            columns.append((destination_index, source_index, durations, distances))
+
+        for sources, destinations, durations, distances in columns:
+            self.parquet.write_table(
+                pa.table(
+                    [
+                        self.parquet_sources.take(pa.array(sources)),
+                        self.parquet_destinations.take(pa.array(destinations)),
+                        pa.array(durations, type=pa.float32(), from_pandas=True),
+                        pa.array(distances, type=pa.float32(), from_pandas=True),
+                    ],
+                    names=["source_id", "destination_id", "duration", "distance"],
+                )
+            )
+
+    def close(self) -> None:
+        """Finishes the file."""
+        if self.extension == ".npz":
+            np.savez_compressed(
+                self.path,
+                durations=self.arrays[0],
+                distances=self.arrays[1],
+                sources_ids=self._to_numpy(self.sources_ids),
+                destinations_ids=self._to_numpy(self.destinations_ids),
+            )
+        elif self.extension == ".npy":
+            self.arrays.flush()
+        else:
+            self.parquet.close()
+        self.arrays = None
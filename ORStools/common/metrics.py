@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ ORStools
+                                 A QGIS plugin
+ QGIS client to query openrouteservice
+                              -------------------
+        begin                : 2017-02-01
+        git sha              : $Format:%H$
+        copyright            : (C) 2021 by HeiGIT gGmbH
+        email                : support@openrouteservice.heigit.org
+ ***************************************************************************/
+
+ This plugin provides access to openrouteservice API functionalities
+ (https://openrouteservice.org), developed and
+ maintained by the openrouteservice team of HeiGIT gGmbH, Germany. By using
+ this plugin you agree to the ORS terms of service
+ (https://openrouteservice.org/terms-of-service/).
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+import math
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Generator, List, Union
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of unsorted values, 0 if there are none."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class RunMetrics:
+    """Timers and counters of a processing run.
+
+    Phases are timed with the timer context manager, the time of a phase entered several
+    times adds up. Nested timers are exclusive: while an inner phase runs, the outer one is
+    paused, so the phases never add up to more than the wall time. The client records the
+    latency and size of every request per endpoint, retries and cache hits are counted like
+    any other event.
+    """
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = defaultdict(float)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.bytes_sent: Dict[str, int] = defaultdict(int)
+        self.bytes_received: Dict[str, int] = defaultdict(int)
+        # [phase, start] of the running timers, only the innermost one is counting
+        self._timers: List[List[Union[str, float]]] = []
+
+    @contextmanager
+    def timer(self, phase: str) -> Generator[None, None, None]:
+        """Adds the time spent in the with block to a phase.
+
+        :param phase: name of the phase, e.g. read_features
+        :type phase: str
+        """
+        now = time.perf_counter()
+        if self._timers:
+            outer = self._timers[-1]
+            self.phases[outer[0]] += now - outer[1]
+        timer = [phase, now]
+        self._timers.append(timer)
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            if self._timers[-1] is timer:
+                self.phases[phase] += now - timer[1]
+                self._timers.pop()
+                if self._timers:
+                    self._timers[-1][1] = now
+            else:
+                # left out of order, e.g. by a generator, its time was counted until paused
+                self._timers.remove(timer)
+
+    def count(self, counter: str, value: int = 1) -> None:
+        self.counters[counter] += value
+
+    def add_request(
+        self, endpoint: str, seconds: float, bytes_sent: int, bytes_received: int
+    ) -> None:
+        """Records a request answered by the server, whatever its status.
+
+        :param endpoint: API endpoint path of the request
+        :type endpoint: str
+
+        :param seconds: time from sending the request to receiving the full reply
+        :type seconds: float
+
+        :param bytes_sent: size of the request body
+        :type bytes_sent: int
+
+        :param bytes_received: size of the reply body
+        :type bytes_received: int
+        """
+        self.latencies[endpoint].append(seconds)
+        self.bytes_sent[endpoint] += bytes_sent
+        self.bytes_received[endpoint] += bytes_received
+
+    def summary(self) -> dict:
+        """Totals of the run, JSON serializable."""
+        return {
+            "total_s": round(time.perf_counter() - self.start, 3),
+            "phases_s": {phase: round(seconds, 3) for phase, seconds in self.phases.items()},
+            "counters": dict(self.counters),
+            "endpoints": {
+                endpoint: {
+                    "requests": len(latencies),
+                    "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                    "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                    "bytes_sent": self.bytes_sent[endpoint],
+                    "bytes_received": self.bytes_received[endpoint],
+                }
+                for endpoint, latencies in self.latencies.items()
+            },
+        }
+
+    def report(self) -> List[str]:
+        """Summary of the run as lines of text."""
+        summary = self.summary()
+        lines = [f"Total: {summary['total_s']:.2f} s"]
+        for phase, seconds in sorted(summary["phases_s"].items(), key=lambda item: -item[1]):
+            lines.append(f"{phase}: {seconds:.2f} s")
+        for endpoint, stats in summary["endpoints"].items():
+            lines.append(
+                f"{endpoint}: {stats['requests']} requests, "
+                f"p50 {stats['p50_ms']:.0f} ms, p95 {stats['p95_ms']:.0f} ms, "
+                f"{stats['bytes_sent'] / 1024:.1f} KiB sent, "
+                f"{stats['bytes_received'] / 1024:.1f} KiB received"
+            )
+        for counter, value in sorted(summary["counters"].items()):
+            lines.append(f"{counter}: {value}")
+
+        return lines
+
+    def write(self, path: str) -> None:
+        """Writes the summary of the run to a JSON file.
+
+        :param path: path of the JSON file
+        :type path: str
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ ORStools
+                                 A QGIS plugin
+ QGIS client to query openrouteservice
+                              -------------------
+        begin                : 2017-02-01
+        git sha              : $Format:%H$
+        copyright            : (C) 2021 by HeiGIT gGmbH
+        email                : support@openrouteservice.heigit.org
+ ***************************************************************************/
+
+ This plugin provides access to openrouteservice API functionalities
+ (https://openrouteservice.org), developed and
+ maintained by the openrouteservice team of HeiGIT gGmbH, Germany. By using
+ this plugin you agree to the ORS terms of service
+ (https://openrouteservice.org/terms-of-service/).
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+RATE_LIMIT_HEADERS = {
+    "limit": "X-Ratelimit-Limit",
+    "remaining": "X-Ratelimit-Remaining",
+    "reset": "X-Ratelimit-Reset",
+    "retry_after": "Retry-After",
+}
+
+# Quotas of the public API are counted per minute
+WINDOW_SECONDS = 60
+# Stay a bit below the learned rate, so the next window isn't exhausted again
+SAFETY_FACTOR = 0.9
+
+
+class RateLimiter:
+    """Token bucket which paces the requests to one service of a provider.
+
+    The bucket starts without a rate and lets every request pass. If the quota headers
+    of a response announce a reset within a minute, the remaining quota is spread until
+    then. Otherwise the rate is learned whenever the quota is exceeded: the number of
+    requests which succeeded during the last minute becomes the rate for the next minute
+    after the pause, then the bucket lets every request pass again. Quotas with a later
+    reset, e.g. daily ones, only block the bucket once they are used up, Retry-After
+    headers until the given time has passed.
+
+    All methods are thread-safe, as processing algorithms run in their own threads.
+    """
+
+    def __init__(self) -> None:
+        self.rate = None
+        self.rate_expires = 0.0
+        self.rate_from_headers = False
+        self.tokens = 1.0
+        self.blocked_until = 0.0
+        self.updated = time.monotonic()
+        self.successes = deque()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token for the next request.
+
+        :returns: seconds to wait before the request may be sent
+        :rtype: float
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, self.blocked_until - now)
+
+            if self.rate:
+                self.tokens -= 1
+                if self.tokens < 0:
+                    # the request may be sent once the rate expired at the latest
+                    wait = max(wait, min(-self.tokens / self.rate, self.rate_expires - now))
+
+            return wait
+
+    def update(self, headers: Dict[str, Optional[float]]) -> None:
+        """Register a successful request and its quota headers.
+
+        :param headers: parsed values of RATE_LIMIT_HEADERS, None if missing
+        :type headers: dict
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.successes.append(now)
+            self._forget(now)
+
+            if headers.get("retry_after"):
+                self.blocked_until = max(self.blocked_until, now + headers["retry_after"])
+            if not headers.get("reset") or headers.get("remaining") is None:
+                return
+
+            until_reset = seconds_until_reset(headers["reset"])
+            if headers["remaining"] == 0:
+                self.blocked_until = max(self.blocked_until, now + until_reset)
+            if headers.get("limit") and until_reset <= WINDOW_SECONDS:
+                if headers["remaining"]:
+                    rate, expires = headers["remaining"] / max(until_reset, 1.0), until_reset
+                else:
+                    # the whole quota is available again after the reset
+                    rate, expires = headers["limit"] / WINDOW_SECONDS, until_reset + WINDOW_SECONDS
+                self._set_rate(now, rate * SAFETY_FACTOR, now + expires)
+                self.rate_from_headers = True
+
+    def on_over_query_limit(self, delay_seconds: float) -> None:
+        """Pause all requests after the quota has been exceeded and learn the rate,
+        unless the quota headers pace the requests already.
+
+        :param delay_seconds: seconds until the next request may be sent
+        :type delay_seconds: float
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._forget(now)
+            self.blocked_until = max(self.blocked_until, now + delay_seconds)
+
+            # Without successful requests there's nothing to learn from
+            if self.successes and not (self.rate and self.rate_from_headers):
+                rate = len(self.successes) / WINDOW_SECONDS * SAFETY_FACTOR
+                self._set_rate(now, rate, self.blocked_until + WINDOW_SECONDS)
+                self.rate_from_headers = False
+                self.tokens = 0.0
+                self.successes.clear()
+
+    def _refill(self, now: float) -> None:
+        if self.rate and now >= self.rate_expires:
+            self.rate = None
+            self.tokens = 1.0
+        elif self.rate:
+            self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _set_rate(self, now: float, rate: float, expires: float) -> None:
+        self._refill(now)
+        if self.rate is None:
+            self.tokens = 1.0
+        self.rate = rate
+        self.rate_expires = expires
+
+    def _forget(self, now: float) -> None:
+        while self.successes and now - self.successes[0] > WINDOW_SECONDS:
+            self.successes.popleft()
+
+
+def seconds_until_reset(reset: float) -> float:
+    """X-Ratelimit-Reset is either a unix timestamp or a number of seconds."""
+    if reset > 1e9:
+        return max(0.0, reset - time.time())
+    return reset
+
+
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(base_url: str, url: str) -> RateLimiter:
+    """
+    Returns the rate limiter shared by all clients of a provider's service.
+
+    :param base_url: base URL of the provider
+    :type base_url: str
+
+    :param url: endpoint path of the request, e.g. /v2/directions/driving-car/geojson
+    :type url: str
+
+    :returns: rate limiter for this provider and service
+    :rtype: RateLimiter
+    """
+    # Quotas are counted per service, i.e. directions and isochrones have their own
+    parts = url.strip("/").split("/")
+    service = "/".join(parts[:2] if parts[0] == "v2" else parts[:1])
+
+    with _limiters_lock:
+        key = (base_url.rstrip("/"), service)
+        if key not in _limiters:
+            _limiters[key] = RateLimiter()
+        return _limiters[key]
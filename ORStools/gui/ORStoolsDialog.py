@@ -231,6 +231,7 @@ class ORStoolsDialogMain:
 
         # Clear rubber band and annotations
         if self.dlg:
+            configmanager.notifier.configChanged.disconnect(self.dlg._on_prov_refresh_click)
             self.dlg._clear_listwidget()
             self.dlg._clear_annotations()
 
@@ -422,6 +423,7 @@ class ORStoolsDialog(QDialog, MAIN_WIDGET):
         self.help_button.clicked.connect(on_help_click)
         self.about_button.clicked.connect(lambda: on_about_click(parent=self._iface.mainWindow()))
         self.provider_refresh.clicked.connect(self._on_prov_refresh_click)
+        configmanager.notifier.configChanged.connect(self._on_prov_refresh_click)
 
         # Routing tab
         self.routing_fromline_map.clicked.connect(lambda: self._on_linetool_init(hide=True))
@@ -623,10 +625,14 @@ class ORStoolsDialog(QDialog, MAIN_WIDGET):
     def _on_prov_refresh_click(self) -> None:
         """Populates provider dropdown with fresh list from config.yml"""
 
+        current_index = self.provider_combo.currentIndex()
         providers = configmanager.read_config()["providers"]
         self.provider_combo.clear()
         for provider in providers:
             self.provider_combo.addItem(provider["name"], provider)
+        # keep the selected provider if it still exists
+        if 0 <= current_index < len(providers):
+            self.provider_combo.setCurrentIndex(current_index)
 
     def _clear_listwidget(self) -> None:
         """Clears the contents of the QgsListWidget and the annotations."""
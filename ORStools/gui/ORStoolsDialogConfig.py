@@ -36,11 +36,13 @@ from qgis.PyQt.QtWidgets import (
     QInputDialog,
     QLineEdit,
     QDialogButtonBox,
+    QMessageBox,
 )
 from qgis.PyQt.QtGui import QIntValidator
 
 from ORStools.utils import configmanager, gui
-from ..proc import ENDPOINTS, DEFAULT_SETTINGS
+from ..common.cache import get_response_cache
+from ..proc import ENDPOINTS, LIMITS, DEFAULT_SETTINGS
 
 CONFIG_WIDGET, _ = uic.loadUiType(gui.GuiUtils.get_ui_file_path("ORStoolsDialogConfigUI.ui"))
 
@@ -74,7 +76,10 @@ class ORStoolsDialogConfigMain(QDialog, CONFIG_WIDGET):
 
         collapsible_boxes = self.providers.findChildren(QgsCollapsibleGroupBox)
         collapsible_boxes = [
-            i for i in collapsible_boxes if "_provider_endpoints" not in i.objectName()
+            i
+            for i in collapsible_boxes
+            if "_provider_endpoints" not in i.objectName()
+            and "_provider_limits" not in i.objectName()
         ]
         for idx, box in enumerate(collapsible_boxes):
             current_provider = self.temp_config["providers"][idx]
@@ -90,10 +95,22 @@ class ORStoolsDialogConfigMain(QDialog, CONFIG_WIDGET):
             timeout_input = box.findChild(QtWidgets.QLineEdit, box.title() + "_timeout_text")
             # https://doc.qt.io/qt-5/qvalidator.html#State-enum
             if timeout_input.validator().State != 2:
-                self._adjust_timeout_input(timeout_input)
+                self._clamp_input(timeout_input, 1, 3600, 60)
 
             current_provider["timeout"] = int(timeout_input.text())
 
+            concurrency_input = box.findChild(
+                QtWidgets.QLineEdit, box.title() + "_concurrent_requests_text"
+            )
+            if concurrency_input.validator().State != 2:
+                self._clamp_input(concurrency_input, 1, 64, 1)
+
+            current_provider["concurrent_requests"] = int(concurrency_input.text())
+
+            current_provider["cache"] = box.findChild(
+                QtWidgets.QCheckBox, box.title() + "_cache_check"
+            ).isChecked()
+
             endpoint_box = box.findChild(
                 QgsCollapsibleGroupBox, f"{box.title()}_provider_endpoints"
             )
@@ -118,25 +135,37 @@ class ORStoolsDialogConfigMain(QDialog, CONFIG_WIDGET):
                 ).text(),
             }
 
+            limits_box = box.findChild(QgsCollapsibleGroupBox, f"{box.title()}_provider_limits")
+            limits = {}
+            for limit_name in LIMITS:
+                limit_input = limits_box.findChild(
+                    QtWidgets.QLineEdit, f"{box.title()}_{limit_name}_limit"
+                )
+                if limit_input.validator().State != 2:
+                    self._clamp_input(limit_input, 1, 1000000, LIMITS[limit_name])
+                limits[limit_name] = int(limit_input.text())
+            current_provider["limits"] = limits
+
         configmanager.write_config(self.temp_config)
         self.close()
 
     @staticmethod
-    def _adjust_timeout_input(input_line_edit: QLineEdit) -> None:
+    def _clamp_input(input_line_edit: QLineEdit, bottom: int, top: int, default: int) -> None:
         """
-        Corrects the value of the input to the top or bottom value of
-        the specified range of the QIntValidator for the field.
-        Default to a timeout of 60 seconds if no value is given.
+        Corrects the value of the input to the bottom or top value of its range.
+        Defaults to the given value if no value is given.
         :param input_line_edit: QLineEdit object to adjust
+        :param bottom: lowest valid value
+        :param top: highest valid value
+        :param default: value of an empty input
         """
-        val = input_line_edit.validator()
         text = input_line_edit.text()
         if not text:
-            input_line_edit.setText("60")
-        elif int(text) < val.bottom():
-            input_line_edit.setText(str(val.bottom()))
-        elif int(text) > val.top():
-            input_line_edit.setText(str(val.top()))
+            input_line_edit.setText(str(default))
+        elif int(text) < bottom:
+            input_line_edit.setText(str(bottom))
+        elif int(text) > top:
+            input_line_edit.setText(str(top))
 
     def _build_ui(self) -> None:
         """Builds the UI on dialog startup."""
@@ -148,6 +177,9 @@ class ORStoolsDialogConfigMain(QDialog, CONFIG_WIDGET):
                 provider_entry["key"],
                 provider_entry["timeout"],
                 provider_entry["endpoints"],
+                provider_entry.get("concurrent_requests", 1),
+                provider_entry.get("cache", False),
+                {**LIMITS, **provider_entry.get("limits", {})},
                 new=False,
             )
 
@@ -167,7 +199,17 @@ class ORStoolsDialogConfigMain(QDialog, CONFIG_WIDGET):
             self, self.tr("New ORS provider"), self.tr("Enter a name for the provider")
         )
         if ok:
-            self._add_box(provider_name, "http://localhost:8082/ors", "", 60, ENDPOINTS, new=True)
+            self._add_box(
+                provider_name,
+                "http://localhost:8082/ors",
+                "",
+                60,
+                ENDPOINTS,
+                4,
+                False,
+                LIMITS,
+                new=True,
+            )
 
     def _remove_provider(self) -> None:
         """Remove list of providers from list."""
@@ -198,14 +240,33 @@ class ORStoolsDialogConfigMain(QDialog, CONFIG_WIDGET):
             box.setCollapsed(True)
 
     def _add_box(
-        self, name: str, url: str, key: str, timeout: int, endpoints: dict, new: bool = False
+        self,
+        name: str,
+        url: str,
+        key: str,
+        timeout: int,
+        endpoints: dict,
+        concurrent_requests: int = 1,
+        cache: bool = False,
+        limits: dict = None,
+        new: bool = False,
     ) -> None:
         """
         Adds a provider box to the QWidget layout and self.temp_config.
         """
+        limits = limits or LIMITS
         if new:
             self.temp_config["providers"].append(
-                dict(name=name, base_url=url, key=key, timeout=timeout, endpoints=endpoints)
+                dict(
+                    name=name,
+                    base_url=url,
+                    key=key,
+                    timeout=timeout,
+                    concurrent_requests=concurrent_requests,
+                    cache=cache,
+                    endpoints=endpoints,
+                    limits=limits,
+                )
             )
 
         provider = QgsCollapsibleGroupBox(self.providers)
@@ -248,12 +309,33 @@ class ORStoolsDialogConfigMain(QDialog, CONFIG_WIDGET):
         timeout_text.setValidator(QIntValidator(1, 3600, timeout_text))
         gridLayout_3.addWidget(timeout_text, 5, 0, 1, 4)
 
+        # Concurrent requests section
+        concurrency_label = QtWidgets.QLabel(provider)
+        concurrency_label.setObjectName("concurrent_requests_label")
+        concurrency_label.setText(self.tr("Concurrent requests in batch processing (1 - 64)"))
+        gridLayout_3.addWidget(concurrency_label, 6, 0, 1, 1)
+
+        concurrency_text = QtWidgets.QLineEdit(provider)
+        concurrency_text.setObjectName(name + "_concurrent_requests_text")
+        concurrency_text.setText(str(concurrent_requests))
+        concurrency_text.setValidator(QIntValidator(1, 64, concurrency_text))
+        gridLayout_3.addWidget(concurrency_text, 7, 0, 1, 4)
+
+        # Response cache section
+        cache_check = QtWidgets.QCheckBox(self.tr("Cache responses on disk"), provider)
+        cache_check.setObjectName(name + "_cache_check")
+        cache_check.setChecked(cache)
+        cache_check.setToolTip(
+            self.tr("Repeated requests with identical parameters are answered from a local cache.")
+        )
+        gridLayout_3.addWidget(cache_check, 8, 0, 1, 4)
+
         # Service Endpoints section
         endpoint_box = QgsCollapsibleGroupBox(provider)
         endpoint_box.setObjectName(name + "_provider_endpoints")
         endpoint_box.setTitle(self.tr("Service Endpoints"))
         endpoint_layout = QtWidgets.QGridLayout(endpoint_box)
-        gridLayout_3.addWidget(endpoint_box, 6, 0, 1, 4)
+        gridLayout_3.addWidget(endpoint_box, 9, 0, 1, 4)
 
         row = 0
         for endpoint_name, endpoint_value in endpoints.items():
@@ -269,6 +351,30 @@ class ORStoolsDialogConfigMain(QDialog, CONFIG_WIDGET):
 
             row += 1
 
+        # Request Limits section
+        limits_box = QgsCollapsibleGroupBox(provider)
+        limits_box.setObjectName(name + "_provider_limits")
+        limits_box.setTitle(self.tr("Request Limits"))
+        limits_layout = QtWidgets.QGridLayout(limits_box)
+        gridLayout_3.addWidget(limits_box, 10, 0, 1, 4)
+
+        limit_labels = {
+            "isochrones_locations": self.tr("Isochrones locations per request"),
+            "matrix_routes": self.tr("Matrix routes per request"),
+            "snap_locations": self.tr("Snap locations per request"),
+            "export_area_km2": self.tr("Export area per request in km²"),
+        }
+        for row, (limit_name, limit_value) in enumerate(limits.items()):
+            limit_label = QtWidgets.QLabel(limits_box)
+            limit_label.setText(limit_labels.get(limit_name, limit_name))
+            limits_layout.addWidget(limit_label, row, 0, 1, 1)
+
+            limit_lineedit = QtWidgets.QLineEdit(limits_box)
+            limit_lineedit.setText(str(limit_value))
+            limit_lineedit.setObjectName(f"{name}_{limit_name}_limit")
+            limit_lineedit.setValidator(QIntValidator(1, 1000000, limit_lineedit))
+            limits_layout.addWidget(limit_lineedit, row, 1, 1, 3)
+
         # Add reset buttons at the bottom
         button_layout = QtWidgets.QHBoxLayout()
 
@@ -284,10 +390,30 @@ class ORStoolsDialogConfigMain(QDialog, CONFIG_WIDGET):
         reset_endpoints_button.clicked.connect(self._reset_endpoints)
         button_layout.addWidget(reset_endpoints_button)
 
-        gridLayout_3.addLayout(button_layout, 7, 0, 1, 4)
+        clear_cache_button = QtWidgets.QPushButton(self.tr("Clear Cache"), provider)
+        clear_cache_button.setObjectName(name + "_clear_cache_button")
+        clear_cache_button.clicked.connect(lambda _, t=base_url_text: self._clear_cache(t.text()))
+        button_layout.addWidget(clear_cache_button)
+
+        gridLayout_3.addLayout(button_layout, 11, 0, 1, 4)
 
         self.verticalLayout.addWidget(provider)
 
+    def _clear_cache(self, base_url: str) -> None:
+        """Removes all cached responses of a provider."""
+        cache = get_response_cache()
+        entries = cache.stats()["entries"]
+        cache.clear(base_url)
+        stats = cache.stats()
+
+        QMessageBox.information(
+            self,
+            self.tr("Cache cleared"),
+            self.tr("Removed {} cached responses, {} remain for other providers.").format(
+                entries - stats["entries"], stats["entries"]
+            ),
+        )
+
     def _reset_endpoints(self) -> None:
         """Resets the endpoints to their original values."""
         for line_edit_remove in self.providers.findChildren(QLineEdit):
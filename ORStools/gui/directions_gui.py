@@ -27,40 +27,76 @@
  ***************************************************************************/
 """
 
+import hashlib
 import json
+import threading
+from collections import OrderedDict
 
+from qgis.core import QgsFeatureRequest, QgsGeometry, QgsVectorLayer
 from qgis.PyQt.QtWidgets import QCheckBox
 
 from ORStools.utils import transform
 
+# Approximate length of one degree of latitude, to apply simplification tolerances in meters
+METERS_PER_DEGREE = 111320
 
-def _get_avoid_polygons(layer):
+# Avoid polygons of the layers used last, see _get_avoid_polygons
+_avoid_polygons_cache = OrderedDict()
+_avoid_polygons_lock = threading.Lock()
+AVOID_POLYGONS_CACHE_SIZE = 8
+
+
+def _get_avoid_polygons(layer: QgsVectorLayer, tolerance: float = 0) -> dict:
     """
-    Extract polygon geometries from the selected polygon layer.
+    Extract polygon geometries from the selected polygon layer, dissolved into one geometry.
+
+    The result is cached per layer and geometries, which include uncommitted edits.
+    It is shared between calls and threads and must not be modified.
 
     :param layer: The polygon layer
     :type layer: QgsMapLayer
+
+    :param tolerance: simplification tolerance in meters to keep the request small, 0 to
+        keep all vertices
+    :type tolerance: float
+
     :returns: GeoJSON object
     :rtype: dict
     """
-    polygons = None
-    transformer = transform.transformToWGS(layer.sourceCrs())
-    features = layer.getFeatures()
-
-    # iterate over all other features
-    for feature in features:
+    # the features are read from the edit buffer if the layer is being edited
+    geometries = []
+    digest = hashlib.sha1()
+    for feature in layer.getFeatures(QgsFeatureRequest().setNoAttributes()):
         if feature.hasGeometry():
             geom = feature.geometry()
-            geom.transform(transformer)
-            if polygons is None:
-                polygons = geom
-            else:
-                polygons = polygons.combine(geom)
-
-    if not polygons:
-        return json.loads("{}")
-    else:
-        return json.loads(polygons.asJson())
+            digest.update(bytes(geom.asWkb()))
+            geometries.append(geom)
+
+    key = (layer.id(), layer.sourceCrs().authid(), digest.hexdigest(), tolerance)
+    with _avoid_polygons_lock:
+        if key in _avoid_polygons_cache:
+            _avoid_polygons_cache.move_to_end(key)
+            return _avoid_polygons_cache[key]
+
+    transformer = transform.transformToWGS(layer.sourceCrs())
+    for geom in geometries:
+        geom.transform(transformer)
+
+    polygons = {}
+    if geometries:
+        # dissolves all geometries at once instead of combining them one by one
+        geometry = QgsGeometry.unaryUnion(geometries)
+        if tolerance:
+            geometry = geometry.simplify(tolerance / METERS_PER_DEGREE)
+        if not geometry.isEmpty():
+            polygons = json.loads(geometry.asJson(6))
+
+    with _avoid_polygons_lock:
+        _avoid_polygons_cache[key] = polygons
+        if len(_avoid_polygons_cache) > AVOID_POLYGONS_CACHE_SIZE:
+            _avoid_polygons_cache.popitem(last=False)
+
+    return polygons
 
 
 def _get_avoid_options(avoid_boxes):
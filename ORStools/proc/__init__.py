@@ -36,6 +36,20 @@ ENDPOINTS = {
     "export": "export",
 }
 
+# Maximum number of locations, routes or square kilometers a provider accepts in a single request
+LIMITS = {
+    "isochrones_locations": 5,
+    "matrix_routes": 3500,
+    "snap_locations": 1000,
+    "export_area_km2": 100,
+}
+
+# Number of features collected before they are written to an output sink at once
+SINK_BATCH_SIZE = 1000
+
+# Seconds after which collected features are written anyway when results are shown while running
+LIVE_OUTPUT_INTERVAL = 2
+
 DEFAULT_SETTINGS = {
     "providers": [
         {
@@ -47,7 +61,10 @@ DEFAULT_SETTINGS = {
             "key": "",
             "name": "openrouteservice",
             "timeout": 60,
+            "concurrent_requests": 1,
+            "cache": False,
             "endpoints": ENDPOINTS,
+            "limits": LIMITS,
         }
     ]
 }
@@ -27,32 +27,245 @@
  ***************************************************************************/
 """
 
+import time
+from contextlib import nullcontext
 from datetime import datetime
 
-from qgis.PyQt.QtCore import QCoreApplication
+from qgis.PyQt.QtCore import QCoreApplication, QObject, pyqtSignal, pyqtSlot
 from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsFeature,
+    QgsFeatureSink,
+    QgsFields,
+    QgsMemoryProviderUtils,
     QgsProcessing,
     QgsProcessingAlgorithm,
     QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingParameterBoolean,
     QgsProcessingParameterDefinition,
     QgsProcessingParameterEnum,
     QgsProcessingParameterString,
     QgsProcessingParameterFeatureSink,
     QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterFileDestination,
+    QgsProcessingParameterNumber,
     QgsProcessingFeedback,
+    QgsProject,
     QgsSettings,
+    QgsWkbTypes,
 )
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from qgis.PyQt.QtGui import QIcon
 
 from ORStools import RESOURCE_PREFIX, __help__
-from ORStools.utils import configmanager
+from ORStools.utils import configmanager, logger
+from . import LIMITS, LIVE_OUTPUT_INTERVAL, SINK_BATCH_SIZE
+from ..common.journal import RequestJournal, get_journal_path
+from ..common.metrics import RunMetrics
 from ..common import client, PROFILES, AVOID_BORDERS, AVOID_FEATURES, ADVANCED_PARAMETERS
 from ..utils.processing import read_help_file
 from ..gui.directions_gui import _get_avoid_polygons
 
 
+class BufferedSink:
+    """Collects features and writes them to a feature sink in batches.
+
+    Offers addFeature and addFeatures like the wrapped sink, so it can replace it in the
+    request loops. Sinks of GeoPackages or databases are a lot faster with few large inserts.
+    """
+
+    def __init__(
+        self,
+        sink: QgsFeatureSink,
+        batch_size: int = SINK_BATCH_SIZE,
+        metrics: Optional[RunMetrics] = None,
+        interval: Optional[float] = None,
+    ) -> None:
+        """
+        :param sink: output sink of the algorithm
+        :type sink: QgsFeatureSink
+
+        :param batch_size: number of features written at once
+        :type batch_size: int
+
+        :param metrics: metrics of the run the writing time is added to
+        :type metrics: RunMetrics or None
+
+        :param interval: seconds after which collected features are written even if the
+            batch is not full, e.g. to show them while the algorithm runs
+        :type interval: float or None
+        """
+        self.sink = sink
+        self.batch_size = max(1, batch_size)
+        self.metrics = metrics
+        self.interval = interval
+        self.features = []
+        self.count = 0
+        self.write_time = 0.0
+        self.last_flush = time.monotonic()
+
+    def addFeature(self, feature: QgsFeature, flags: Any = None) -> bool:
+        self.features.append(feature)
+        if self._is_due():
+            self.flush()
+        return True
+
+    def addFeatures(self, features: Iterable[QgsFeature], flags: Any = None) -> bool:
+        self.features.extend(features)
+        if self._is_due():
+            self.flush()
+        return True
+
+    def _is_due(self) -> bool:
+        return len(self.features) >= self.batch_size or (
+            self.interval is not None and time.monotonic() - self.last_flush >= self.interval
+        )
+
+    def flush(self) -> None:
+        """
+        Writes all collected features to the sink.
+
+        :raises QgsProcessingException: if the sink fails to write the features
+        """
+        self.last_flush = time.monotonic()
+        if not self.features:
+            return
+
+        start = time.perf_counter()
+        # excluded from the phase the features were added in, e.g. build_features
+        with self.metrics.timer("write_sink") if self.metrics else nullcontext():
+            written = self.sink.addFeatures(self.features, QgsFeatureSink.Flag.FastInsert)
+        self.write_time += time.perf_counter() - start
+        if not written:
+            raise QgsProcessingException(
+                f"Failed to write features to the output: {self.sink.lastError()}"
+            )
+
+        self.count += len(self.features)
+        self.features = []
+
+
+class LiveOutput(QObject):
+    """Shows the features an algorithm writes to its output sinks in memory layers while it runs.
+
+    Processing algorithms run in a background task and their outputs are only loaded once they
+    finished. The features written to the sinks are sent to the main thread instead, which adds
+    them to a memory layer per sink in the project. The layers keep the partial result of a
+    cancelled or failed run, after a completed run they make way for the outputs loaded into
+    the project.
+    """
+
+    layerRequested = pyqtSignal(str, str, object, object, object)
+    featuresWritten = pyqtSignal(str, object)
+
+    def __init__(self, project: QgsProject) -> None:
+        """
+        :param project: project the layers are added to
+        :type project: QgsProject
+        """
+        QObject.__init__(self)
+        # the layers are handled in the main thread, wherever the algorithm is prepared
+        self.moveToThread(QCoreApplication.instance().thread())
+        self.project = project
+        self.layer_ids: Dict[str, str] = dict()
+        self.dest_ids: Dict[str, str] = dict()
+        self.layerRequested.connect(self._add_layer)
+        self.featuresWritten.connect(self._add_features)
+
+    def wrap(
+        self,
+        sink: QgsFeatureSink,
+        dest_id: str,
+        name: str,
+        title: str,
+        fields: QgsFields,
+        geometry_type: QgsWkbTypes.Type,
+        crs: QgsCoordinateReferenceSystem,
+    ) -> "LiveSink":
+        """
+        Adds a layer for an output sink and returns the sink passing its features on to it.
+
+        :param sink: output sink of the algorithm
+        :type sink: QgsFeatureSink
+
+        :param dest_id: ID of the output layer of the sink
+        :type dest_id: str
+
+        :param name: name of the sink parameter
+        :type name: str
+
+        :param title: name of the layer
+        :type title: str
+        """
+        self.dest_ids[name] = dest_id
+        self.layerRequested.emit(name, title, QgsFields(fields), geometry_type, crs)
+        return LiveSink(sink, name, self)
+
+    def remove_layers(self, loaded: Iterable[str]) -> None:
+        """
+        Removes the layers of the outputs which are loaded into the project instead.
+
+        :param loaded: IDs of the output layers loaded on completion
+        :type loaded: list
+        """
+        loaded = set(loaded)
+        for name, layer_id in list(self.layer_ids.items()):
+            if self.dest_ids[name] in loaded:
+                if self.project.mapLayer(layer_id):
+                    self.project.removeMapLayer(layer_id)
+                del self.layer_ids[name]
+
+    @pyqtSlot(str, str, object, object, object)
+    def _add_layer(
+        self,
+        name: str,
+        title: str,
+        fields: QgsFields,
+        geometry_type: QgsWkbTypes.Type,
+        crs: QgsCoordinateReferenceSystem,
+    ) -> None:
+        layer = QgsMemoryProviderUtils.createMemoryLayer(title, fields, geometry_type, crs)
+        self.project.addMapLayer(layer)
+        self.layer_ids[name] = layer.id()
+
+    @pyqtSlot(str, object)
+    def _add_features(self, name: str, features: List[QgsFeature]) -> None:
+        # the layer may have been removed by the user or after the run
+        layer = self.project.mapLayer(self.layer_ids.get(name, ""))
+        if layer is None:
+            return
+        layer.dataProvider().addFeatures(features)
+        layer.updateExtents()
+        layer.triggerRepaint()
+
+
+class LiveSink:
+    """Writes features to an output sink and sends them on to the live layer of the sink,
+    see LiveOutput."""
+
+    def __init__(self, sink: QgsFeatureSink, name: str, live_output: LiveOutput) -> None:
+        self.sink = sink
+        self.name = name
+        self.live_output = live_output
+
+    def addFeature(self, feature: QgsFeature, flags: Any = QgsFeatureSink.Flag(0)) -> bool:
+        return self.addFeatures([feature], flags)
+
+    def addFeatures(
+        self, features: Iterable[QgsFeature], flags: Any = QgsFeatureSink.Flag(0)
+    ) -> bool:
+        features = list(features)
+        written = self.sink.addFeatures(features, flags)
+        if written:
+            self.live_output.featuresWritten.emit(self.name, features)
+        return written
+
+    def lastError(self) -> str:
+        return self.sink.lastError()
+
+
 # noinspection PyPep8Naming
 class ORSBaseProcessingAlgorithm(QgsProcessingAlgorithm):
     """Base algorithm class for ORS algorithms"""
@@ -70,9 +283,18 @@ class ORSBaseProcessingAlgorithm(QgsProcessingAlgorithm):
         self.IN_AVOID_BORDERS = "INPUT_AVOID_BORDERS"
         self.IN_AVOID_COUNTRIES = "INPUT_AVOID_COUNTRIES"
         self.IN_AVOID_POLYGONS = "INPUT_AVOID_POLYGONS"
+        self.IN_AVOID_POLYGONS_TOLERANCE = "INPUT_AVOID_POLYGONS_TOLERANCE"
+        self.IN_RESUME = "INPUT_RESUME"
+        self.OUT_JOURNAL = "OUTPUT_JOURNAL"
+        self.OUT_METRICS = "OUTPUT_METRICS"
+        self.IN_LIVE_OUTPUT = "INPUT_LIVE_OUTPUT"
         self.OUT = "OUTPUT"
         self.OUT_NAME = "ORSTOOLS_OUTPUT"
         self.PARAMETERS = None
+        self.metrics = RunMetrics()
+        self.metrics_path = ""
+        self.results: Dict[str, Any] = {}
+        self.live_output: Optional[LiveOutput] = None
 
     def createInstance(self) -> Any:
         """
@@ -160,6 +382,48 @@ class ORSBaseProcessingAlgorithm(QgsProcessingAlgorithm):
 
         return parameter
 
+    def metrics_parameter(self) -> QgsProcessingParameterFileDestination:
+        """
+        Parameter definition for the run metrics file, used in all child classes
+        """
+        parameter = QgsProcessingParameterFileDestination(
+            self.OUT_METRICS,
+            self.tr("Run metrics file", "ORSBaseProcessingAlgorithm"),
+            fileFilter=self.tr("JSON (*.json)", "ORSBaseProcessingAlgorithm"),
+            optional=True,
+            createByDefault=False,
+        )
+        parameter.setFlags(parameter.flags() | QgsProcessingParameterDefinition.Flag.FlagAdvanced)
+        self.setToolTip(
+            parameter,
+            self.tr(
+                "Saves the time spent per phase, the latency per endpoint, transferred bytes, retries and cache hits of the run.",
+                "ORSBaseProcessingAlgorithm",
+            ),
+        )
+
+        return parameter
+
+    def live_output_parameter(self) -> QgsProcessingParameterBoolean:
+        """
+        Parameter definition to show the output while running, used in all child classes
+        """
+        parameter = QgsProcessingParameterBoolean(
+            self.IN_LIVE_OUTPUT,
+            self.tr("Show results while running", "ORSBaseProcessingAlgorithm"),
+            defaultValue=False,
+        )
+        parameter.setFlags(parameter.flags() | QgsProcessingParameterDefinition.Flag.FlagAdvanced)
+        self.setToolTip(
+            parameter,
+            self.tr(
+                "Adds the features to a temporary layer as they are received. If the run is cancelled or fails, the layer keeps the partial result.",
+                "ORSBaseProcessingAlgorithm",
+            ),
+        )
+
+        return parameter
+
     def option_parameters(self) -> [QgsProcessingParameterDefinition]:
         parameters = [
             QgsProcessingParameterEnum(
@@ -192,6 +456,14 @@ class ORSBaseProcessingAlgorithm(QgsProcessingAlgorithm):
                 types=[QgsProcessing.SourceType.TypeVectorPolygon],
                 optional=True,
             ),
+            QgsProcessingParameterNumber(
+                self.IN_AVOID_POLYGONS_TOLERANCE,
+                self.tr("Simplify polygons to avoid [m]", "ORSBaseProcessingAlgorithm"),
+                type=QgsProcessingParameterNumber.Type.Double,
+                minValue=0,
+                defaultValue=0,
+                optional=True,
+            ),
         ]
 
         self.setToolTip(
@@ -206,14 +478,150 @@ class ORSBaseProcessingAlgorithm(QgsProcessingAlgorithm):
         self.setToolTip(
             parameters[3], self.tr("Select polygons that should be avoided by the algorithm.")
         )
+        self.setToolTip(
+            parameters[4],
+            self.tr(
+                "Tolerance to simplify detailed polygons to avoid with, to keep the request within the limits of the provider."
+            ),
+        )
 
         return parameters
 
+    def journal_parameters(self) -> [QgsProcessingParameterDefinition]:
+        """
+        Parameter definitions to checkpoint and resume long running batch algorithms
+        """
+        parameters = [
+            QgsProcessingParameterBoolean(
+                self.IN_RESUME,
+                self.tr("Resume from journal", "ORSBaseProcessingAlgorithm"),
+                defaultValue=False,
+            ),
+            QgsProcessingParameterFileDestination(
+                self.OUT_JOURNAL,
+                self.tr("Journal file", "ORSBaseProcessingAlgorithm"),
+                fileFilter=self.tr("JSON lines (*.jsonl)", "ORSBaseProcessingAlgorithm"),
+                optional=True,
+                createByDefault=False,
+            ),
+        ]
+
+        self.setToolTip(
+            parameters[0],
+            self.tr(
+                "Skip the requests recorded in the journal of a cancelled or failed run and copy their features to the output."
+            ),
+        )
+        self.setToolTip(
+            parameters[1],
+            self.tr(
+                "Records completed requests. Defaults to a .journal.jsonl file next to the output if it is saved to a file. Deleted once all requests completed."
+            ),
+        )
+
+        return parameters
+
+    def get_journal(
+        self, parameters: dict, context: QgsProcessingContext, feedback: QgsProcessingFeedback
+    ) -> Optional[RequestJournal]:
+        """
+        Opens the journal of the run, None if neither a journal file is set nor the output is
+        saved to a file.
+        """
+        path = self.parameterAsFileOutput(parameters, self.OUT_JOURNAL, context)
+        if not path:
+            path = get_journal_path(self.parameterAsOutputLayer(parameters, self.OUT, context))
+        if not path:
+            feedback.pushInfo(
+                self.tr("Set a journal file or save the output to a file to be able to resume.")
+            )
+            return None
+
+        resume = self.parameterAsBool(parameters, self.IN_RESUME, context)
+        try:
+            journal = RequestJournal(path, self.ALGO_NAME, resume)
+        except (OSError, ValueError) as e:
+            raise QgsProcessingException(str(e))
+
+        if resume:
+            feedback.pushInfo(
+                self.tr("Resuming with {} completed requests from {}").format(len(journal), path)
+            )
+        return journal
+
+    def close_journal(
+        self,
+        journal: Optional[RequestJournal],
+        feedback: QgsProcessingFeedback,
+        complete: bool,
+    ) -> None:
+        """
+        Closes the journal of a run. It is deleted if all requests completed, so only
+        cancelled or partly failed runs leave a journal to resume from.
+        """
+        if journal is None:
+            return
+
+        if complete and not feedback.isCanceled():
+            journal.remove()
+        else:
+            journal.close()
+
+    def buffered_sink(
+        self, sink: QgsFeatureSink, batch_size: int = SINK_BATCH_SIZE
+    ) -> BufferedSink:
+        """
+        Wraps an output sink to write its features in batches, see close_sink.
+        """
+        interval = LIVE_OUTPUT_INTERVAL if self.live_output else None
+        return BufferedSink(sink, batch_size, self.metrics, interval)
+
+    def parameterAsSink(
+        self,
+        parameters: dict,
+        name: str,
+        context: QgsProcessingContext,
+        fields: QgsFields,
+        geometryType: QgsWkbTypes.Type = QgsWkbTypes.Type.NoGeometry,
+        crs: QgsCoordinateReferenceSystem = QgsCoordinateReferenceSystem(),
+        *args,
+    ) -> Tuple[Optional[QgsFeatureSink], str]:
+        """
+        Creates an output sink, which also adds its features to a live layer if results are
+        shown while running.
+        """
+        sink, dest_id = super().parameterAsSink(
+            parameters, name, context, fields, geometryType, crs, *args
+        )
+        if self.live_output is not None and sink is not None:
+            title = self.parameterDefinition(name).description()
+            sink = self.live_output.wrap(sink, dest_id, name, title, fields, geometryType, crs)
+
+        return sink, dest_id
+
+    def close_sink(self, sink: BufferedSink, feedback: QgsProcessingFeedback) -> None:
+        """
+        Writes the remaining features of a buffered sink and reports the time spent writing.
+        """
+        sink.flush()
+        feedback.pushInfo(
+            self.tr("Wrote {} features in {:.2f} s").format(sink.count, sink.write_time)
+        )
+
     def get_endpoint_names_from_provider(self, provider: str) -> dict:
         providers = configmanager.read_config()["providers"]
         ors_provider = providers[provider]
         return ors_provider["endpoints"]
 
+    def get_limits_from_provider(self, provider: str) -> dict:
+        """
+        Returns the request limits of a provider, completed by the default limits
+        for providers configured before a limit was introduced.
+        """
+        providers = configmanager.read_config()["providers"]
+        ors_provider = providers[provider]
+        return {**LIMITS, **ors_provider.get("limits", {})}
+
     @classmethod
     def _get_ors_client_from_provider(
         cls, provider: str, feedback: QgsProcessingFeedback
@@ -254,10 +662,62 @@ class ORSBaseProcessingAlgorithm(QgsProcessingAlgorithm):
 
         polygons_layer = self.parameterAsLayer(parameters, self.IN_AVOID_POLYGONS, context)
         if polygons_layer:
-            options["avoid_polygons"] = _get_avoid_polygons(polygons_layer)
+            options["avoid_polygons"] = _get_avoid_polygons(
+                polygons_layer,
+                self.parameterAsDouble(parameters, self.IN_AVOID_POLYGONS_TOLERANCE, context),
+            )
 
         return options
 
+    def prepareAlgorithm(
+        self, parameters: dict, context: QgsProcessingContext, feedback: QgsProcessingFeedback
+    ) -> bool:
+        """
+        Starts the metrics of a run and the live layers if results are shown while running.
+        """
+        self.metrics = RunMetrics()
+        self.metrics_path = self.parameterAsFileOutput(parameters, self.OUT_METRICS, context)
+        self.results = {}
+        self.live_output = None
+        if self.parameterAsBool(parameters, self.IN_LIVE_OUTPUT, context):
+            self.live_output = LiveOutput(context.project() or QgsProject.instance())
+
+        return True
+
+    def store_results(self, results: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Keeps the results of processAlgorithm for postProcessAlgorithm, whose results replace
+        them in QGIS if they are not empty.
+        """
+        self.results = results
+        return results
+
+    def postProcessAlgorithm(
+        self, context: QgsProcessingContext, feedback: QgsProcessingFeedback
+    ) -> Dict[str, str]:
+        """
+        Reports the metrics of the run to the log and feedback, and writes them to the
+        metrics file if one is set. The live layers make way for the loaded outputs.
+        """
+        if self.live_output is not None:
+            self.live_output.remove_layers(context.layersToLoadOnCompletion().keys())
+
+        report = "\n".join(self.metrics.report())
+        feedback.pushInfo(self.tr("Run metrics:\n{}").format(report))
+        logger.log(f"{self.ALGO_NAME} run metrics:\n{report}", 0)
+
+        if self.metrics_path:
+            try:
+                self.metrics.write(self.metrics_path)
+            except OSError as e:
+                feedback.reportError(
+                    self.tr("Could not write run metrics to {}: {}").format(self.metrics_path, e)
+                )
+                return {}
+            return {**self.results, self.OUT_METRICS: self.metrics_path}
+
+        return {}
+
     def get_client(
         self, parameters: dict, context: QgsProcessingContext, feedback: QgsProcessingFeedback
     ) -> client.Client:
@@ -266,6 +726,7 @@ class ORSBaseProcessingAlgorithm(QgsProcessingAlgorithm):
         """
         ors_client = self._get_ors_client_from_provider(parameters[self.IN_PROVIDER], feedback)
         ors_client.downloadProgress.connect(feedback.setProgress)
+        ors_client.metrics = self.metrics
 
         return ors_client
 
@@ -275,7 +736,14 @@ class ORSBaseProcessingAlgorithm(QgsProcessingAlgorithm):
         Combines default and algorithm parameters and adds them in order to the
         algorithm dialog window.
         """
-        if self.ALGO_NAME not in [
+        if self.ALGO_NAME == "routing_from_graph":
+            # runs on a local graph file without a provider
+            parameters = self.PARAMETERS + [
+                self.output_parameter(),
+                self.live_output_parameter(),
+                self.metrics_parameter(),
+            ]
+        elif self.ALGO_NAME not in [
             "snap_from_point_layer",
             "snap_from_point",
             "export_network_from_map",
@@ -284,13 +752,13 @@ class ORSBaseProcessingAlgorithm(QgsProcessingAlgorithm):
                 [self.provider_parameter(), self.profile_parameter()]
                 + self.PARAMETERS
                 + self.option_parameters()
-                + [self.output_parameter()]
+                + [self.output_parameter(), self.live_output_parameter(), self.metrics_parameter()]
             )
         else:
             parameters = (
                 [self.provider_parameter(), self.profile_parameter()]
                 + self.PARAMETERS
-                + [self.output_parameter()]
+                + [self.output_parameter(), self.live_output_parameter(), self.metrics_parameter()]
             )
         for param in parameters:
             if param.name() in ADVANCED_PARAMETERS:
@@ -51,7 +51,8 @@ from qgis.core import (
 
 from qgis.PyQt.QtGui import QIcon
 from ORStools.common import directions_core, PROFILES, PREFERENCES, OPTIMIZATION_MODES, EXTRA_INFOS
-from ORStools.utils import transform, exceptions, logger
+from ORStools.common.journal import RequestJournal
+from ORStools.utils import transform, logger
 from .base_processing_algorithm import ORSBaseProcessingAlgorithm
 from ..utils.processing import get_params_optimize
 from ..utils.gui import GuiUtils
@@ -74,6 +75,7 @@ class ORSDirectionsLinesAlgo(ORSBaseProcessingAlgorithm):
         self.EXTRA_INFO: str = "EXTRA_INFO"
         self.CSV_FACTOR: str = "CSV_FACTOR"
         self.CSV_COLUMN: str = "CSV_COLUMN"
+        self.MERGE_EXTRA_INFO: str = "MERGE_EXTRA_INFO"
         self.OUT_NAME: str = "Directions_Lines"
         self.PARAMETERS: List = [
             QgsProcessingParameterFeatureSource(
@@ -123,6 +125,11 @@ class ORSDirectionsLinesAlgo(ORSBaseProcessingAlgorithm):
                 optional=True,
             ),
             QgsProcessingParameterBoolean(self.EXPORT_ORDER, self.tr("Export order of jobs")),
+            QgsProcessingParameterBoolean(
+                self.MERGE_EXTRA_INFO,
+                self.tr("Merge consecutive segments with identical Extra Info"),
+                defaultValue=False,
+            ),
         ]
 
         self.setToolTip(self.PARAMETERS[0], "LineString or MultiLineString layer.")
@@ -142,6 +149,7 @@ class ORSDirectionsLinesAlgo(ORSBaseProcessingAlgorithm):
                 "You can optionally perform a Traveling Salesman on the waypoints of each MultiPoint feature. Enabling Traveling Salesman will erase all other advanced configuration and assume the preference to be fastest Advanced Parameters: see the documentation for descriptions."
             ),
         )
+        self.PARAMETERS += self.journal_parameters()
 
     def processAlgorithm(
         self, parameters: dict, context: QgsProcessingContext, feedback: QgsProcessingFeedback
@@ -162,6 +170,7 @@ class ORSDirectionsLinesAlgo(ORSBaseProcessingAlgorithm):
 
         extra_info = self.parameterAsEnums(parameters, self.EXTRA_INFO, context)
         extra_info = [EXTRA_INFOS[i] for i in extra_info]
+        merge_runs = self.parameterAsBool(parameters, self.MERGE_EXTRA_INFO, context)
 
         # Get parameter values
         source = self.parameterAsSource(parameters, self.IN_LINES, context)
@@ -182,7 +191,7 @@ class ORSDirectionsLinesAlgo(ORSBaseProcessingAlgorithm):
             )
 
         sink_fields = directions_core.get_fields(
-            **get_fields_options, line=True, extra_info=extra_info
+            **get_fields_options, line=True, extra_info=extra_info, merge_runs=merge_runs
         )
 
         (sink, dest_id) = self.parameterAsSink(
@@ -193,84 +202,107 @@ class ORSDirectionsLinesAlgo(ORSBaseProcessingAlgorithm):
             source.wkbType(),
             QgsCoordinateReferenceSystem.fromEpsgId(4326),
         )
+        sink = self.buffered_sink(sink)
         count = source.featureCount()
 
-        for num, (line, field_value) in enumerate(
-            self._get_sorted_lines(source, source_field_name)
+        endpoints = self.get_endpoint_names_from_provider(parameters[self.IN_PROVIDER])
+        if optimization_mode is not None:
+            url = f"/{endpoints['optimization']}/"
+        else:
+            url = f"/v2/{endpoints['directions']}/{profile}/geojson"
+
+        # Routes completed by a previous run are replayed instead of requested again
+        journal = self.get_journal(parameters, context, feedback)
+        if journal:
+            for feat in journal.replay():
+                sink.addFeature(feat)
+
+        def get_requests():
+            for num, (line, field_value) in enumerate(
+                self._get_sorted_lines(source, source_field_name)
+            ):
+                if optimization_mode is not None:
+                    params = get_params_optimize(line, profile, optimization_mode)
+                else:
+                    params = directions_core.build_default_parameters(
+                        preference, point_list=line, options=options, extra_info=extra_info
+                    )
+                key = RequestJournal.make_key(url, params, [num, field_value])
+                if journal and key in journal:
+                    continue
+                yield (num, field_value, key), params
+
+        failed = False
+        for (num, field_value, key), response in ors_client.fetch_concurrently(
+            url, {}, get_requests()
         ):
             # Stop the algorithm if cancel button has been clicked
             if feedback.isCanceled():
                 break
 
-            try:
-                if optimization_mode is not None:
-                    params = get_params_optimize(line, profile, optimization_mode)
-                    endpoint = self.get_endpoint_names_from_provider(parameters[self.IN_PROVIDER])[
-                        "optimization"
-                    ]
-                    response = ors_client.fetch_with_retry(f"/{endpoint}/", {}, post_json=params)
+            if isinstance(response, Exception):
+                failed = True
+                msg = f"Feature ID {num} caused a {response.__class__.__name__}:\n{str(response)}"
+                feedback.reportError(msg)
+                logger.log(msg)
+                continue
 
-                    sink.addFeature(
+            if optimization_mode is not None:
+                with self.metrics.timer("build_features"):
+                    feats = [
                         directions_core.get_output_features_optimization(
                             response, profile, from_value=field_value
                         )
-                    )
-
-                    # Export layer of points with optimization order
-                    export_value = self.parameterAsBool(parameters, self.EXPORT_ORDER, context)
-                    if export_value:
-                        items = list()
-                        for route in response["routes"]:
-                            for i, step in enumerate(route["steps"]):
-                                location = step["location"]
-                                items.append(location)
-
-                        point_layer = QgsVectorLayer(
-                            "point?crs=epsg:4326&field=ID:integer", "Steps", "memory"
-                        )
+                    ]
 
-                        point_layer.updateFields()
-                        for idx, coords in enumerate(items):
-                            x, y = coords
-                            feature = QgsFeature()
-                            feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
-                            feature.setAttributes([idx])
+                # Export layer of points with optimization order
+                export_value = self.parameterAsBool(parameters, self.EXPORT_ORDER, context)
+                if export_value:
+                    items = list()
+                    for route in response["routes"]:
+                        for i, step in enumerate(route["steps"]):
+                            location = step["location"]
+                            items.append(location)
+
+                    point_layer = QgsVectorLayer(
+                        "point?crs=epsg:4326&field=ID:integer", "Steps", "memory"
+                    )
 
-                            point_layer.dataProvider().addFeature(feature)
-                        QgsProject.instance().addMapLayer(point_layer)
+                    point_layer.updateFields()
+                    for idx, coords in enumerate(items):
+                        x, y = coords
+                        feature = QgsFeature()
+                        feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+                        feature.setAttributes([idx])
 
-                else:
-                    params = directions_core.build_default_parameters(
-                        preference, point_list=line, options=options, extra_info=extra_info
-                    )
-                    endpoint = self.get_endpoint_names_from_provider(parameters[self.IN_PROVIDER])[
-                        "directions"
-                    ]
-                    response = ors_client.fetch_with_retry(
-                        f"/v2/{endpoint}/{profile}/geojson", {}, post_json=params
-                    )
+                        point_layer.dataProvider().addFeature(feature)
+                    QgsProject.instance().addMapLayer(point_layer)
 
+            else:
+                with self.metrics.timer("build_features"):
                     if extra_info:
                         feats = directions_core.get_extra_info_features_directions(
-                            response, extra_info
+                            response, extra_info, merge_runs=merge_runs
                         )
-                        for feat in feats:
-                            sink.addFeature(feat)
                     else:
-                        sink.addFeature(
+                        feats = [
                             directions_core.get_output_feature_directions(
                                 response, profile, preference, from_value=field_value
                             )
-                        )
-            except (exceptions.ApiError, exceptions.InvalidKey, exceptions.GenericServerError) as e:
-                msg = f"Feature ID {num} caused a {e.__class__.__name__}:\n{str(e)}"
-                feedback.reportError(msg)
-                logger.log(msg)
-                continue
+                        ]
+
+            for feat in feats:
+                sink.addFeature(feat)
+            # the point layer of the optimization order is not journaled
+            if journal:
+                journal.write(key, feats)
 
             feedback.setProgress(int(100.0 / count * num))
 
-        return {self.OUT: dest_id}
+        self.close_sink(sink, feedback)
+        self.close_journal(journal, feedback, complete=not failed)
+
+        return self.store_results({self.OUT: dest_id})
 
     @staticmethod
     def _get_sorted_lines(layer: QgsProcessingFeatureSource, field_name: str) -> Generator:
@@ -73,6 +73,7 @@ class ORSDirectionsPointsLayerAlgo(ORSBaseProcessingAlgorithm):
         self.EXTRA_INFO: str = "EXTRA_INFO"
         self.CSV_FACTOR: str = "CSV_FACTOR"
         self.CSV_COLUMN: str = "CSV_COLUMN"
+        self.MERGE_EXTRA_INFO: str = "MERGE_EXTRA_INFO"
         self.EXPORT_ORDER: str = "EXPORT_ORDER"
         self.OUT_NAME: str = "Directions_Layer"
         self.PARAMETERS: List = [
@@ -130,6 +131,11 @@ class ORSDirectionsPointsLayerAlgo(ORSBaseProcessingAlgorithm):
                 optional=True,
             ),
             QgsProcessingParameterBoolean(self.EXPORT_ORDER, self.tr("Export order of jobs")),
+            QgsProcessingParameterBoolean(
+                self.MERGE_EXTRA_INFO,
+                self.tr("Merge consecutive segments with identical Extra Info"),
+                defaultValue=False,
+            ),
         ]
 
         self.setToolTip(self.PARAMETERS[0], self.tr("Point or MultiPoint layer."))
@@ -179,6 +185,7 @@ class ORSDirectionsPointsLayerAlgo(ORSBaseProcessingAlgorithm):
 
         extra_info = self.parameterAsEnums(parameters, self.EXTRA_INFO, context)
         extra_info = [EXTRA_INFOS[i] for i in extra_info]
+        merge_runs = self.parameterAsBool(parameters, self.MERGE_EXTRA_INFO, context)
 
         # Get parameter values
         source = self.parameterAsSource(parameters, self.IN_POINTS, context)
@@ -192,7 +199,7 @@ class ORSDirectionsPointsLayerAlgo(ORSBaseProcessingAlgorithm):
             )
 
         sink_fields = directions_core.get_fields(
-            **get_fields_options, line=True, extra_info=extra_info
+            **get_fields_options, line=True, extra_info=extra_info, merge_runs=merge_runs
         )
 
         (sink, dest_id) = self.parameterAsSink(
@@ -203,6 +210,7 @@ class ORSDirectionsPointsLayerAlgo(ORSBaseProcessingAlgorithm):
             QgsWkbTypes.Type.LineString,
             QgsCoordinateReferenceSystem.fromEpsgId(4326),
         )
+        sink = self.buffered_sink(sink)
 
         sort_by = parameters[self.IN_SORTBY]
 
@@ -235,6 +243,8 @@ class ORSDirectionsPointsLayerAlgo(ORSBaseProcessingAlgorithm):
                 from_values.append(feat[source_field_name] if source_field_name else None)
             input_points = [input_points]
 
+        endpoints = self.get_endpoint_names_from_provider(parameters[self.IN_PROVIDER])
+
         for num, (points, from_value) in enumerate(zip(input_points, from_values)):
             # Stop the algorithm if cancel button has been clicked
             if feedback.isCanceled():
@@ -252,10 +262,9 @@ class ORSDirectionsPointsLayerAlgo(ORSBaseProcessingAlgorithm):
                         )
 
                     params = get_params_optimize(points, profile, optimization_mode)
-                    endpoint = self.get_endpoint_names_from_provider(parameters[self.IN_PROVIDER])[
-                        "optimization"
-                    ]
-                    response = ors_client.fetch_with_retry(f"/{endpoint}/", {}, post_json=params)
+                    response = ors_client.fetch_with_retry(
+                        f"/{endpoints['optimization']}/", {}, post_json=params
+                    )
 
                     sink.addFeature(
                         directions_core.get_output_features_optimization(
@@ -290,16 +299,13 @@ class ORSDirectionsPointsLayerAlgo(ORSBaseProcessingAlgorithm):
                     params = directions_core.build_default_parameters(
                         preference, point_list=points, options=options, extra_info=extra_info
                     )
-                    endpoint = self.get_endpoint_names_from_provider(parameters[self.IN_PROVIDER])[
-                        "directions"
-                    ]
                     response = ors_client.fetch_with_retry(
-                        f"/v2/{endpoint}/{profile}/geojson", {}, post_json=params
+                        f"/v2/{endpoints['directions']}/{profile}/geojson", {}, post_json=params
                     )
 
                     if extra_info:
                         feats = directions_core.get_extra_info_features_directions(
-                            response, extra_info
+                            response, extra_info, merge_runs=merge_runs
                         )
                         for feat in feats:
                             sink.addFeature(feat)
@@ -317,7 +323,9 @@ class ORSDirectionsPointsLayerAlgo(ORSBaseProcessingAlgorithm):
 
             feedback.setProgress(int(100.0 / count * num))
 
-        return {self.OUT: dest_id}
+        self.close_sink(sink, feedback)
+
+        return self.store_results({self.OUT: dest_id})
 
     def displayName(self) -> str:
         """
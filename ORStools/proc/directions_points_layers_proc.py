@@ -36,6 +36,7 @@ from qgis.core import (
     QgsWkbTypes,
     QgsCoordinateReferenceSystem,
     QgsProcessing,
+    QgsProcessingParameterBoolean,
     QgsProcessingParameterField,
     QgsProcessingParameterFeatureSource,
     QgsProcessingParameterEnum,
@@ -47,7 +48,8 @@ from qgis.core import (
 )
 
 from ORStools.common import directions_core, PROFILES, PREFERENCES, EXTRA_INFOS
-from ORStools.utils import transform, exceptions, logger
+from ORStools.common.journal import RequestJournal
+from ORStools.utils import transform, logger, spatial
 from .base_processing_algorithm import ORSBaseProcessingAlgorithm
 
 
@@ -66,9 +68,14 @@ class ORSDirectionsPointsLayersAlgo(ORSBaseProcessingAlgorithm):
         self.IN_SORT_END_BY: str = "INPUT_SORT_END_BY"
         self.IN_PREFERENCE: str = "INPUT_PREFERENCE"
         self.IN_MODE: str = "INPUT_MODE"
+        self.IN_K_NEAREST: str = "INPUT_K_NEAREST"
+        self.IN_MAX_CROW_DISTANCE: str = "INPUT_MAX_CROW_DISTANCE"
+        self.IN_EXCLUDE_SAME_ID: str = "INPUT_EXCLUDE_SAME_ID"
+        self.IN_SKIP_REVERSE_PAIRS: str = "INPUT_SKIP_REVERSE_PAIRS"
         self.EXTRA_INFO: str = "EXTRA_INFO"
         self.CSV_FACTOR: str = "CSV_FACTOR"
         self.CSV_COLUMN: str = "CSV_COLUMN"
+        self.MERGE_EXTRA_INFO: str = "MERGE_EXTRA_INFO"
         self.OUT_NAME: str = "Directions_Layers"
         self.PARAMETERS: list = [
             QgsProcessingParameterFeatureSource(
@@ -121,6 +128,13 @@ class ORSDirectionsPointsLayersAlgo(ORSBaseProcessingAlgorithm):
                 self.MODE_SELECTION,
                 defaultValue=self.MODE_SELECTION[0],
             ),
+            QgsProcessingParameterNumber(
+                self.IN_K_NEAREST,
+                self.tr("All-by-All: only route to the k nearest end points (0 = all)"),
+                type=QgsProcessingParameterNumber.Type.Integer,
+                minValue=0,
+                defaultValue=0,
+            ),
             QgsProcessingParameterEnum(
                 self.EXTRA_INFO,
                 self.tr("Extra Info"),
@@ -142,6 +156,29 @@ class ORSDirectionsPointsLayersAlgo(ORSBaseProcessingAlgorithm):
                 self.tr("Csv Column (needs Csv Factor and csv in Extra Info)"),
                 optional=True,
             ),
+            QgsProcessingParameterNumber(
+                self.IN_MAX_CROW_DISTANCE,
+                self.tr("Skip pairs further apart than this straight-line distance [m]"),
+                type=QgsProcessingParameterNumber.Type.Double,
+                minValue=0,
+                defaultValue=None,
+                optional=True,
+            ),
+            QgsProcessingParameterBoolean(
+                self.IN_EXCLUDE_SAME_ID,
+                self.tr("Skip pairs with identical start and end ID"),
+                defaultValue=False,
+            ),
+            QgsProcessingParameterBoolean(
+                self.IN_SKIP_REVERSE_PAIRS,
+                self.tr("Skip reverse pairs (B to A if A to B is routed)"),
+                defaultValue=False,
+            ),
+            QgsProcessingParameterBoolean(
+                self.MERGE_EXTRA_INFO,
+                self.tr("Merge consecutive segments with identical Extra Info"),
+                defaultValue=False,
+            ),
         ]
         self.setToolTip(
             self.PARAMETERS[0], self.tr("Only Point layers are allowed, not MultiPoint.")
@@ -181,6 +218,19 @@ class ORSDirectionsPointsLayersAlgo(ORSBaseProcessingAlgorithm):
                 "Either 'row-by-row' until one layers has no more features or 'all-by-all' for every feature combination"
             ),
         )
+        self.setToolTip(
+            self.PARAMETERS[8],
+            self.tr(
+                "End points are preselected per start point by straight-line distance, only these pairs are routed."
+            ),
+        )
+        self.setToolTip(
+            self.PARAMETERS[12],
+            self.tr(
+                "Pairs are compared by their ID values, of two swapped pairs the one starting at the smaller ID is routed."
+            ),
+        )
+        self.PARAMETERS += self.journal_parameters()
 
     # TODO: preprocess parameters to options the range cleanup below:
     # https://www.qgis.org/pyqgis/master/core/Processing/QgsProcessingAlgorithm.html#qgis.core.QgsProcessingAlgorithm.preprocessParameters
@@ -206,6 +256,7 @@ class ORSDirectionsPointsLayersAlgo(ORSBaseProcessingAlgorithm):
 
         extra_info = self.parameterAsEnums(parameters, self.EXTRA_INFO, context)
         extra_info = [EXTRA_INFOS[i] for i in extra_info]
+        merge_runs = self.parameterAsBool(parameters, self.MERGE_EXTRA_INFO, context)
 
         # Get parameter values
         source = self.parameterAsSource(parameters, self.IN_START, context)
@@ -238,14 +289,31 @@ class ORSDirectionsPointsLayersAlgo(ORSBaseProcessingAlgorithm):
             def sort_end(f):
                 return f.id()
 
-        route_dict = self._get_route_dict(
-            source, source_field, sort_start, destination, destination_field, sort_end
-        )
+        with self.metrics.timer("read_features"):
+            route_dict = self._get_route_dict(
+                source, source_field, sort_start, destination, destination_field, sort_end
+            )
 
-        if mode == "Row-by-Row":
-            route_count = min([source.featureCount(), destination.featureCount()])
-        else:
-            route_count = source.featureCount() * destination.featureCount()
+        k_nearest = self.parameterAsInt(parameters, self.IN_K_NEAREST, context)
+        nearest = None
+        if mode == "All-by-All" and k_nearest > 0:
+            nearest = spatial.get_nearest(
+                [[point.x(), point.y()] for point in route_dict["start"]["geometries"]],
+                [[point.x(), point.y()] for point in route_dict["end"]["geometries"]],
+                k_nearest,
+            )
+
+        pair_filter = directions_core.get_pair_filter(
+            route_dict,
+            mode,
+            nearest,
+            max_distance=self.parameterAsDouble(parameters, self.IN_MAX_CROW_DISTANCE, context),
+            exclude_same_id=self.parameterAsBool(parameters, self.IN_EXCLUDE_SAME_ID, context),
+            skip_reverse=self.parameterAsBool(parameters, self.IN_SKIP_REVERSE_PAIRS, context),
+        )
+        route_count = directions_core.count_request_point_features(
+            route_dict, mode, nearest, pair_filter
+        )
 
         # get types of set ID fields
         field_types = dict()
@@ -254,7 +322,7 @@ class ORSDirectionsPointsLayersAlgo(ORSBaseProcessingAlgorithm):
         if destination_field:
             field_types.update({"to_type": destination_field.type()})
         sink_fields = directions_core.get_fields(
-            **field_types, extra_info=extra_info, two_layers=True
+            **field_types, extra_info=extra_info, two_layers=True, merge_runs=merge_runs
         )
 
         (sink, dest_id) = self.parameterAsSink(
@@ -265,47 +333,78 @@ class ORSDirectionsPointsLayersAlgo(ORSBaseProcessingAlgorithm):
             QgsWkbTypes.Type.LineString,
             QgsCoordinateReferenceSystem.fromEpsgId(4326),
         )
+        sink = self.buffered_sink(sink)
+
+        endpoint = self.get_endpoint_names_from_provider(parameters[self.IN_PROVIDER])["directions"]
+        url = f"/v2/{endpoint}/{profile}/geojson"
+
+        # Routes completed by a previous run are replayed instead of requested again
+        journal = self.get_journal(parameters, context, feedback)
+        if journal:
+            for feat in journal.replay():
+                sink.addFeature(feat)
 
+        # Co-located pairs are requested once, their route is used for each of them
         counter = 0
-        for coordinates, values in directions_core.get_request_point_features(route_dict, mode):
+
+        def get_requests():
+            nonlocal counter
+            for coordinates, values in directions_core.get_unique_request_point_features(
+                route_dict, mode, nearest, pair_filter
+            ):
+                params = directions_core.build_default_parameters(
+                    preference, coordinates=coordinates, options=options, extra_info=extra_info
+                )
+                key = RequestJournal.make_key(url, params, values)
+                if journal and key in journal:
+                    # the pairs were replayed from the journal
+                    counter += len(values)
+                    continue
+                yield (values, key), params
+
+        failed = False
+        for (values, key), response in ors_client.fetch_concurrently(url, {}, get_requests()):
             # Stop the algorithm if cancel button has been clicked
             if feedback.isCanceled():
                 break
 
-            params = directions_core.build_default_parameters(
-                preference, coordinates=coordinates, options=options, extra_info=extra_info
-            )
-
-            try:
-                endpoint = self.get_endpoint_names_from_provider(parameters[self.IN_PROVIDER])[
-                    "directions"
-                ]
-                response = ors_client.fetch_with_retry(
-                    f"/v2/{endpoint}/{profile}/geojson", {}, post_json=params
-                )
-            except (exceptions.ApiError, exceptions.InvalidKey, exceptions.GenericServerError) as e:
-                msg = f"Route from {values[0]} to {values[1]} caused a {e.__class__.__name__}:\n{str(e)}"
-                feedback.reportError(msg)
-                logger.log(msg)
+            if isinstance(response, Exception):
+                failed = True
+                for from_value, to_value in values:
+                    msg = f"Route from {from_value} to {to_value} caused a {response.__class__.__name__}:\n{str(response)}"
+                    feedback.reportError(msg)
+                    logger.log(msg)
                 continue
 
-            if extra_info:
-                feats = directions_core.get_extra_info_features_directions(
-                    response, extra_info, values
-                )
-                for feat in feats:
-                    sink.addFeature(feat)
-            else:
-                sink.addFeature(
-                    directions_core.get_output_feature_directions(
-                        response, profile, preference, from_value=values[0], to_value=values[1]
-                    )
-                )
-
-            counter += 1
+            feats = []
+            with self.metrics.timer("build_features"):
+                for from_value, to_value in values:
+                    if extra_info:
+                        feats += directions_core.get_extra_info_features_directions(
+                            response, extra_info, (from_value, to_value), merge_runs
+                        )
+                    else:
+                        feats.append(
+                            directions_core.get_output_feature_directions(
+                                response,
+                                profile,
+                                preference,
+                                from_value=from_value,
+                                to_value=to_value,
+                            )
+                        )
+            for feat in feats:
+                sink.addFeature(feat)
+            if journal:
+                journal.write(key, feats)
+
+            counter += len(values)
             feedback.setProgress(int(100.0 / route_count * counter))
 
-        return {self.OUT: dest_id}
+        self.close_sink(sink, feedback)
+        self.close_journal(journal, feedback, complete=not failed)
+
+        return self.store_results({self.OUT: dest_id})
 
     @staticmethod
     def _get_route_dict(
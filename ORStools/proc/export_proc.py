@@ -27,7 +27,7 @@
  ***************************************************************************/
 """
 
-from typing import Dict
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 from qgis.PyQt.QtGui import QIcon
 from qgis.core import (
@@ -38,7 +38,9 @@ from qgis.core import (
     QgsProcessingParameterExtent,
     QgsProcessingParameterFeatureSink,
     QgsProcessingContext,
+    QgsProcessingException,
     QgsProcessingFeedback,
+    QgsProcessingParameterFileDestination,
     QgsPointXY,
     QgsGeometry,
 )
@@ -49,8 +51,9 @@ from ..utils.gui import GuiUtils
 from ..utils.wrapper import create_qgs_field
 
 
-from ORStools.common import PROFILES
-from ORStools.utils import exceptions, logger
+from ORStools.common import PROFILES, graph_core
+from ORStools.common.export_core import Edge, NetworkMerger
+from ORStools.utils import geometry, logger, spatial
 from .base_processing_algorithm import ORSBaseProcessingAlgorithm
 
 
@@ -62,6 +65,7 @@ class ORSExportAlgo(ORSBaseProcessingAlgorithm):
         self.GROUP: str = "Export"
         self.IN_EXPORT: str = "INPUT_EXPORT"
         self.OUT_POINT = "OUTPUT_POINT"
+        self.OUT_GRAPH: str = "OUTPUT_GRAPH"
         self.OUT_NAME: str = "Network_Export"
         self.PARAMETERS: list = [
             QgsProcessingParameterExtent(
@@ -72,10 +76,24 @@ class ORSExportAlgo(ORSBaseProcessingAlgorithm):
                 name=self.OUT_POINT,
                 description="Node Export",
             ),
+            QgsProcessingParameterFileDestination(
+                name=self.OUT_GRAPH,
+                description=self.tr("Graph file"),
+                fileFilter=self.tr("NumPy archive (*.npz)"),
+                optional=True,
+                createByDefault=False,
+            ),
         ]
 
         self.setToolTip(self.PARAMETERS[0], self.tr("Extent for which to export the graph."))
         self.setToolTip(self.PARAMETERS[1], self.tr("Name of the exported point layer"))
+        self.setToolTip(
+            self.PARAMETERS[2],
+            self.tr(
+                "Additionally write the network as compact arrays, "
+                "e.g. to route on it with 'Route on Exported Network' without requests."
+            ),
+        )
 
     def processAlgorithm(
         self, parameters: dict, context: QgsProcessingContext, feedback: QgsProcessingFeedback
@@ -88,13 +106,6 @@ class ORSExportAlgo(ORSBaseProcessingAlgorithm):
         target_crs = QgsCoordinateReferenceSystem("EPSG:4326")
         rect = self.parameterAsExtent(parameters, self.IN_EXPORT, context, crs=target_crs)
 
-        extent = [[rect.xMinimum(), rect.yMinimum()], [rect.xMaximum(), rect.yMaximum()]]
-
-        params = {
-            "bbox": extent,
-            "id": "export_request",
-        }
-
         (sink_line, dest_id_line) = self.parameterAsSink(
             parameters,
             self.OUT,
@@ -103,6 +114,7 @@ class ORSExportAlgo(ORSBaseProcessingAlgorithm):
             QgsWkbTypes.Type.LineString,
             QgsCoordinateReferenceSystem.fromEpsgId(4326),
         )
+        sink_line = self.buffered_sink(sink_line)
 
         (sink_point, dest_id_point) = self.parameterAsSink(
             parameters,
@@ -112,54 +124,84 @@ class ORSExportAlgo(ORSBaseProcessingAlgorithm):
             QgsWkbTypes.Type.Point,
             QgsCoordinateReferenceSystem.fromEpsgId(4326),
         )
+        sink_point = self.buffered_sink(sink_point)
+
+        graph_path = self.parameterAsFileOutput(parameters, self.OUT_GRAPH, context)
+        if graph_path and graph_core.np is None:
+            raise QgsProcessingException(self.tr("Writing graph files requires NumPy."))
+        graph_nodes, graph_edges = [], []
 
-        # Make request and catch ApiError
-        try:
-            endpoint = self.get_endpoint_names_from_provider(parameters[self.IN_PROVIDER])["export"]
-            response = ors_client.fetch_with_retry(
-                f"/v2/{endpoint}/{profile}", {}, post_json=params
+        # Split the extent into tiles the provider accepts and request them concurrently
+        max_area = self.get_limits_from_provider(parameters[self.IN_PROVIDER])["export_area_km2"]
+        tiles = spatial.split_extent(
+            rect.xMinimum(), rect.yMinimum(), rect.xMaximum(), rect.yMaximum(), max_area
+        )
+        requests = [(tile, {"bbox": tile, "id": "export_request"}) for tile in tiles]
+        if len(tiles) > 1:
+            feedback.pushInfo(self.tr("Requesting the extent in {} tiles").format(len(tiles)))
+
+        endpoint = self.get_endpoint_names_from_provider(parameters[self.IN_PROVIDER])["export"]
+        network = NetworkMerger()
+        for num, (tile, response) in enumerate(
+            ors_client.fetch_concurrently(f"/v2/{endpoint}/{profile}", {}, requests), 1
+        ):
+            if feedback.isCanceled():
+                break
+
+            if isinstance(response, Exception):
+                msg = f"Tile {tile} caused a {response.__class__.__name__}: {str(response)}"
+                feedback.reportError(msg)
+                logger.log(msg)
+                continue
+
+            with self.metrics.timer("build_features"):
+                nodes, edges = network.add_tile(tile, response)
+                sink_point.addFeatures(self.get_point_features(nodes))
+                sink_line.addFeatures(self.get_line_features(edges))
+                if graph_path:
+                    graph_nodes.extend(nodes)
+                    graph_edges.extend(edge[:3] for edge in edges)
+
+            feedback.setProgress(int(100.0 * num / len(tiles)))
+
+        if network.pending_edges:
+            feedback.pushWarning(
+                self.tr("{} edges were skipped, their nodes are missing in the export").format(
+                    len(network.pending_edges)
+                )
             )
-            nodes_dict = {item["nodeId"]: item["location"] for item in response["nodes"]}
-            edges = response["edges"]
-            for edge in edges:
-                from_id = edge["fromId"]
-                to_id = edge["toId"]
-                weight = edge["weight"]
-
-                to_coords = nodes_dict[to_id]
-                from_coords = nodes_dict[from_id]
-
-                geometry = QgsGeometry.fromPolylineXY(
-                    [
-                        QgsPointXY(from_coords[0], from_coords[1]),
-                        QgsPointXY(to_coords[0], to_coords[1]),
-                    ]
+
+        self.close_sink(sink_line, feedback)
+        self.close_sink(sink_point, feedback)
+
+        results = {self.OUT: dest_id_line, self.OUT_POINT: dest_id_point}
+        if graph_path:
+            with self.metrics.timer("write_graph"):
+                graph_core.Graph.from_network(graph_nodes, graph_edges).save(graph_path)
+            feedback.pushInfo(
+                self.tr("Wrote a graph of {} nodes and {} edges").format(
+                    len(graph_nodes), len(graph_edges)
                 )
+            )
+            results[self.OUT_GRAPH] = graph_path
+
+        return self.store_results(results)
 
-                feat = QgsFeature()
-                feat.setGeometry(geometry)
-                feat.setAttributes([from_id, to_id, weight])
-                sink_line.addFeature(feat)
-
-            unique_coordinates = {
-                tuple(item["location"]): item["nodeId"] for item in response["nodes"]
-            }
-            points = [(coords, node_id) for coords, node_id in unique_coordinates.items()]
-            for item in points:
-                point = QgsPointXY(item[0][0], item[0][1])
-                point_geometry = QgsGeometry.fromPointXY(point)
-
-                point_feat = QgsFeature()
-                point_feat.setGeometry(point_geometry)
-                point_feat.setAttributes([item[1]])
-                sink_point.addFeature(point_feat)
-
-        except (exceptions.ApiError, exceptions.InvalidKey, exceptions.GenericServerError) as e:
-            msg = f"{e.__class__.__name__}: {str(e)}"
-            feedback.reportError(msg)
-            logger.log(msg)
-
-        return {self.OUT: dest_id_line, self.OUT_POINT: dest_id_point}
+    @staticmethod
+    def get_point_features(nodes: Iterable[Tuple[int, List[float]]]) -> Iterator[QgsFeature]:
+        for node_id, location in nodes:
+            feat = QgsFeature()
+            feat.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(*location)))
+            feat.setAttributes([node_id])
+            yield feat
+
+    @staticmethod
+    def get_line_features(edges: Iterable[Edge]) -> Iterator[QgsFeature]:
+        for from_id, to_id, weight, from_location, to_location in edges:
+            feat = QgsFeature()
+            feat.setGeometry(geometry.line_from_coordinates([from_location, to_location]))
+            feat.setAttributes([from_id, to_id, weight])
+            yield feat
 
     @staticmethod
     def get_fields_line():
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ ORStools
+                                 A QGIS plugin
+ QGIS client to query openrouteservice
+                              -------------------
+        begin                : 2017-02-01
+        git sha              : $Format:%H$
+        copyright            : (C) 2021 by HeiGIT gGmbH
+        email                : support@openrouteservice.heigit.org
+ ***************************************************************************/
+
+ This plugin provides access to openrouteservice API functionalities
+ (https://openrouteservice.org), developed and
+ maintained by the openrouteservice team of HeiGIT gGmbH, Germany. By using
+ this plugin you agree to the ORS terms of service
+ (https://openrouteservice.org/terms-of-service/).
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from typing import Dict, Iterator, List
+
+from qgis.PyQt.QtGui import QIcon
+from qgis.PyQt.QtCore import QMetaType
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsFeature,
+    QgsFields,
+    QgsGeometry,
+    QgsPointXY,
+    QgsProcessing,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterField,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterNumber,
+    QgsWkbTypes,
+)
+
+from ORStools.common import GRAPH_MODES, graph_core
+from ORStools.utils import geometry
+from ORStools.utils.gui import GuiUtils
+from ORStools.utils.wrapper import create_qgs_field
+from .base_processing_algorithm import ORSBaseProcessingAlgorithm
+from .matrix_proc import ORSMatrixAlgo
+
+
+# noinspection PyPep8Naming
+class ORSGraphRoutingAlgo(ORSBaseProcessingAlgorithm):
+    def __init__(self):
+        super().__init__()
+        self.ALGO_NAME: str = "routing_from_graph"
+        self.GROUP: str = "Export"
+        self.IN_GRAPH: str = "INPUT_GRAPH"
+        self.IN_START: str = "INPUT_START_LAYER"
+        self.IN_START_FIELD: str = "INPUT_START_FIELD"
+        self.IN_END: str = "INPUT_END_LAYER"
+        self.IN_END_FIELD: str = "INPUT_END_FIELD"
+        self.IN_MODE: str = "INPUT_MODE"
+        self.IN_MAX_COST: str = "INPUT_MAX_COST"
+        self.OUT_NAME: str = "Graph_Routes"
+        self.PARAMETERS: list = [
+            QgsProcessingParameterFile(
+                name=self.IN_GRAPH,
+                description=self.tr("Graph file"),
+                extension="npz",
+            ),
+            QgsProcessingParameterFeatureSource(
+                name=self.IN_START,
+                description=self.tr("Input Start Point layer"),
+                types=[QgsProcessing.SourceType.TypeVectorPoint],
+            ),
+            QgsProcessingParameterField(
+                name=self.IN_START_FIELD,
+                description=self.tr("Start ID Field (can be used for joining)"),
+                parentLayerParameterName=self.IN_START,
+                defaultValue=None,
+                optional=True,
+            ),
+            QgsProcessingParameterFeatureSource(
+                name=self.IN_END,
+                description=self.tr("Input End Point layer"),
+                types=[QgsProcessing.SourceType.TypeVectorPoint],
+                optional=True,
+            ),
+            QgsProcessingParameterField(
+                name=self.IN_END_FIELD,
+                description=self.tr("End ID Field (can be used for joining)"),
+                parentLayerParameterName=self.IN_END,
+                defaultValue=None,
+                optional=True,
+            ),
+            QgsProcessingParameterEnum(
+                name=self.IN_MODE,
+                description=self.tr("Search"),
+                options=GRAPH_MODES,
+                defaultValue=GRAPH_MODES[0],
+            ),
+            QgsProcessingParameterNumber(
+                name=self.IN_MAX_COST,
+                description=self.tr("Maximum cost (0 = unlimited)"),
+                type=QgsProcessingParameterNumber.Type.Double,
+                minValue=0,
+                defaultValue=0,
+            ),
+        ]
+
+        self.setToolTip(
+            self.PARAMETERS[0],
+            self.tr("Graph file written by 'Export Network from Map'."),
+        )
+        self.setToolTip(
+            self.PARAMETERS[3], self.tr("Required for shortest paths, not used for cost trees.")
+        )
+        self.setToolTip(
+            self.PARAMETERS[5],
+            self.tr(
+                "Shortest paths from every start to every end point, searched from each start point "
+                "to all end points at once or from both ends of each pair; "
+                "or the cost to reach every node from each start point."
+            ),
+        )
+        self.setToolTip(
+            self.PARAMETERS[6],
+            self.tr("Nodes more expensive to reach are skipped, in the unit of the edge weights."),
+        )
+
+    def processAlgorithm(
+        self, parameters: dict, context: QgsProcessingContext, feedback: QgsProcessingFeedback
+    ) -> Dict[str, str]:
+        graph_path = self.parameterAsFile(parameters, self.IN_GRAPH, context)
+        try:
+            with self.metrics.timer("read_graph"):
+                graph = graph_core.Graph.load(graph_path)
+        except (ImportError, OSError, ValueError) as e:
+            raise QgsProcessingException(str(e))
+        feedback.pushInfo(
+            self.tr("Loaded a graph of {} nodes and {} edges").format(
+                len(graph), len(graph.targets)
+            )
+        )
+
+        mode = GRAPH_MODES[self.parameterAsEnum(parameters, self.IN_MODE, context)]
+        max_cost = self.parameterAsDouble(parameters, self.IN_MAX_COST, context) or None
+
+        source = self.parameterAsSource(parameters, self.IN_START, context)
+        source_field_name = parameters[self.IN_START_FIELD]
+        source_field = source.fields().field(source_field_name) if source_field_name else None
+        destination = self.parameterAsSource(parameters, self.IN_END, context)
+        destination_field_name = parameters[self.IN_END_FIELD]
+        if mode != "Cost trees" and destination is None:
+            raise QgsProcessingException(self.tr("Shortest paths need an end point layer."))
+
+        # Route between the nodes closest to the points
+        with self.metrics.timer("read_features"):
+            sources_points, sources_ids = ORSMatrixAlgo.get_points_and_ids(
+                source, source_field_name
+            )
+            sources_nodes = [graph.nearest_node(x, y) for x, y in sources_points]
+        source_type = source_field.type() if source_field else QMetaType.Type.Int
+
+        if mode == "Cost trees":
+            (sink, dest_id) = self.parameterAsSink(
+                parameters,
+                self.OUT,
+                context,
+                self.get_fields_tree(source_type),
+                QgsWkbTypes.Type.Point,
+                QgsCoordinateReferenceSystem.fromEpsgId(4326),
+            )
+            sink = self.buffered_sink(sink)
+
+            for num, (source_node, source_id) in enumerate(zip(sources_nodes, sources_ids)):
+                if feedback.isCanceled():
+                    break
+                with self.metrics.timer("search"):
+                    costs, _ = graph.cost_tree(source_node, max_cost)
+                with self.metrics.timer("build_features"):
+                    sink.addFeatures(self.get_tree_features(graph, source_id, costs))
+                feedback.setProgress(int(100.0 * (num + 1) / len(sources_nodes)))
+
+            self.close_sink(sink, feedback)
+            return self.store_results({self.OUT: dest_id})
+
+        with self.metrics.timer("read_features"):
+            destinations_points, destinations_ids = ORSMatrixAlgo.get_points_and_ids(
+                destination, destination_field_name
+            )
+            destinations_nodes = [graph.nearest_node(x, y) for x, y in destinations_points]
+        destination_type = (
+            destination.fields().field(destination_field_name).type()
+            if destination_field_name
+            else QMetaType.Type.Int
+        )
+
+        (sink, dest_id) = self.parameterAsSink(
+            parameters,
+            self.OUT,
+            context,
+            self.get_fields_paths(source_type, destination_type),
+            QgsWkbTypes.Type.LineString,
+            QgsCoordinateReferenceSystem.fromEpsgId(4326),
+        )
+        sink = self.buffered_sink(sink)
+
+        unreachable = 0
+        for num, (source_node, source_id) in enumerate(zip(sources_nodes, sources_ids)):
+            if feedback.isCanceled():
+                break
+
+            with self.metrics.timer("search"):
+                if mode == "Shortest paths (Dijkstra)":
+                    # one search from the start point reaches all end points
+                    costs, predecessors = graph.cost_tree(source_node, max_cost, destinations_nodes)
+                    paths = [
+                        (costs[node], graph.get_path(predecessors, node))
+                        if node in costs
+                        else (None, [])
+                        for node in destinations_nodes
+                    ]
+                else:
+                    paths = [graph.shortest_path(source_node, node) for node in destinations_nodes]
+                    paths = [
+                        (cost, path)
+                        if cost is not None and (max_cost is None or cost <= max_cost)
+                        else (None, [])
+                        for cost, path in paths
+                    ]
+
+            unreachable += sum(1 for cost, _ in paths if cost is None)
+            with self.metrics.timer("build_features"):
+                sink.addFeatures(self.get_path_features(graph, source_id, destinations_ids, paths))
+            feedback.setProgress(int(100.0 * (num + 1) / len(sources_nodes)))
+
+        if unreachable:
+            feedback.pushWarning(
+                self.tr("{} end points could not be reached from their start point").format(
+                    unreachable
+                )
+            )
+
+        self.close_sink(sink, feedback)
+        return self.store_results({self.OUT: dest_id})
+
+    @staticmethod
+    def get_tree_features(
+        graph: graph_core.Graph, source_id, costs: Dict[int, float]
+    ) -> Iterator[QgsFeature]:
+        for node, cost in costs.items():
+            feat = QgsFeature()
+            feat.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(*graph.coordinates[node])))
+            feat.setAttributes([source_id, int(graph.node_ids[node]), cost])
+            yield feat
+
+    @staticmethod
+    def get_path_features(
+        graph: graph_core.Graph,
+        source_id,
+        destinations_ids: List,
+        paths: List[tuple],
+    ) -> Iterator[QgsFeature]:
+        for destination_id, (cost, path) in zip(destinations_ids, paths):
+            if cost is None:
+                continue
+            feat = QgsFeature()
+            # a path within a single node still gets a line
+            nodes = path if len(path) > 1 else path * 2
+            feat.setGeometry(geometry.line_from_coordinates(graph.coordinates[nodes]))
+            feat.setAttributes([source_id, destination_id, cost])
+            yield feat
+
+    @staticmethod
+    def get_fields_paths(
+        source_type: QMetaType.Type = QMetaType.Type.Int,
+        destination_type: QMetaType.Type = QMetaType.Type.Int,
+    ) -> QgsFields:
+        fields = QgsFields()
+        fields.append(create_qgs_field("FROM_ID", source_type))
+        fields.append(create_qgs_field("TO_ID", destination_type))
+        fields.append(create_qgs_field("COST", QMetaType.Type.Double))
+
+        return fields
+
+    @staticmethod
+    def get_fields_tree(source_type: QMetaType.Type = QMetaType.Type.Int) -> QgsFields:
+        fields = QgsFields()
+        fields.append(create_qgs_field("FROM_ID", source_type))
+        fields.append(create_qgs_field("NODE_ID", QMetaType.Type.LongLong))
+        fields.append(create_qgs_field("COST", QMetaType.Type.Double))
+
+        return fields
+
+    def displayName(self) -> str:
+        """
+        Algorithm name shown in QGIS toolbox
+        :return:
+        """
+        return self.tr("Route on Exported Network")
+
+    def icon(self):
+        icon_path = GuiUtils.get_icon("icon_export.png")
+        return QIcon(icon_path)
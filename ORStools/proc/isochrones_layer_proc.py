@@ -27,7 +27,8 @@
  ***************************************************************************/
 """
 
-from typing import Dict
+from itertools import islice
+from typing import Any, Dict, List, Tuple
 
 from qgis.PyQt.QtGui import QIcon
 from qgis.core import (
@@ -46,8 +47,9 @@ from qgis.core import (
 )
 
 from ORStools.common import isochrones_core, PROFILES, DIMENSIONS, LOCATION_TYPES
+from ORStools.common.journal import RequestJournal
 from ORStools.proc.base_processing_algorithm import ORSBaseProcessingAlgorithm
-from ORStools.utils import transform, exceptions, logger
+from ORStools.utils import spatial, transform, logger
 from ORStools.utils.gui import GuiUtils
 
 
@@ -136,6 +138,7 @@ class ORSIsochronesLayerAlgo(ORSBaseProcessingAlgorithm):
             self.PARAMETERS[5],
             self.tr("Start treats the location(s) as starting point, destination as goal."),
         )
+        self.PARAMETERS += self.journal_parameters()
 
     # Save some important references
     # TODO bad style, refactor
@@ -184,26 +187,73 @@ class ORSIsochronesLayerAlgo(ORSBaseProcessingAlgorithm):
 
         self.isochrones.set_parameters(profile, dimension, factor, *parameter_options)
 
-        for locations, id_value in self.get_sorted_feature_parameters(source, id_field_name):
+        endpoint = self.get_endpoint_names_from_provider(parameters[self.IN_PROVIDER])["isochrones"]
+        url = f"/v2/{endpoint}/{profile}"
+
+        # Requests completed by a previous run are not sent again
+        journal = self.get_journal(parameters, context, feedback)
+
+        # Pack as many locations into one request as the provider accepts
+        batch_size = max(
+            1,
+            int(
+                self.get_limits_from_provider(parameters[self.IN_PROVIDER])["isochrones_locations"]
+            ),
+        )
+        # Features sharing a location are requested once, their isochrones are copied
+        with self.metrics.timer("read_features"):
+            locations = spatial.group_by_location(
+                (location, id_value)
+                for [location], id_value in self.get_sorted_feature_parameters(
+                    source, id_field_name
+                )
+            )
+        base_params = {
+            "range_type": dimension,
+            "range": ranges_proc,
+            "attributes": ["total_pop"],
+            "options": options,
+            "location_type": location_type,
+        }
+
+        # only include smoothing if set
+        if smoothing is not None:
+            base_params["smoothing"] = smoothing
+
+        def batch_params(batch: List[Tuple[Tuple[float, float], List[Any]]]) -> Dict[str, Any]:
+            return dict(
+                base_params,
+                locations=[list(location) for location, _ in batch],
+                id=batch[0][1][0] if len(batch) == 1 else None,
+            )
+
+        features = iter(locations.items())
+        while True:
             # Stop the algorithm if cancel button has been clicked
             if feedback.isCanceled():
                 break
 
-            params = {
-                "locations": locations,
-                "range_type": dimension,
-                "range": ranges_proc,
-                "attributes": ["total_pop"],
-                "id": id_value,
-                "options": options,
-                "location_type": location_type,
-            }
+            batch = list(islice(features, batch_size))
+            if not batch:
+                break
 
-            # only include smoothing if set
-            if smoothing is not None:
-                params["smoothing"] = smoothing
+            if journal:
+                id_values = [values for _, values in batch]
+                if RequestJournal.make_key(url, batch_params(batch), id_values) in journal:
+                    continue
+                # The locations of a failed batch were journaled one by one when retried
+                batch = [
+                    (location, values)
+                    for location, values in batch
+                    if RequestJournal.make_key(url, batch_params([(location, values)]), [values])
+                    not in journal
+                ]
+                if not batch:
+                    continue
 
-            requests.append(params)
+            id_values = [values for _, values in batch]
+            params = batch_params(batch)
+            requests.append(((id_values, params), params))
 
         (sink, self.dest_id) = self.parameterAsSink(
             parameters,
@@ -215,43 +265,96 @@ class ORSIsochronesLayerAlgo(ORSBaseProcessingAlgorithm):
             # reactivated
             self.crs_out,
         )
+        sink = self.buffered_sink(sink)
+
+        if journal:
+            for isochrone in journal.replay():
+                sink.addFeature(isochrone)
 
-        for num, params in enumerate(requests):
+        num = 0
+        failed = False
+        failed_batches = []
+        for (id_values, params), response in ors_client.fetch_concurrently(url, {}, requests):
             if feedback.isCanceled():
                 break
 
-            # If feature causes error, report and continue with next
-            try:
-                # Populate features from response
-                endpoint = self.get_endpoint_names_from_provider(parameters[self.IN_PROVIDER])[
-                    "isochrones"
-                ]
-                response = ors_client.fetch_with_retry(
-                    f"/v2/{endpoint}/{profile}", {}, post_json=params
-                )
-
-                for isochrone in self.isochrones.get_features(response, params["id"]):
-                    sink.addFeature(isochrone)
+            num += sum(len(values) for values in id_values)
 
-            except (exceptions.ApiError, exceptions.InvalidKey, exceptions.GenericServerError) as e:
-                msg = f"Feature ID {params['id']} caused a {e.__class__.__name__}:\n{str(e)}"
-                feedback.reportError(msg)
-                logger.log(msg, 2)
+            if isinstance(response, Exception):
+                if len(id_values) > 1:
+                    failed_batches.append((id_values, params, response))
+                else:
+                    failed = True
+                    self._report_error(id_values[0], response, feedback)
                 continue
+
+            # Populate features from response
+            with self.metrics.timer("build_features"):
+                isochrones = list(self.isochrones.get_features(response, None, id_values))
+            for isochrone in isochrones:
+                sink.addFeature(isochrone)
+            if journal:
+                journal.write(RequestJournal.make_key(url, params, id_values), isochrones)
+
             feedback.setProgress(int(100.0 / source.featureCount() * num))
 
-        return {self.OUT: self.dest_id}
+        # A single bad location fails the whole batch, so request the locations of failed
+        # batches one by one to isolate the feature causing the error
+        single_requests = []
+        for id_values, params, error in failed_batches:
+            logger.log(
+                f"Batch with feature IDs {id_values} caused a {error.__class__.__name__}, "
+                f"retrying each location on its own:\n{str(error)}",
+                1,
+            )
+            for values, location in zip(id_values, params["locations"]):
+                single_params = batch_params([(tuple(location), values)])
+                if journal and RequestJournal.make_key(url, single_params, [values]) in journal:
+                    continue
+                single_requests.append(((values, single_params), single_params))
+
+        for (values, params), response in ors_client.fetch_concurrently(url, {}, single_requests):
+            if feedback.isCanceled():
+                break
+
+            if isinstance(response, Exception):
+                failed = True
+                self._report_error(values, response, feedback)
+                continue
+
+            with self.metrics.timer("build_features"):
+                isochrones = list(self.isochrones.get_features(response, None, [values]))
+            for isochrone in isochrones:
+                sink.addFeature(isochrone)
+            if journal:
+                journal.write(RequestJournal.make_key(url, params, [values]), isochrones)
+
+        self.close_sink(sink, feedback)
+        self.close_journal(journal, feedback, complete=not failed)
+
+        return self.store_results({self.OUT: self.dest_id})
 
-    # noinspection PyUnusedLocal
     def postProcessAlgorithm(
         self, context: QgsProcessingContext, feedback: QgsProcessingFeedback
     ) -> Dict[str, str]:
         """Style polygon layer in post-processing step."""
+        results = super().postProcessAlgorithm(context, feedback)
         # processed_layer = self.isochrones.calculate_difference(self.dest_id, context)
         processed_layer = QgsProcessingUtils.mapLayerFromString(self.dest_id, context)
         self.isochrones.stylePoly(processed_layer)
 
-        return {self.OUT: self.dest_id}
+        return {**results, self.OUT: self.dest_id}
+
+    @staticmethod
+    def _report_error(
+        id_values: List[Any], error: Exception, feedback: QgsProcessingFeedback
+    ) -> None:
+        """Report the features of a location whose request failed, the algorithm continues
+        with the next one."""
+        ids = ", ".join(map(str, id_values))
+        msg = f"Feature ID {ids} caused a {error.__class__.__name__}:\n{str(error)}"
+        feedback.reportError(msg)
+        logger.log(msg, 2)
 
     @staticmethod
     def get_sorted_feature_parameters(
@@ -170,6 +170,7 @@ class ORSIsochronesPointAlgo(ORSBaseProcessingAlgorithm):
             # reactivated
             self.crs_out,
         )
+        sink = self.buffered_sink(sink)
 
         try:
             endpoint = self.get_endpoint_names_from_provider(parameters[self.IN_PROVIDER])[
@@ -188,15 +189,17 @@ class ORSIsochronesPointAlgo(ORSBaseProcessingAlgorithm):
             feedback.reportError(msg)
             logger.log(msg, 2)
 
-        return {self.OUT: self.dest_id}
+        self.close_sink(sink, feedback)
+
+        return self.store_results({self.OUT: self.dest_id})
 
-    # noinspection PyUnusedLocal
     def postProcessAlgorithm(self, context, feedback) -> Dict[str, str]:
         """Style polygon layer in post-processing step."""
+        results = super().postProcessAlgorithm(context, feedback)
         processed_layer = QgsProcessingUtils.mapLayerFromString(self.dest_id, context)
         self.isochrones.stylePoly(processed_layer)
 
-        return {self.OUT: self.dest_id}
+        return {**results, self.OUT: self.dest_id}
 
     def displayName(self) -> str:
         """
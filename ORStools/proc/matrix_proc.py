@@ -27,17 +27,22 @@
  ***************************************************************************/
 """
 
-from typing import Dict
+from typing import Any, Dict, List, Optional, Tuple
 
 from qgis.PyQt.QtGui import QIcon
 from qgis.core import (
     QgsWkbTypes,
-    QgsFeature,
+    QgsFeatureRequest,
+    QgsFeatureSink,
     QgsProcessing,
+    QgsProcessingFeatureSource,
     QgsFields,
     QgsProcessingException,
+    QgsProcessingParameterEnum,
     QgsProcessingParameterField,
     QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterFileDestination,
+    QgsProcessingParameterNumber,
     QgsProcessingContext,
     QgsProcessingFeedback,
 )
@@ -46,8 +51,8 @@ from ORStools.utils.wrapper import create_qgs_field
 
 from qgis.PyQt.QtCore import QMetaType
 
-from ORStools.common import PROFILES
-from ORStools.utils import transform, exceptions, logger
+from ORStools.common import PROFILES, SYMMETRIC_MODES, matrix_core
+from ORStools.utils import transform, logger, spatial
 from .base_processing_algorithm import ORSBaseProcessingAlgorithm
 from ..utils.gui import GuiUtils
 
@@ -62,6 +67,9 @@ class ORSMatrixAlgo(ORSBaseProcessingAlgorithm):
         self.IN_START_FIELD: str = "INPUT_START_FIELD"
         self.IN_END: str = "INPUT_END_LAYER"
         self.IN_END_FIELD: str = "INPUT_END_FIELD"
+        self.IN_SYMMETRIC: str = "INPUT_SYMMETRIC"
+        self.IN_K_NEAREST: str = "INPUT_K_NEAREST"
+        self.OUT_ARRAYS: str = "OUTPUT_ARRAYS"
         self.OUT_NAME: str = "Route_Matrix"
         self.PARAMETERS: list = [
             QgsProcessingParameterFeatureSource(
@@ -88,6 +96,28 @@ class ORSMatrixAlgo(ORSBaseProcessingAlgorithm):
                 defaultValue=None,
                 optional=True,
             ),
+            QgsProcessingParameterEnum(
+                name=self.IN_SYMMETRIC,
+                description=self.tr("Symmetric matrix (identical start and end layer)"),
+                options=SYMMETRIC_MODES,
+                defaultValue=SYMMETRIC_MODES[0],
+            ),
+            QgsProcessingParameterNumber(
+                name=self.IN_K_NEAREST,
+                description=self.tr("Only route to the k nearest destinations (0 = all)"),
+                type=QgsProcessingParameterNumber.Type.Integer,
+                minValue=0,
+                defaultValue=0,
+            ),
+            QgsProcessingParameterFileDestination(
+                name=self.OUT_ARRAYS,
+                description=self.tr("Matrix arrays file"),
+                fileFilter=self.tr(
+                    "NumPy archive (*.npz);;NumPy memory map (*.npy);;Parquet table (*.parquet)"
+                ),
+                optional=True,
+                createByDefault=False,
+            ),
         ]
 
         self.setToolTip(
@@ -106,6 +136,27 @@ class ORSMatrixAlgo(ORSBaseProcessingAlgorithm):
                 "Values will transfer to the output layer and can be used to join layers or group features afterwards."
             ),
         )
+        self.setToolTip(
+            self.PARAMETERS[4],
+            self.tr(
+                "For profiles where A to B equals B to A: only the routes above the diagonal are requested, "
+                "routes from a point to itself are skipped."
+            ),
+        )
+        self.setToolTip(
+            self.PARAMETERS[5],
+            self.tr(
+                "Destinations are preselected per start point by straight-line distance, "
+                "only these pairs are routed."
+            ),
+        )
+        self.setToolTip(
+            self.PARAMETERS[6],
+            self.tr(
+                "Additionally write durations [s] and distances [m] to a binary file, "
+                "e.g. to load the matrix as arrays in other tools."
+            ),
+        )
 
     def processAlgorithm(
         self, parameters: dict, context: QgsProcessingContext, feedback: QgsProcessingFeedback
@@ -138,52 +189,45 @@ class ORSMatrixAlgo(ORSBaseProcessingAlgorithm):
                 "TypeError: Multipoint Layers are not accepted. Please convert to single geometry layer."
             )
 
-        # Get source and destination features
-        sources_features = list(source.getFeatures())
-        destination_features = list(destination.getFeatures())
-        # Get feature amounts/counts
-        sources_amount = source.featureCount()
-        destinations_amount = destination.featureCount()
+        # Only keep coordinates and ID values of source and destination features
+        with self.metrics.timer("read_features"):
+            sources_points, sources_ids = self.get_points_and_ids(source, source_field_name)
+            destinations_points, destinations_ids = self.get_points_and_ids(
+                destination, destination_field_name
+            )
+        sources_amount = len(sources_points)
 
-        # Allow for 50 features in source if source == destination
-        source_equals_destination = parameters["INPUT_START_LAYER"] == parameters["INPUT_END_LAYER"]
+        symmetric_mode = SYMMETRIC_MODES[
+            self.parameterAsEnum(parameters, self.IN_SYMMETRIC, context)
+        ]
+        source_equals_destination = parameters[self.IN_START] == parameters[self.IN_END]
         if source_equals_destination:
-            features = sources_features
-            x_former = transform.transformToWGS(source.sourceCrs())
-            features_points = [x_former.transform(feat.geometry().asPoint()) for feat in features]
-        else:
-            x_former = transform.transformToWGS(source.sourceCrs())
-            sources_features_x_formed = [
-                x_former.transform(feat.geometry().asPoint()) for feat in sources_features
-            ]
-
-            x_former = transform.transformToWGS(destination.sourceCrs())
-            destination_features_x_formed = [
-                x_former.transform(feat.geometry().asPoint()) for feat in destination_features
-            ]
-
-            features_points = sources_features_x_formed + destination_features_x_formed
-
-        # Get IDs
-        sources_ids = (
-            list(range(sources_amount))
-            if source_equals_destination
-            else list(range(sources_amount))
-        )
-        destination_ids = (
-            list(range(sources_amount))
-            if source_equals_destination
-            else list(range(sources_amount, sources_amount + destinations_amount))
-        )
-
-        params = {
-            "locations": [[point.x(), point.y()] for point in features_points],
-            "sources": sources_ids,
-            "destinations": destination_ids,
-            "metrics": ["duration", "distance"],
-            "id": "Matrix",
-            # 'options': options
-        }
+            # same list, so tiles on the diagonal send their locations only once
+            destinations_points = sources_points
+        elif symmetric_mode != "Off":
+            feedback.pushWarning(
+                self.tr("Start and end layer differ, the full matrix is calculated.")
+            )
+            symmetric_mode = "Off"
+
+        k_nearest = self.parameterAsInt(parameters, self.IN_K_NEAREST, context)
+        nearest = None
+        if k_nearest > 0:
+            if symmetric_mode != "Off":
+                feedback.pushWarning(
+                    self.tr("The symmetric matrix mode is not used with k nearest destinations.")
+                )
+                symmetric_mode = "Off"
+            if source_equals_destination:
+                # a point is its own nearest destination
+                nearest = [
+                    [d for d in destinations if d != s][:k_nearest]
+                    for s, destinations in enumerate(
+                        spatial.get_nearest(sources_points, destinations_points, k_nearest + 1)
+                    )
+                ]
+            else:
+                nearest = spatial.get_nearest(sources_points, destinations_points, k_nearest)
 
         # get types of set ID fields
         field_types = dict()
@@ -194,48 +238,96 @@ class ORSMatrixAlgo(ORSBaseProcessingAlgorithm):
 
         sink_fields = self.get_fields(**field_types)
 
-        # Make request and catch ApiError
-        try:
-            endpoint = self.get_endpoint_names_from_provider(parameters[self.IN_PROVIDER])["matrix"]
-            response = ors_client.fetch_with_retry(
-                f"/v2/{endpoint}/{profile}", {}, post_json=params
-            )
+        (sink, dest_id) = self.parameterAsSink(
+            parameters, self.OUT, context, sink_fields, QgsWkbTypes.Type.NoGeometry
+        )
+        sink = self.buffered_sink(sink)
+
+        arrays_path = self.parameterAsFileOutput(parameters, self.OUT_ARRAYS, context)
+        array_writer = None
+        if arrays_path:
+            try:
+                array_writer = matrix_core.ArrayWriter(
+                    arrays_path, sources_ids, destinations_ids, symmetric_mode, nearest
+                )
+            except (ImportError, ValueError) as e:
+                raise QgsProcessingException(str(e))
 
-        except (exceptions.ApiError, exceptions.InvalidKey, exceptions.GenericServerError) as e:
-            msg = f"{e.__class__.__name__}: {str(e)}"
+        # Split the matrix into tiles the provider accepts and request them concurrently
+        endpoint = self.get_endpoint_names_from_provider(parameters[self.IN_PROVIDER])["matrix"]
+        max_routes = self.get_limits_from_provider(parameters[self.IN_PROVIDER])["matrix_routes"]
+
+        def report_error(msg: str) -> None:
             feedback.reportError(msg)
             logger.log(msg)
 
-        (sink, dest_id) = self.parameterAsSink(
-            parameters, self.OUT, context, sink_fields, QgsWkbTypes.Type.NoGeometry
-        )
+        for rows, durations, distances in matrix_core.get_row_blocks(
+            ors_client,
+            f"/v2/{endpoint}/{profile}",
+            sources_points,
+            destinations_points,
+            max_routes,
+            report_error,
+            symmetric=symmetric_mode != "Off",
+            nearest=nearest,
+        ):
+            if feedback.isCanceled():
+                break
+
+            # write the row block in chunks, without keeping features of other blocks around
+            with self.metrics.timer("build_features"):
+                for features in matrix_core.get_features(
+                    rows,
+                    durations,
+                    distances,
+                    sources_ids,
+                    destinations_ids,
+                    symmetric_mode,
+                    nearest,
+                ):
+                    sink.addFeatures(features, QgsFeatureSink.Flag.FastInsert)
+
+            if array_writer:
+                array_writer.write(rows, durations, distances)
+
+            feedback.setProgress(int(100.0 * rows.stop / sources_amount))
+
+        self.close_sink(sink, feedback)
+
+        results = {self.OUT: dest_id}
+        if array_writer:
+            array_writer.close()
+            results[self.OUT_ARRAYS] = arrays_path
+
+        return self.store_results(results)
 
-        sources_attributes = [
-            feat.attribute(source_field_name) if source_field_name else feat.id()
-            for feat in sources_features
-        ]
-        destinations_attributes = [
-            feat.attribute(destination_field_name) if destination_field_name else feat.id()
-            for feat in destination_features
-        ]
+    @staticmethod
+    def get_points_and_ids(
+        layer: QgsProcessingFeatureSource, id_field_name: Optional[str]
+    ) -> Tuple[List[List[float]], List[Any]]:
+        """
+        Reads WGS84 coordinates and ID values of a point layer without keeping its features.
 
-        for s, source in enumerate(sources_attributes):
-            for d, destination in enumerate(destinations_attributes):
-                duration = response["durations"][s][d]
-                distance = response["distances"][s][d]
-                feat = QgsFeature()
-                feat.setAttributes(
-                    [
-                        source,
-                        destination,
-                        duration / 3600 if duration is not None else None,
-                        distance / 1000 if distance is not None else None,
-                    ]
-                )
+        :param layer: source point layer
+        :param id_field_name: layer field containing id values, the feature ID is used if not set
+        :returns: [lon, lat] and ID value of every feature
+        """
+        x_former = transform.transformToWGS(layer.sourceCrs())
+
+        request = QgsFeatureRequest()
+        if id_field_name:
+            request.setSubsetOfAttributes([id_field_name], layer.fields())
+        else:
+            request.setNoAttributes()
 
-                sink.addFeature(feat)
+        points = []
+        ids = []
+        for feat in layer.getFeatures(request):
+            point = x_former.transform(feat.geometry().asPoint())
+            points.append([point.x(), point.y()])
+            ids.append(feat.attribute(id_field_name) if id_field_name else feat.id())
 
-        return {self.OUT: dest_id}
+        return points, ids
 
     # TODO working source_type and destination_type differ in both name and type from get_fields in directions_core.
     #  Change to be consistent
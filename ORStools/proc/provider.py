@@ -35,6 +35,7 @@ from .directions_lines_proc import ORSDirectionsLinesAlgo
 from .directions_points_layer_proc import ORSDirectionsPointsLayerAlgo
 from .directions_points_layers_proc import ORSDirectionsPointsLayersAlgo
 from .export_proc import ORSExportAlgo
+from .graph_routing_proc import ORSGraphRoutingAlgo
 from .isochrones_layer_proc import ORSIsochronesLayerAlgo
 from .isochrones_point_proc import ORSIsochronesPointAlgo
 from .matrix_proc import ORSMatrixAlgo
@@ -68,6 +69,7 @@ class ORStoolsProvider(QgsProcessingProvider):
         self.addAlgorithm(ORSIsochronesPointAlgo())
         self.addAlgorithm(ORSMatrixAlgo())
         self.addAlgorithm(ORSExportAlgo())
+        self.addAlgorithm(ORSGraphRoutingAlgo())
         self.addAlgorithm(ORSSnapLayerAlgo())
         self.addAlgorithm(ORSSnapPointAlgo())
 
@@ -27,6 +27,8 @@
  ***************************************************************************/
 """
 
+from collections import deque
+from itertools import islice
 from typing import Dict
 
 from qgis.PyQt.QtGui import QIcon
@@ -46,7 +48,7 @@ from ORStools.common import PROFILES
 from ORStools.utils.gui import GuiUtils
 from ORStools.utils.processing import get_snapped_point_features
 from ORStools.proc.base_processing_algorithm import ORSBaseProcessingAlgorithm
-from ORStools.utils import exceptions, logger, transform
+from ORStools.utils import logger, spatial, transform
 
 from ORStools.utils.wrapper import create_qgs_field
 
@@ -92,18 +94,7 @@ class ORSSnapLayerAlgo(ORSBaseProcessingAlgorithm):
         source = self.parameterAsSource(parameters, self.IN_POINTS, context)
         radius = self.parameterAsDouble(parameters, self.RADIUS, context)
 
-        sources_features = list(source.getFeatures())
-
         x_former = transform.transformToWGS(source.sourceCrs())
-        sources_features_x_formed = [
-            x_former.transform(feat.geometry().asPoint()) for feat in sources_features
-        ]
-
-        params = {
-            "locations": [[point.x(), point.y()] for point in sources_features_x_formed],
-            "radius": radius,
-            "id": None,
-        }
 
         sink_fields = QgsFields()
         sink_fields.append(create_qgs_field("NAME", QMetaType.Type.QString))
@@ -128,21 +119,104 @@ class ORSSnapLayerAlgo(ORSBaseProcessingAlgorithm):
             QgsWkbTypes.Type.Point,
             QgsCoordinateReferenceSystem.fromEpsgId(4326),
         )
+        sink = self.buffered_sink(sink)
+
+        # Snap the points in chunks the provider accepts, several chunks at a time
+        chunk_size = max(
+            1, int(self.get_limits_from_provider(parameters[self.IN_PROVIDER])["snap_locations"])
+        )
+
+        # Points sharing a location are snapped once, also across chunks: the snapped
+        # locations are kept for the points of later chunks, None if their request failed
+        snapped_locations = dict()
+        requested_locations = set()
+        # chunks in input order with the locations of their points
+        chunks = deque()
+        failed_chunks = set()
+
+        def get_requests():
+            features = source.getFeatures()
+            first = 0
+            while True:
+                with self.metrics.timer("read_features"):
+                    chunk = list(islice(features, chunk_size))
+                if not chunk:
+                    return
+
+                locations = spatial.group_by_location(
+                    ((point.x(), point.y()), i)
+                    for i, point in enumerate(
+                        x_former.transform(feat.geometry().asPoint()) for feat in chunk
+                    )
+                )
+                new_locations = [
+                    location for location in locations if location not in requested_locations
+                ]
+                requested_locations.update(new_locations)
+                chunks.append((first, chunk, locations))
+                # a chunk whose locations were all requested before waits for their results
+                if new_locations:
+                    params = {
+                        "locations": [list(location) for location in new_locations],
+                        "radius": radius,
+                        "id": None,
+                    }
+                    yield (first, chunk, new_locations), params
+                first += len(chunk)
+
+        count = source.featureCount()
+
+        def write_chunks():
+            """Writes the chunks whose locations are all snapped, in input order."""
+            while chunks and all(location in snapped_locations for location in chunks[0][2]):
+                first, chunk, locations = chunks.popleft()
+                if first in failed_chunks:
+                    continue
+
+                # hand the snapped location to every point at the requested location
+                snapped = [None] * len(chunk)
+                for location, chunk_indices in locations.items():
+                    for i in chunk_indices:
+                        snapped[i] = snapped_locations[location]
+
+                with self.metrics.timer("build_features"):
+                    point_features = get_snapped_point_features(
+                        {"locations": snapped}, chunk, feedback, first
+                    )
+                sink.addFeatures(point_features)
+
+                if count > 0:
+                    feedback.setProgress(int(100.0 * (first + len(chunk)) / count))
+
+        for (first, chunk, new_locations), response in ors_client.fetch_concurrently(
+            "/v2/snap/" + profile, {}, get_requests()
+        ):
+            if feedback.isCanceled():
+                break
+
+            # locations missing from the response could not be snapped
+            snapped_locations.update(dict.fromkeys(new_locations))
+
+            # A failed chunk is reported, the other chunks are still snapped
+            if isinstance(response, Exception):
+                msg = (
+                    f"Points {first + 1} to {first + len(chunk)} caused a "
+                    f"{response.__class__.__name__}: {str(response)}"
+                )
+                feedback.reportError(msg)
+                logger.log(msg, 2)
+                failed_chunks.add(first)
+            else:
+                snapped_locations.update(zip(new_locations, response.get("locations", [])))
 
-        # Make request and catch ApiError
-        try:
-            response = ors_client.fetch_with_retry("/v2/snap/" + profile, {}, post_json=params)
-            point_features = get_snapped_point_features(response, sources_features, feedback)
+            write_chunks()
 
-            for feat in point_features:
-                sink.addFeature(feat)
+        if not feedback.isCanceled():
+            write_chunks()
 
-        except (exceptions.ApiError, exceptions.InvalidKey, exceptions.GenericServerError) as e:
-            msg = f"{e.__class__.__name__}: {str(e)}"
-            feedback.reportError(msg)
-            logger.log(msg)
+        self.close_sink(sink, feedback)
 
-        return {self.OUT: dest_id}
+        return self.store_results({self.OUT: dest_id})
 
     def displayName(self) -> str:
         """
@@ -114,6 +114,7 @@ class ORSSnapPointAlgo(ORSBaseProcessingAlgorithm):
             QgsWkbTypes.Type.Point,
             QgsCoordinateReferenceSystem.fromEpsgId(4326),
         )
+        sink = self.buffered_sink(sink)
 
         # Make request and catch ApiError
         try:
@@ -128,7 +129,9 @@ class ORSSnapPointAlgo(ORSBaseProcessingAlgorithm):
             feedback.reportError(msg)
             logger.log(msg)
 
-        return {self.OUT: dest_id}
+        self.close_sink(sink, feedback)
+
+        return self.store_results({self.OUT: dest_id})
 
     def displayName(self) -> str:
         """
@@ -27,22 +27,44 @@
  ***************************************************************************/
 """
 
+import copy
 import os
+import threading
+from typing import Optional
 
+from qgis.PyQt.QtCore import QObject, pyqtSignal
 from qgis.core import QgsSettings
 
 
+class ConfigNotifier(QObject):
+    """Notifies about changes of the provider config written by the plugin."""
+
+    configChanged = pyqtSignal()
+
+
+notifier = ConfigNotifier()
+
+# in-memory copy of the config, read from the settings only after a change
+_config: Optional[dict] = None
+# processing algorithms read the config from their own threads
+_config_lock = threading.Lock()
+
+
 def read_config() -> dict:
     """
-    Reads config.yml from file and returns the parsed dict.
+    Returns the provider config. The settings are only read on the first call and after
+    the config was written or invalidated, later calls return a copy of the snapshot.
 
     :returns: Parsed settings dictionary.
     :rtype: dict
     """
-    s = QgsSettings()
-    config = s.value("ORStools/config")
+    global _config
+    with _config_lock:
+        config = _config
+        if config is None:
+            config = _config = QgsSettings().value("ORStools/config")
 
-    return config
+    return copy.deepcopy(config)
 
 
 def write_config(new_config: dict) -> None:
@@ -54,6 +76,18 @@ def write_config(new_config: dict) -> None:
     """
     s = QgsSettings()
     s.setValue("ORStools/config", new_config)
+    invalidate_config()
+
+
+def invalidate_config() -> None:
+    """
+    Drops the config snapshot, e.g. after the settings were changed without write_config,
+    and emits configChanged.
+    """
+    global _config
+    with _config_lock:
+        _config = None
+    notifier.configChanged.emit()
 
 
 def write_env_var(key: str, value: str) -> None:
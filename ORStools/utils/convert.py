@@ -27,7 +27,19 @@
  ***************************************************************************/
 """
 
-from typing import Union
+import struct
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Sequence, Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# WKB geometry types, 3D types are offset by WKB_Z
+WKB_LINESTRING = 2
+WKB_POLYGON = 3
+WKB_Z = 1000
 
 
 def decode_polyline(polyline: str, is3d: bool = False) -> list:
@@ -91,104 +103,264 @@ def decode_polyline(polyline: str, is3d: bool = False) -> list:
     return points
 
 
-def decode_extrainfo(extra_info: str, key: int) -> Union[int, str]:
-    waytypes = [
-        "Unknown",
-        "state Road",
-        "Road",
-        "Street",
-        "Path",
-        "Track",
-        "Cycleway",
-        "Footway",
-        "Ferry",
-        "Construction",
-    ]
-    surfaces = [
-        "Unknown",
-        "Paved",
-        "Unpaved",
-        "Asphalt",
-        "Concrete",
-        "Cobblestone",
-        "Metal",
-        "Wood",
-        "Compacted Gravel",
-        "Fine Grave",
-        "Gravel",
-        "Dirt",
-        "Ground",
-        "Ice",
-        "Paving Stones",
-        "Sand",
-        "Woodchips",
-        "Grass",
-        "Grass Paver",
-    ]
-    waycategory = ["Ford", "Ferry", "Steps", "Tollways", "Highway"]
-    restrictions = ["Permissive", "Private", "Delivery", "Destination", "Customers", "No"]
-    steepness = [
-        ">=16% decline",
-        "10% - <16% decline",
-        "7% - <10% decline",
-        "4% - <7% decline",
-        "1% - <4% decline",
-        "0% - <1% decline",
-        "1% - <4% incline",
-        "4% - <7% incline",
-        "7% - <10% incline",
-        "10% - <16% incline",
-        ">=16% incline",
+def decode_polylines(polylines: Iterable[str], is3d: bool = False) -> list:
+    """Decodes several Polyline strings at once.
+
+    With NumPy all polylines are decoded in one vectorized pass, otherwise each is
+    decoded by decode_polyline.
+
+    :param polylines: Encoded polylines, only the geometries.
+    :type polylines: list of str
+
+    :param is3d: Specifies if geometries contain Z component.
+    :type is3d: boolean
+
+    :returns: [lng, lat(, z)] coordinates per polyline, as arrays of shape (n, 2) or (n, 3)
+        with NumPy, as lists like decode_polyline otherwise
+    :rtype: list of numpy.ndarray or list of list
+    """
+    polylines = list(polylines)
+    if np is None:
+        return [decode_polyline(polyline, is3d) for polyline in polylines]
+
+    dimensions = 3 if is3d else 2
+    chunks = np.frombuffer("".join(polylines).encode("ascii"), dtype=np.uint8).astype(np.int64)
+    chunks -= 63
+    if not chunks.size:
+        return [np.empty((0, dimensions)) for _ in polylines]
+
+    # every value is encoded in 5 bit chunks, the 0x20 bit is set on all but its last chunk
+    is_last = chunks < 0x20
+    ends = np.flatnonzero(is_last)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    value_index = np.cumsum(is_last) - is_last
+    shifts = 5 * (np.arange(chunks.size) - starts[value_index])
+    values = np.add.reduceat((chunks & 0x1F) << shifts, starts)
+    # zigzag decoding of the signed deltas
+    values = (values >> 1) ^ -(values & 1)
+
+    # split the values at the end of each polyline by counting their last chunks
+    polyline_ends = np.cumsum([len(polyline) for polyline in polylines])
+    values_ends = np.concatenate(([0], np.cumsum(is_last)))[polyline_ends]
+
+    decoded = []
+    for deltas in np.split(values, values_ends[:-1]):
+        # deltas of lat, lng(, z) per point
+        points = np.cumsum(deltas.reshape(-1, dimensions), axis=0)
+        coordinates = np.empty(points.shape)
+        coordinates[:, 0] = np.round(points[:, 1] * 1e-5, 6)
+        coordinates[:, 1] = np.round(points[:, 0] * 1e-5, 6)
+        if is3d:
+            z = points[:, 2] * 1e-2
+            coordinates[:, 2] = np.round(z, 1)
+            # NumPy rounds ties to even, keep the results of decode_polyline
+            for i in np.flatnonzero(points[:, 2] % 10 == 5):
+                coordinates[i, 2] = round(float(z[i]), 1)
+        decoded.append(coordinates)
+
+    return decoded
+
+
+def coordinates_to_wkb(coordinates: Sequence, is3d: bool = False) -> bytes:
+    """Encodes coordinates as WKB linestring, e.g. for QgsGeometry.fromWkb.
+
+    :param coordinates: [lng, lat(, z)] coordinates, e.g. of a GeoJSON LineString or as
+        returned by decode_polylines
+    :type coordinates: numpy.ndarray or list of list
+
+    :param is3d: Specifies if coordinates contain Z component.
+    :type is3d: boolean
+
+    :returns: little endian WKB of a LineString or LineStringZ
+    :rtype: bytes
+    """
+    return _pack_header(WKB_LINESTRING, is3d) + _pack_points(coordinates)
+
+
+def rings_to_wkb(rings: Sequence, is3d: bool = False) -> bytes:
+    """Encodes rings as WKB polygon, e.g. for QgsGeometry.fromWkb.
+
+    :param rings: exterior ring followed by the interior rings, each a list of
+        [lng, lat(, z)] coordinates as in GeoJSON Polygons
+    :type rings: list of list
+
+    :param is3d: Specifies if coordinates contain Z component.
+    :type is3d: boolean
+
+    :returns: little endian WKB of a Polygon or PolygonZ
+    :rtype: bytes
+    """
+    return (
+        _pack_header(WKB_POLYGON, is3d)
+        + struct.pack("<I", len(rings))
+        + b"".join(_pack_points(ring) for ring in rings)
+    )
+
+
+def _pack_header(wkb_type: int, is3d: bool) -> bytes:
+    return struct.pack("<BI", 1, wkb_type + WKB_Z if is3d else wkb_type)
+
+
+def _pack_points(coordinates: Sequence) -> bytes:
+    """Number of points followed by their coordinates as little endian doubles."""
+    if np is not None and isinstance(coordinates, np.ndarray):
+        return struct.pack("<I", len(coordinates)) + coordinates.astype("<f8", copy=False).tobytes()
+
+    values = [value for point in coordinates for value in point]
+    return struct.pack(f"<I{len(values)}d", len(coordinates), *values)
+
+
+def polylines_to_wkb(polylines: Iterable[str], is3d: bool = False) -> List[bytes]:
+    """Decodes Polyline strings directly to WKB linestrings, without creating points.
+
+    :param polylines: Encoded polylines, only the geometries.
+    :type polylines: list of str
+
+    :param is3d: Specifies if geometries contain Z component.
+    :type is3d: boolean
+
+    :returns: little endian WKB of a LineString or LineStringZ per polyline
+    :rtype: list of bytes
+    """
+    return [
+        coordinates_to_wkb(coordinates, is3d) for coordinates in decode_polylines(polylines, is3d)
     ]
 
-    if extra_info == "waytypes":
-        try:
-            return waytypes[key]
-        except IndexError:
-            return "Unknown"
-    elif extra_info == "surface":
-        try:
-            return surfaces[key]
-        except IndexError:
-            return "Unknown"
-    elif extra_info == "waycategory":
-        binary = list(bin(key))[2:]
-        padding = ["0"] * (len(waycategory) - len(binary))
-        padded_binary = padding + binary
-        category = ""
-
-        for set_bit, value in zip(padded_binary, waycategory):
-            if set_bit == "1":
-                category += value
-
-        if category == "":
-            return "No category"
-
-        return category
-    elif extra_info == "roadaccessrestrictions":
-        binary = list(bin(key))[2:]
-        padding = ["0"] * (len(restrictions) - len(binary))
-        padded_binary = padding + binary
-        restriction = ""
-
-        for set_bit, value in zip(padded_binary, restrictions):
-            if set_bit == "1":
-                restriction += value
-                restriction += " "
-
-        if restriction == "":
-            return "None"
-
-        return restriction
-    elif extra_info == "steepness":
-        # We get values from -5 to 5 here, but our decoded array is 11 values long.
-        key += 5
+
+WAYTYPES = (
+    "Unknown",
+    "state Road",
+    "Road",
+    "Street",
+    "Path",
+    "Track",
+    "Cycleway",
+    "Footway",
+    "Ferry",
+    "Construction",
+)
+SURFACES = (
+    "Unknown",
+    "Paved",
+    "Unpaved",
+    "Asphalt",
+    "Concrete",
+    "Cobblestone",
+    "Metal",
+    "Wood",
+    "Compacted Gravel",
+    "Fine Grave",
+    "Gravel",
+    "Dirt",
+    "Ground",
+    "Ice",
+    "Paving Stones",
+    "Sand",
+    "Woodchips",
+    "Grass",
+    "Grass Paver",
+)
+# flags of the bitmask extra infos, from the highest to the lowest bit
+WAYCATEGORIES = ("Ford", "Ferry", "Steps", "Tollways", "Highway")
+RESTRICTIONS = ("Permissive", "Private", "Delivery", "Destination", "Customers", "No")
+STEEPNESS = (
+    ">=16% decline",
+    "10% - <16% decline",
+    "7% - <10% decline",
+    "4% - <7% decline",
+    "1% - <4% decline",
+    "0% - <1% decline",
+    "1% - <4% incline",
+    "4% - <7% incline",
+    "7% - <10% incline",
+    "10% - <16% incline",
+    ">=16% incline",
+)
+
+
+def _table_decoder(table: tuple, default: str, offset: int = 0) -> Callable[[int], str]:
+    """Decoder looking up codes in a table, with default for codes outside of it."""
+
+    def decode(key: int) -> str:
         try:
-            return steepness[key]
+            return table[key + offset]
         except IndexError:
-            return "No steepness available"
-    elif extra_info == "traildifficulty":
-        # TODO: we need to differentiate the profile here…
-        return key
-    else:
-        return key
+            return default
+
+    return decode
+
+
+def _bitmask_decoder(flags: tuple, suffix: str, empty: str) -> Callable[[int], str]:
+    """Decoder joining the names of all flags set in a code, cached per distinct code."""
+
+    @lru_cache(maxsize=None)
+    def decode(key: int) -> str:
+        # only the highest bits are read if the code has more bits than flags
+        key >>= max(0, key.bit_length() - len(flags))
+        names = "".join(
+            name + suffix
+            for bit, name in zip(range(len(flags) - 1, -1, -1), flags)
+            if key & (1 << bit)
+        )
+        return names or empty
+
+    return decode
+
+
+def _decode_key(key: int) -> int:
+    return key
+
+
+# decoders of the extra infos which aren't returned as is, by extra info name
+EXTRA_INFO_DECODERS: Dict[str, Callable[[int], Union[int, str]]] = {
+    "waytypes": _table_decoder(WAYTYPES, "Unknown"),
+    "surface": _table_decoder(SURFACES, "Unknown"),
+    "waycategory": _bitmask_decoder(WAYCATEGORIES, "", "No category"),
+    "roadaccessrestrictions": _bitmask_decoder(RESTRICTIONS, " ", "None"),
+    # values range from -5 to 5
+    "steepness": _table_decoder(STEEPNESS, "No steepness available", offset=5),
+}
+
+
+def decode_extrainfo(extra_info: str, key: int) -> Union[int, str]:
+    """
+    Decodes the value of an extra info to its readable name.
+
+    :param extra_info: name of the extra info, e.g. surface
+    :type extra_info: str
+
+    :param key: encoded value from the extra info's values
+    :type key: int
+
+    :returns: readable name, or the value itself for extra infos without names
+    :rtype: int or str
+    """
+    # TODO: traildifficulty needs to be differentiated by profile
+    return EXTRA_INFO_DECODERS.get(extra_info, _decode_key)(key)
+
+
+def decode_extrainfo_values(extra_info: str, values: Iterable[int]) -> List[Union[int, str]]:
+    """
+    Decodes all values of an extra info at once, each distinct value is only decoded once.
+
+    :param extra_info: name of the extra info, e.g. surface
+    :type extra_info: str
+
+    :param values: encoded values, e.g. the third item of each of the extra info's runs
+    :type values: list of int
+
+    :returns: readable names in the order of the values
+    :rtype: list
+    """
+    decoder = EXTRA_INFO_DECODERS.get(extra_info)
+    if decoder is None:
+        return list(values)
+
+    decoded = dict()
+    result = []
+    for key in values:
+        if key not in decoded:
+            decoded[key] = decoder(key)
+        result.append(decoded[key])
+
+    return result
@@ -75,9 +75,10 @@ class EmptyLayerError(Exception):
 class OverQueryLimit(Exception):
     """Signifies that the request failed because the client exceeded its query rate limit."""
 
-    def __init__(self, status, message=None):
+    def __init__(self, status, message=None, retry_after=None):
         self.status = status
         self.message = message
+        self.retry_after = retry_after
 
     def __str__(self):
         if self.message is None:
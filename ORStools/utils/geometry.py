@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ ORStools
+                                 A QGIS plugin
+ QGIS client to query openrouteservice
+                              -------------------
+        begin                : 2017-02-01
+        git sha              : $Format:%H$
+        copyright            : (C) 2021 by HeiGIT gGmbH
+        email                : support@openrouteservice.heigit.org
+ ***************************************************************************/
+
+ This plugin provides access to openrouteservice API functionalities
+ (https://openrouteservice.org), developed and
+ maintained by the openrouteservice team of HeiGIT gGmbH, Germany. By using
+ this plugin you agree to the ORS terms of service
+ (https://openrouteservice.org/terms-of-service/).
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from typing import Sequence
+
+from qgis.core import QgsGeometry
+
+from ORStools.utils import convert
+
+
+def from_wkb(wkb: bytes) -> QgsGeometry:
+    """
+    Builds a geometry from WKB.
+
+    :param wkb: well-known binary of the geometry
+    :type wkb: bytes
+
+    :rtype: QgsGeometry
+    """
+    geometry = QgsGeometry()
+    geometry.fromWkb(wkb)
+
+    return geometry
+
+
+def line_from_coordinates(coordinates: Sequence) -> QgsGeometry:
+    """
+    Builds a LineString geometry from GeoJSON coordinates without creating a point per vertex,
+    a LineStringZ if the coordinates have elevation.
+
+    :param coordinates: [lng, lat(, z)] coordinates
+    :type coordinates: list of list or numpy.ndarray
+
+    :rtype: QgsGeometry
+    """
+    return from_wkb(convert.coordinates_to_wkb(coordinates, _is3d(coordinates)))
+
+
+def polygon_from_rings(rings: Sequence) -> QgsGeometry:
+    """
+    Builds a Polygon geometry with all rings from GeoJSON coordinates without creating a
+    point per vertex, a PolygonZ if the coordinates have elevation.
+
+    :param rings: exterior ring followed by the interior rings
+    :type rings: list of list
+
+    :rtype: QgsGeometry
+    """
+    return from_wkb(convert.rings_to_wkb(rings, bool(rings) and _is3d(rings[0])))
+
+
+def _is3d(coordinates: Sequence) -> bool:
+    return len(coordinates) > 0 and len(coordinates[0]) > 2
@@ -96,7 +96,9 @@ def read_help_file(algorithm: str, locale: str = ""):
     return msg
 
 
-def get_snapped_point_features(response: dict, og_features=None, feedback=None) -> list:
+def get_snapped_point_features(
+    response: dict, og_features=None, feedback=None, first_index: int = 0
+) -> list:
     locations = response.get("locations", [])
     feats = []
     for i, location in enumerate(locations):
@@ -116,7 +118,7 @@ def get_snapped_point_features(response: dict, og_features=None, feedback=None)
             x, y = f.geometry().asPoint().x(), f.geometry().asPoint().y()
             feedback.pushWarning(
                 tr(
-                    f"Point {i + 1}: ({x}, {y}) could not be snapped and will be ignored in the output."
+                    f"Point {first_index + i + 1}: ({x}, {y}) could not be snapped and will be ignored in the output."
                 )
             )
 
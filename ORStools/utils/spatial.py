@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ ORStools
+                                 A QGIS plugin
+ QGIS client to query openrouteservice
+                              -------------------
+        begin                : 2017-02-01
+        git sha              : $Format:%H$
+        copyright            : (C) 2021 by HeiGIT gGmbH
+        email                : support@openrouteservice.heigit.org
+ ***************************************************************************/
+
+ This plugin provides access to openrouteservice API functionalities
+ (https://openrouteservice.org), developed and
+ maintained by the openrouteservice team of HeiGIT gGmbH, Germany. By using
+ this plugin you agree to the ORS terms of service
+ (https://openrouteservice.org/terms-of-service/).
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from math import asin, ceil, cos, degrees, radians, sin, sqrt
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from qgis.core import QgsPointXY, QgsRectangle, QgsSpatialIndex
+
+# Mean earth radius in meters
+EARTH_RADIUS = 6371008.8
+
+
+def haversine(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    """
+    Great circle distance between two WGS84 coordinates.
+
+    :returns: distance in meters
+    :rtype: float
+    """
+    lon1, lat1, lon2, lat2 = map(radians, (lon1, lat1, lon2, lat2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * asin(min(1.0, sqrt(a)))
+
+
+def group_by_location(
+    items: Iterable[Tuple[Sequence[float], Any]],
+) -> Dict[Tuple[float, float], List[Any]]:
+    """
+    Groups values by their WGS84 location, rounded to 6 decimals like the coordinates of
+    requests, so a location shared by several input features only needs to be requested once.
+
+    :param items: [lon, lat] and a value, e.g. an ID field value or a feature index
+    :type items: iterable
+
+    :returns: all values per rounded (lon, lat), in the order the locations first occur
+    :rtype: dict
+    """
+    groups = dict()
+    for (x, y), value in items:
+        groups.setdefault((round(x, 6), round(y, 6)), []).append(value)
+
+    return groups
+
+
+def split_extent(
+    x_min: float, y_min: float, x_max: float, y_max: float, max_area: float
+) -> List[List[List[float]]]:
+    """
+    Splits a WGS84 extent into a grid of equally sized tiles of at most the given area.
+
+    :param max_area: maximum area of a tile in square kilometers
+    :type max_area: float
+
+    :returns: [[x_min, y_min], [x_max, y_max]] of each tile, row by row from the south west
+    :rtype: list
+    """
+    # measure the width where the extent is widest, i.e. closest to the equator
+    widest = 0.0 if y_min <= 0 <= y_max else min(abs(y_min), abs(y_max))
+    width = haversine(x_min, widest, x_max, widest) / 1000
+    height = haversine(x_min, y_min, x_min, y_max) / 1000
+
+    side = sqrt(max_area)
+    columns = max(1, ceil(width / side))
+    rows = max(1, ceil(height / side))
+    xs = [x_min + (x_max - x_min) * i / columns for i in range(columns)] + [x_max]
+    ys = [y_min + (y_max - y_min) * i / rows for i in range(rows)] + [y_max]
+
+    return [
+        [[xs[column], ys[row]], [xs[column + 1], ys[row + 1]]]
+        for row in range(rows)
+        for column in range(columns)
+    ]
+
+
+def get_nearest(
+    origins: Sequence[Sequence[float]],
+    destinations: Sequence[Sequence[float]],
+    k: int,
+    max_distance: Optional[float] = None,
+) -> List[List[int]]:
+    """
+    Finds the k nearest destinations of each origin by straight-line distance.
+
+    Candidates are taken from a spatial index on the destinations and ranked by their
+    great circle distance, so the result doesn't depend on the distortion of degrees.
+
+    :param origins: [lon, lat] of all origins
+    :type origins: list
+
+    :param destinations: [lon, lat] of all destinations
+    :type destinations: list
+
+    :param k: number of destinations per origin
+    :type k: int
+
+    :param max_distance: optional maximum straight-line distance in meters
+    :type max_distance: float
+
+    :returns: indices of the nearest destinations per origin, nearest first
+    :rtype: list
+    """
+    index = QgsSpatialIndex()
+    for i, (x, y) in enumerate(destinations):
+        index.addFeature(i, QgsRectangle(x, y, x, y))
+
+    k = min(k, len(destinations))
+    nearest = []
+    for x, y in origins:
+        if k < 1:
+            nearest.append([])
+            continue
+
+        # the k nearest in degrees give an upper bound of the k-th nearest distance,
+        # every closer destination lies within the box around that radius
+        candidates = index.nearestNeighbor(QgsPointXY(x, y), k)
+        radius = max(haversine(x, y, *destinations[i]) for i in candidates)
+        if max_distance is not None:
+            radius = min(radius, max_distance)
+
+        delta_lat = degrees(radius / EARTH_RADIUS)
+        max_lat = min(90.0, abs(y) + delta_lat)
+        delta_lon = min(180.0, delta_lat / max(cos(radians(max_lat)), 1e-9))
+        candidates = index.intersects(
+            QgsRectangle(x - delta_lon, y - delta_lat, x + delta_lon, y + delta_lat)
+        )
+
+        ranked = sorted((haversine(x, y, *destinations[i]), i) for i in candidates)
+        nearest.append(
+            [i for distance, i in ranked[:k] if max_distance is None or distance <= max_distance]
+        )
+
+    return nearest
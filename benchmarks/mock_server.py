@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ ORStools
+                                 A QGIS plugin
+ QGIS client to query openrouteservice
+                              -------------------
+        begin                : 2017-02-01
+        git sha              : $Format:%H$
+        copyright            : (C) 2021 by HeiGIT gGmbH
+        email                : support@openrouteservice.heigit.org
+ ***************************************************************************/
+
+ This plugin provides access to openrouteservice API functionalities
+ (https://openrouteservice.org), developed and
+ maintained by the openrouteservice team of HeiGIT gGmbH, Germany. By using
+ this plugin you agree to the ORS terms of service
+ (https://openrouteservice.org/terms-of-service/).
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Local stand-in for the openrouteservice API, used to benchmark the processing algorithms.
+
+Answers directions, isochrones, matrix, optimization, snap and export requests with
+synthetic responses of configurable size, after a configurable latency. Every n-th request
+can be rejected with 429 to exercise the client's rate limit handling.
+"""
+
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from ORStools.proc import ENDPOINTS, LIMITS
+
+from .polyline_decoding import encode_polyline
+
+EARTH_RADIUS = 6371008.8
+# Speed [m/s] used to derive durations from distances
+SPEED = 10.0
+
+EXTRA_INFO_VALUES = {
+    "waytype": 11,
+    "surface": 19,
+    "waycategory": 32,
+    "roadaccessrestrictions": 64,
+    "steepness": 11,
+}
+
+
+def haversine(a: List[float], b: List[float]) -> float:
+    lng_1, lat_1, lng_2, lat_2 = map(math.radians, [a[0], a[1], b[0], b[1]])
+    h = (
+        math.sin((lat_2 - lat_1) / 2) ** 2
+        + math.cos(lat_1) * math.cos(lat_2) * math.sin((lng_2 - lng_1) / 2) ** 2
+    )
+
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(h))
+
+
+def interpolate(locations: List[List[float]], vertices: int) -> List[List[float]]:
+    """Straight line through the locations with about the given number of vertices."""
+    legs = max(1, len(locations) - 1)
+    steps = max(1, vertices // legs)
+    line = []
+    for start, end in zip(locations, locations[1:]):
+        for i in range(steps):
+            f = i / steps
+            line.append([start[0] + f * (end[0] - start[0]), start[1] + f * (end[1] - start[1])])
+    line.append(list(locations[-1][:2]))
+
+    return line
+
+
+def line_length(line: List[List[float]]) -> float:
+    return sum(haversine(a, b) for a, b in zip(line, line[1:]))
+
+
+class MockOrsServer:
+    """Threaded HTTP server answering like the openrouteservice API.
+
+    Use as a context manager or call start() and stop(). The provider() dictionary
+    can be written to the plugin config to route all requests to this server.
+
+    :param latency: seconds every request waits before it is answered
+    :type latency: float
+    :param rate_limit_every: reject every n-th request with 429, 0 disables it
+    :type rate_limit_every: int
+    :param retry_after: value of the Retry-After header sent with a 429 response
+    :type retry_after: int
+    :param route_vertices: number of vertices of a directions or optimization geometry
+    :type route_vertices: int
+    :param ring_vertices: number of vertices of an isochrone ring
+    :type ring_vertices: int
+    :param export_spacing: distance in degrees between the nodes of the exported lattice network
+    :type export_spacing: float
+    """
+
+    SERVICES = {
+        name: re.compile(pattern)
+        for name, pattern in {
+            "directions": rf"^/v2/{ENDPOINTS['directions']}/[^/]+/geojson$",
+            "isochrones": rf"^/v2/{ENDPOINTS['isochrones']}/[^/]+$",
+            "matrix": rf"^/v2/{ENDPOINTS['matrix']}/[^/]+$",
+            "optimization": rf"^/{ENDPOINTS['optimization']}/?$",
+            # the snapping algorithms request the API's path directly
+            "snapping": r"^/v2/snap/[^/]+$",
+            "export": rf"^/v2/{ENDPOINTS['export']}/[^/]+$",
+        }.items()
+    }
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        rate_limit_every: int = 0,
+        retry_after: int = 0,
+        route_vertices: int = 200,
+        ring_vertices: int = 64,
+        export_spacing: float = 0.005,
+    ) -> None:
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.route_vertices = route_vertices
+        self.ring_vertices = ring_vertices
+        self.export_spacing = export_spacing
+
+        self.requests: Dict[str, int] = {}
+        self.rejected = 0
+        self._received = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def request_count(self) -> int:
+        return sum(self.requests.values())
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.requests = {}
+            self.rejected = 0
+            self._received = 0
+
+    def provider(self, name: str = "mock", concurrent_requests: int = 1) -> dict:
+        """Provider configuration pointing to this server."""
+        return {
+            "ENV_VARS": {
+                "ORS_QUOTA": "X-Ratelimit-Limit",
+                "ORS_REMAINING": "X-Ratelimit-Remaining",
+            },
+            "base_url": self.url,
+            "key": "mock",
+            "name": name,
+            "timeout": 60,
+            "concurrent_requests": concurrent_requests,
+            "cache": False,
+            "endpoints": ENDPOINTS,
+            "limits": LIMITS,
+        }
+
+    def start(self) -> "MockOrsServer":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = self._thread = None
+
+    def __enter__(self) -> "MockOrsServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def count(self, service: str) -> bool:
+        """Counts a request and returns whether it gets rejected with 429."""
+        with self._lock:
+            self._received += 1
+            if self.rate_limit_every and self._received % self.rate_limit_every == 0:
+                self.rejected += 1
+                return True
+            self.requests[service] = self.requests.get(service, 0) + 1
+
+        return False
+
+    def respond(self, service: str, body: dict) -> dict:
+        return getattr(self, service)(body)
+
+    def directions(self, body: dict) -> dict:
+        line = interpolate(body["coordinates"], self.route_vertices)
+        coordinates = [
+            [x, y, round(100 + 10 * math.sin(i / 10), 1)] for i, (x, y) in enumerate(line)
+        ]
+        distance = line_length(line)
+
+        extras = {}
+        for key in body.get("extra_info") or []:
+            # runs of 10 vertices, cycling through the valid values
+            modulus = EXTRA_INFO_VALUES.get(key, 10)
+            offset = -5 if key == "steepness" else 0
+            values = [
+                [start, min(start + 10, len(coordinates) - 1), (start // 10) % modulus + offset]
+                for start in range(0, len(coordinates) - 1, 10)
+            ]
+            extras[key] = {"values": values, "summary": []}
+
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "LineString", "coordinates": coordinates},
+                    "properties": {
+                        "summary": {"distance": distance, "duration": distance / SPEED},
+                        "extras": extras,
+                        "way_points": [0, len(coordinates) - 1],
+                    },
+                }
+            ],
+        }
+
+    def isochrones(self, body: dict) -> dict:
+        # time ranges are in seconds, distance ranges in meters
+        factor = SPEED if body.get("range_type", "time") == "time" else 1
+        features = []
+        for group_index, center in enumerate(body["locations"]):
+            for value in sorted(body["range"], reverse=True):
+                radius = value * factor / EARTH_RADIUS
+                ring = []
+                for i in range(self.ring_vertices):
+                    angle = 2 * math.pi * i / self.ring_vertices
+                    ring.append(
+                        [
+                            center[0]
+                            + math.degrees(radius * math.cos(angle))
+                            / math.cos(math.radians(center[1])),
+                            center[1] + math.degrees(radius * math.sin(angle)),
+                        ]
+                    )
+                ring.append(ring[0])
+                features.append(
+                    {
+                        "type": "Feature",
+                        "geometry": {"type": "Polygon", "coordinates": [ring]},
+                        "properties": {
+                            "group_index": group_index,
+                            "value": value,
+                            "center": center,
+                            "total_pop": 1000.0,
+                        },
+                    }
+                )
+
+        return {"type": "FeatureCollection", "features": features}
+
+    def matrix(self, body: dict) -> dict:
+        locations = body["locations"]
+        sources = body.get("sources", list(range(len(locations))))
+        destinations = body.get("destinations", list(range(len(locations))))
+        distances = [[haversine(locations[s], locations[d]) for d in destinations] for s in sources]
+
+        return {
+            "durations": [[distance / SPEED for distance in row] for row in distances],
+            "distances": distances,
+            "sources": [{"location": locations[s]} for s in sources],
+            "destinations": [{"location": locations[d]} for d in destinations],
+        }
+
+    def optimization(self, body: dict) -> dict:
+        vehicle = body["vehicles"][0]
+        # jobs are visited in the order they were sent
+        stops = [job["location"] for job in body["jobs"]]
+        steps = [{"type": "job", "location": location} for location in stops]
+        if "start" in vehicle:
+            stops.insert(0, vehicle["start"])
+            steps.insert(0, {"type": "start", "location": vehicle["start"]})
+        if "end" in vehicle:
+            stops.append(vehicle["end"])
+            steps.append({"type": "end", "location": vehicle["end"]})
+
+        line = interpolate(stops, self.route_vertices)
+        distance = line_length(line)
+
+        return {
+            "code": 0,
+            "routes": [
+                {
+                    "vehicle": vehicle["id"],
+                    "geometry": encode_polyline(line),
+                    "distance": distance,
+                    "duration": distance / SPEED,
+                    "cost": distance / SPEED,
+                    "steps": steps,
+                }
+            ],
+        }
+
+    def snapping(self, body: dict) -> dict:
+        return {
+            "locations": [
+                {"location": location, "name": "Mock street", "snapped_distance": 1.5}
+                for location in body["locations"]
+            ]
+        }
+
+    def export(self, body: dict) -> dict:
+        # nodes of a global lattice, so node IDs of adjacent extents match
+        (x_min, y_min), (x_max, y_max) = body["bbox"]
+        step = self.export_spacing
+
+        def node(column: int, row: int) -> dict:
+            return {
+                "nodeId": (row + 100000) * 1000000 + column + 100000,
+                "location": [round(column * step, 6), round(row * step, 6)],
+            }
+
+        nodes = dict()
+        edges = []
+        for row in range(math.ceil(y_min / step), math.floor(y_max / step) + 1):
+            for column in range(math.ceil(x_min / step), math.floor(x_max / step) + 1):
+                current = node(column, row)
+                nodes[current["nodeId"]] = current
+                for other_column, other_row in (
+                    (column + 1, row),
+                    (column, row + 1),
+                    (column - 1, row),
+                    (column, row - 1),
+                ):
+                    other = node(other_column, other_row)
+                    x, y = other["location"]
+                    inside = x_min <= x <= x_max and y_min <= y <= y_max
+                    # edges within the extent are added from their south west node,
+                    # edges crossing its border from the node inside
+                    if inside and (other_column < column or other_row < row):
+                        continue
+                    nodes[other["nodeId"]] = other
+                    weight = haversine(current["location"], other["location"]) / SPEED
+                    for from_node, to_node in ((current, other), (other, current)):
+                        edges.append(
+                            {
+                                "fromId": from_node["nodeId"],
+                                "toId": to_node["nodeId"],
+                                "weight": weight,
+                            }
+                        )
+
+        return {"nodes": list(nodes.values()), "edges": edges}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        mock = self.server.mock
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or "{}")
+        path = urlsplit(self.path).path
+        service = next((s for s, pattern in mock.SERVICES.items() if pattern.match(path)), None)
+
+        if mock.latency:
+            threading.Event().wait(mock.latency)
+
+        if service is None:
+            self._send(404, {"error": {"code": 404, "message": f"Unknown path {path}"}})
+        elif mock.count(service):
+            self._send(
+                429,
+                {"error": "Rate limit exceeded"},
+                {"Retry-After": str(mock.retry_after), "X-Ratelimit-Remaining": "0"},
+            )
+        else:
+            try:
+                self._send(200, mock.respond(service, body))
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                self._send(400, {"error": {"code": 400, "message": f"{e.__class__.__name__}: {e}"}})
+
+    def _send(self, status: int, body: dict, headers: Optional[dict] = None) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("X-Ratelimit-Limit", "1000000")
+        # the quota is reset every minute, like the rate limits of the public API
+        self.send_header("X-Ratelimit-Reset", str(int(time.time()) // 60 * 60 + 60))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if "X-Ratelimit-Remaining" not in (headers or {}):
+            self.send_header("X-Ratelimit-Remaining", "1000000")
+        self.end_headers()
+        self.wfile.write(payload)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ ORStools
+                                 A QGIS plugin
+ QGIS client to query openrouteservice
+                              -------------------
+        begin                : 2017-02-01
+        git sha              : $Format:%H$
+        copyright            : (C) 2021 by HeiGIT gGmbH
+        email                : support@openrouteservice.heigit.org
+ ***************************************************************************/
+
+ This plugin provides access to openrouteservice API functionalities
+ (https://openrouteservice.org), developed and
+ maintained by the openrouteservice team of HeiGIT gGmbH, Germany. By using
+ this plugin you agree to the ORS terms of service
+ (https://openrouteservice.org/terms-of-service/).
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Compares decoding optimization route geometries with decode_polyline and decode_polylines.
+
+Run from the repository root with ``python -m benchmarks.polyline_decoding``, NumPy is
+needed for the vectorized decoder.
+"""
+
+import random
+import timeit
+
+from ORStools.utils import convert
+
+
+def encode_value(value: int) -> str:
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = ""
+    while value >= 0x20:
+        chunks += chr((0x20 | (value & 0x1F)) + 63)
+        value >>= 5
+
+    return chunks + chr(value + 63)
+
+
+def encode_polyline(points: list, is3d: bool = False) -> str:
+    """Encodes [lng, lat(, z)] points like the openrouteservice API."""
+    polyline = ""
+    previous = [0, 0, 0]
+    for point in points:
+        values = [round(point[1] * 1e5), round(point[0] * 1e5)]
+        if is3d:
+            values.append(round(point[2] * 1e2))
+        for i, value in enumerate(values):
+            polyline += encode_value(value - previous[i])
+            previous[i] = value
+
+    return polyline
+
+
+def random_route(length: int, is3d: bool) -> list:
+    lng, lat, z = random.uniform(5, 15), random.uniform(45, 55), random.uniform(0, 1000)
+    points = []
+    for _ in range(length):
+        lng += random.uniform(-0.001, 0.001)
+        lat += random.uniform(-0.001, 0.001)
+        z += random.uniform(-5, 5)
+        points.append([lng, lat, z])
+
+    return points
+
+
+def main(routes: int = 200, length: int = 2000, repeat: int = 5) -> None:
+    random.seed(0)
+    for is3d in (False, True):
+        polylines = [encode_polyline(random_route(length, is3d), is3d) for _ in range(routes)]
+
+        cases = {
+            "decode_polyline": lambda: [convert.decode_polyline(p, is3d) for p in polylines],
+            "decode_polylines": lambda: convert.decode_polylines(polylines, is3d),
+            "polylines_to_wkb": lambda: convert.polylines_to_wkb(polylines, is3d),
+        }
+        print(f"{routes} routes of {length} points, 3D: {is3d}")
+        for name, case in cases.items():
+            seconds = min(timeit.repeat(case, number=1, repeat=repeat))
+            print(f"  {name:<20}{seconds * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    if convert.np is None:
+        print("NumPy is not installed, decode_polylines falls back to decode_polyline.")
+    main()
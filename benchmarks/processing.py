@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ ORStools
+                                 A QGIS plugin
+ QGIS client to query openrouteservice
+                              -------------------
+        begin                : 2017-02-01
+        git sha              : $Format:%H$
+        copyright            : (C) 2021 by HeiGIT gGmbH
+        email                : support@openrouteservice.heigit.org
+ ***************************************************************************/
+
+ This plugin provides access to openrouteservice API functionalities
+ (https://openrouteservice.org), developed and
+ maintained by the openrouteservice team of HeiGIT gGmbH, Germany. By using
+ this plugin you agree to the ORS terms of service
+ (https://openrouteservice.org/terms-of-service/).
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Times the processing algorithms end to end against a local mock of the openrouteservice API.
+
+Every algorithm runs at several input sizes. For each run the time of the phases (building the
+input layers, processing, reading the output), the requests per second the mock server answered
+and the peak Python memory are reported. Run from the repository root with a QGIS Python::
+
+    python -m benchmarks.processing --sizes 10 100 1000 --latency 0.05 --concurrency 4
+    python -m benchmarks.processing --save        # store the results as baseline
+    python -m benchmarks.processing --compare     # exit with 1 if a run regressed
+
+The plugin settings are restored after the run, the mock provider is only added temporarily.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple
+
+from qgis.core import (
+    QgsFeature,
+    QgsGeometry,
+    QgsPointXY,
+    QgsProcessingContext,
+    QgsProcessingFeedback,
+    QgsProcessingUtils,
+    QgsRectangle,
+    QgsVectorLayer,
+)
+
+from tests.utils.utilities import get_qgis_app
+
+from ORStools.proc.directions_lines_proc import ORSDirectionsLinesAlgo
+from ORStools.proc.directions_points_layer_proc import ORSDirectionsPointsLayerAlgo
+from ORStools.proc.directions_points_layers_proc import ORSDirectionsPointsLayersAlgo
+from ORStools.proc.export_proc import ORSExportAlgo
+from ORStools.proc.isochrones_layer_proc import ORSIsochronesLayerAlgo
+from ORStools.proc.isochrones_point_proc import ORSIsochronesPointAlgo
+from ORStools.proc.matrix_proc import ORSMatrixAlgo
+from ORStools.proc.snap_layer_proc import ORSSnapLayerAlgo
+from ORStools.proc.snap_point_proc import ORSSnapPointAlgo
+from ORStools.utils import configmanager
+
+from .mock_server import MockOrsServer
+
+BASELINE = Path(__file__).parent / "baselines" / "processing.json"
+
+# Heidelberg
+CENTER = (8.68, 49.41)
+
+OPTIONS = {
+    "INPUT_AVOID_BORDERS": None,
+    "INPUT_AVOID_COUNTRIES": "",
+    "INPUT_AVOID_FEATURES": [],
+    "INPUT_AVOID_POLYGONS": None,
+    "INPUT_PREFERENCE": 0,
+    "INPUT_PROFILE": 0,
+    "OUTPUT": "TEMPORARY_OUTPUT",
+}
+
+
+def random_points(size: int, spread: float = 0.1) -> List[QgsPointXY]:
+    return [
+        QgsPointXY(
+            CENTER[0] + random.uniform(-spread, spread), CENTER[1] + random.uniform(-spread, spread)
+        )
+        for _ in range(size)
+    ]
+
+
+def point_layer(size: int) -> QgsVectorLayer:
+    layer = QgsVectorLayer("point?crs=epsg:4326", "benchmark points", "memory")
+    features = []
+    for point in random_points(size):
+        feature = QgsFeature()
+        feature.setGeometry(QgsGeometry.fromPointXY(point))
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+
+    return layer
+
+
+def line_layer(size: int, vertices: int = 5) -> QgsVectorLayer:
+    layer = QgsVectorLayer("linestring?crs=epsg:4326", "benchmark lines", "memory")
+    features = []
+    for _ in range(size):
+        feature = QgsFeature()
+        feature.setGeometry(QgsGeometry.fromPolylineXY(random_points(vertices)))
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+
+    return layer
+
+
+class Scenario(NamedTuple):
+    """An algorithm and the parameters of a run with the given input size."""
+
+    name: str
+    algorithm: Callable
+    parameters: Callable[[int], dict]
+    # whether the input size changes the run, single point algorithms only run once
+    scales: bool = True
+
+
+SCENARIOS = [
+    Scenario(
+        "directions_from_points_1_layer",
+        ORSDirectionsPointsLayerAlgo,
+        lambda size: {
+            **OPTIONS,
+            "INPUT_POINT_LAYER": point_layer(size),
+            "INPUT_LAYER_FIELD": None,
+            "INPUT_OPTIMIZE": None,
+            "INPUT_SORTBY": None,
+        },
+    ),
+    Scenario(
+        "directions_from_points_2_layers",
+        ORSDirectionsPointsLayersAlgo,
+        lambda size: {
+            **OPTIONS,
+            "INPUT_START_LAYER": point_layer(size),
+            "INPUT_START_FIELD": None,
+            "INPUT_SORT_START_BY": None,
+            "INPUT_END_LAYER": point_layer(size),
+            "INPUT_END_FIELD": None,
+            "INPUT_SORT_END_BY": None,
+            # row by row
+            "INPUT_MODE": 0,
+        },
+    ),
+    Scenario(
+        "directions_from_polylines_layer",
+        ORSDirectionsLinesAlgo,
+        lambda size: {
+            **OPTIONS,
+            "INPUT_LINE_LAYER": line_layer(size),
+            "INPUT_LAYER_FIELD": None,
+            "INPUT_OPTIMIZE": None,
+            "INPUT_METRIC": 0,
+            "LOCATION_TYPE": 0,
+        },
+    ),
+    Scenario(
+        "optimization_from_polylines_layer",
+        ORSDirectionsLinesAlgo,
+        lambda size: {
+            **OPTIONS,
+            "INPUT_LINE_LAYER": line_layer(size),
+            "INPUT_LAYER_FIELD": None,
+            "INPUT_OPTIMIZE": 1,
+            "INPUT_METRIC": 0,
+            "LOCATION_TYPE": 0,
+        },
+    ),
+    Scenario(
+        "isochrones_from_layer",
+        ORSIsochronesLayerAlgo,
+        lambda size: {
+            **OPTIONS,
+            "INPUT_POINT_LAYER": point_layer(size),
+            "INPUT_FIELD": None,
+            "INPUT_METRIC": 0,
+            "INPUT_RANGES": "5, 10",
+            "INPUT_SMOOTHING": None,
+            "LOCATION_TYPE": 0,
+        },
+    ),
+    Scenario(
+        "isochrones_from_point",
+        ORSIsochronesPointAlgo,
+        lambda size: {
+            **OPTIONS,
+            "INPUT_POINT": f"{CENTER[0]},{CENTER[1]} [EPSG:4326]",
+            "INPUT_METRIC": 0,
+            "INPUT_RANGES": "5, 10",
+            "INPUT_SMOOTHING": None,
+            "LOCATION_TYPE": 0,
+        },
+        scales=False,
+    ),
+    Scenario(
+        "matrix_from_layers",
+        ORSMatrixAlgo,
+        lambda size: {
+            **OPTIONS,
+            "INPUT_START_LAYER": point_layer(size),
+            "INPUT_START_FIELD": None,
+            "INPUT_END_LAYER": point_layer(size),
+            "INPUT_END_FIELD": None,
+        },
+    ),
+    Scenario(
+        "snap_from_point_layer",
+        ORSSnapLayerAlgo,
+        lambda size: {**OPTIONS, "IN_POINTS": point_layer(size), "RADIUS": 300},
+    ),
+    Scenario(
+        "snap_from_point",
+        ORSSnapPointAlgo,
+        lambda size: {**OPTIONS, "IN_POINT": f"{CENTER[0]},{CENTER[1]} [EPSG:4326]", "RADIUS": 300},
+        scales=False,
+    ),
+    Scenario(
+        "export_network_from_map",
+        ORSExportAlgo,
+        # extent with a side of size / 1000 degrees
+        lambda size: {
+            **OPTIONS,
+            "INPUT_EXPORT": QgsRectangle(
+                CENTER[0], CENTER[1], CENTER[0] + size / 1000, CENTER[1] + size / 1000
+            ),
+            "OUTPUT_POINT": "TEMPORARY_OUTPUT",
+        },
+    ),
+]
+
+
+def run_scenario(
+    scenario: Scenario, size: int, provider: int, server: MockOrsServer
+) -> Dict[str, float]:
+    """Runs an algorithm once and returns the time of its phases and resource use."""
+    context = QgsProcessingContext()
+    feedback = QgsProcessingFeedback()
+    server.reset_counts()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    parameters = scenario.parameters(size)
+    parameters["INPUT_PROVIDER"] = provider
+    algorithm = scenario.algorithm().create()
+    algorithm.prepareAlgorithm(parameters, context, feedback)
+    prepared = time.perf_counter()
+
+    results = algorithm.processAlgorithm(parameters, context, feedback)
+    processed = time.perf_counter()
+
+    features = 0
+    for name, value in results.items():
+        if name.startswith("OUTPUT") and not name.endswith(("JOURNAL", "ARRAYS")):
+            layer = QgsProcessingUtils.mapLayerFromString(value, context)
+            features += sum(1 for _ in layer.getFeatures()) if layer else 0
+    read = time.perf_counter()
+
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    process_time = processed - prepared
+    return {
+        "prepare_s": round(prepared - start, 4),
+        "process_s": round(process_time, 4),
+        "read_s": round(read - processed, 4),
+        "requests": server.request_count,
+        "rejected": server.rejected,
+        "requests_per_s": round(server.request_count / process_time, 2) if process_time else 0,
+        "peak_mib": round(peak / 2**20, 2),
+        "features": features,
+        "phases_s": algorithm.metrics.summary()["phases_s"],
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Lists the runs whose processing time or peak memory exceed the baseline by the tolerance."""
+    regressions = []
+    for name, runs in results.items():
+        for size, result in runs.items():
+            reference = baseline.get(name, {}).get(size)
+            if not reference:
+                continue
+            for metric in ("process_s", "peak_mib"):
+                if result[metric] > reference[metric] * (1 + tolerance):
+                    regressions.append(
+                        f"{name} [{size}] {metric}: {result[metric]} > {reference[metric]}"
+                    )
+
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--only", nargs="+", help="names of the algorithms to run")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per request")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="reject every n-th request")
+    parser.add_argument("--route-vertices", type=int, default=200)
+    parser.add_argument("--ring-vertices", type=int, default=64)
+    parser.add_argument("--export-spacing", type=float, default=0.005, help="degrees")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent requests")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="save the results as baseline")
+    parser.add_argument("--compare", action="store_true", help="compare with the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    random.seed(0)
+    get_qgis_app()
+
+    server = MockOrsServer(
+        latency=args.latency,
+        rate_limit_every=args.rate_limit_every,
+        route_vertices=args.route_vertices,
+        ring_vertices=args.ring_vertices,
+        export_spacing=args.export_spacing,
+    )
+    config = configmanager.read_config()
+    results = {}
+    with server:
+        benchmark_config = configmanager.read_config()
+        benchmark_config["providers"].append(
+            server.provider("benchmark", concurrent_requests=args.concurrency)
+        )
+        configmanager.write_config(benchmark_config)
+        provider = len(benchmark_config["providers"]) - 1
+        try:
+            for scenario in SCENARIOS:
+                if args.only and scenario.name not in args.only:
+                    continue
+                results[scenario.name] = {}
+                for size in args.sizes if scenario.scales else args.sizes[:1]:
+                    result = run_scenario(scenario, size, provider, server)
+                    results[scenario.name][str(size)] = result
+                    print(
+                        f"{scenario.name:<34} {size:>6}  "
+                        f"prepare {result['prepare_s']:>8.3f} s  "
+                        f"process {result['process_s']:>8.3f} s  "
+                        f"read {result['read_s']:>8.3f} s  "
+                        f"{result['requests_per_s']:>8.1f} req/s  "
+                        f"{result['peak_mib']:>8.1f} MiB"
+                    )
+        finally:
+            configmanager.write_config(config)
+
+    if args.save:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(results, indent=2, sort_keys=True))
+        print(f"Saved baseline to {args.baseline}")
+
+    if args.compare:
+        if not args.baseline.exists():
+            print(f"No baseline at {args.baseline}, run with --save first")
+            return 1
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
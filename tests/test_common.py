@@ -1,8 +1,24 @@
-from qgis.core import QgsPointXY
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY
 from qgis.testing import unittest
 
-from ORStools.common import client, directions_core, isochrones_core
+from ORStools.common import (
+    client,
+    directions_core,
+    export_core,
+    graph_core,
+    isochrones_core,
+    matrix_core,
+)
+from ORStools.common.cache import ResponseCache
+from ORStools.common.journal import RequestJournal, get_journal_path
+from ORStools.common.metrics import RunMetrics, percentile
+from ORStools.common.rate_limiter import RateLimiter
+from benchmarks.mock_server import MockOrsServer
+import json
 import os
+import tempfile
+import time
+from unittest import mock
 
 
 class TestCommon(unittest.TestCase):
@@ -63,6 +79,158 @@ class TestCommon(unittest.TestCase):
         self.assertTrue(response)
         self.assertEqual(response["success"], True)
 
+    def test_client_mock_server(self):
+        """Test concurrent requests against the local mock server, including a rejected one"""
+        with MockOrsServer(latency=0.05, rate_limit_every=4) as server:
+            clnt = client.Client(server.provider(concurrent_requests=3), "QGIS_ORStools_testing")
+            requests = [
+                (i, {"coordinates": [[8.68, 49.41], [8.69 + i / 100, 49.42]]}) for i in range(6)
+            ]
+            results = list(
+                clnt.fetch_concurrently("/v2/directions/driving-car/geojson", {}, requests)
+            )
+
+            self.assertEqual([key for key, _ in results], list(range(6)))
+            for _, response in results:
+                self.assertEqual(len(response["features"][0]["geometry"]["coordinates"]), 201)
+            self.assertEqual(server.requests, {"directions": 6})
+            self.assertEqual(server.rejected, 1)
+
+            summary = clnt.metrics.summary()
+            self.assertEqual(
+                summary["endpoints"]["/v2/directions/driving-car/geojson"]["requests"], 7
+            )
+            self.assertEqual(summary["counters"]["retries"], 1)
+
+    def test_rate_limiter_over_query_limit(self):
+        clock = [1000.0]
+        with mock.patch("ORStools.common.rate_limiter.time.monotonic", lambda: clock[0]):
+            limiter = RateLimiter()
+            for _ in range(3):
+                self.assertEqual(limiter.reserve(), 0.0)
+                limiter.update({})
+
+            # 3 requests per minute are learned, with a 10 % margin
+            limiter.on_over_query_limit(10)
+            self.assertAlmostEqual(limiter.rate, 3 / 60 * 0.9)
+            self.assertAlmostEqual(limiter.reserve(), 1 / limiter.rate)
+
+            # the waits end with the learned rate, a minute after the pause
+            for _ in range(5):
+                self.assertLessEqual(limiter.reserve(), 70.0)
+
+            clock[0] += 70
+            self.assertEqual(limiter.reserve(), 0.0)
+            self.assertIsNone(limiter.rate)
+
+            # a later over query limit learns the rate again instead of keeping the lowest
+            for _ in range(30):
+                limiter.update({})
+            limiter.on_over_query_limit(1)
+            self.assertAlmostEqual(limiter.rate, 30 / 60 * 0.9)
+
+    def test_rate_limiter_headers(self):
+        clock = [1000.0]
+        with mock.patch("ORStools.common.rate_limiter.time.monotonic", lambda: clock[0]):
+            limiter = RateLimiter()
+            # the remaining quota is spread until the reset
+            limiter.update({"limit": 40, "remaining": 20, "reset": 10})
+            self.assertAlmostEqual(limiter.rate, 2 * 0.9)
+            self.assertEqual(limiter.reserve(), 0.0)
+            self.assertAlmostEqual(limiter.reserve(), 1 / limiter.rate)
+
+            # the headers pace the requests, an over query limit only pauses them
+            limiter.on_over_query_limit(5)
+            self.assertAlmostEqual(limiter.rate, 2 * 0.9)
+            self.assertGreaterEqual(limiter.reserve(), 5.0)
+
+            # used up, the quota blocks until the reset and is paced by its limit afterwards
+            limiter.update({"limit": 40, "remaining": 0, "reset": 30})
+            self.assertGreaterEqual(limiter.reserve(), 30.0)
+            self.assertAlmostEqual(limiter.rate, 40 / 60 * 0.9)
+
+            # daily quotas are not spread, a retry after blocks until it passed
+            limiter = RateLimiter()
+            limiter.update({"limit": 2000, "remaining": 1000, "reset": 86400, "retry_after": 3})
+            self.assertIsNone(limiter.rate)
+            self.assertEqual(limiter.reserve(), 3.0)
+            clock[0] += 3
+            self.assertEqual(limiter.reserve(), 0.0)
+
+    def test_run_metrics(self):
+        self.assertEqual(percentile([], 50), 0.0)
+        self.assertEqual(percentile([4, 1, 3, 2], 50), 2)
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+
+        metrics = RunMetrics()
+        with metrics.timer("read_features"):
+            pass
+        with metrics.timer("read_features"):
+            pass
+        # nested phases are not counted in the outer one
+        with metrics.timer("build_features"):
+            with metrics.timer("write_sink"):
+                time.sleep(0.05)
+        self.assertGreaterEqual(metrics.phases["write_sink"], 0.05)
+        self.assertLess(metrics.phases["build_features"], 0.05)
+        metrics.count("retries")
+        metrics.count("retries", 2)
+        metrics.add_request("/v2/matrix/driving-car", 0.1, 100, 2000)
+        metrics.add_request("/v2/matrix/driving-car", 0.3, 100, 2000)
+
+        summary = metrics.summary()
+        self.assertEqual(
+            list(summary["phases_s"]), ["read_features", "build_features", "write_sink"]
+        )
+        self.assertEqual(summary["counters"], {"retries": 3})
+        self.assertEqual(
+            summary["endpoints"]["/v2/matrix/driving-car"],
+            {
+                "requests": 2,
+                "p50_ms": 100.0,
+                "p95_ms": 300.0,
+                "bytes_sent": 200,
+                "bytes_received": 4000,
+            },
+        )
+        self.assertIn("retries: 3", metrics.report())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics.json")
+            metrics.write(path)
+            with open(path) as f:
+                self.assertEqual(json.load(f)["counters"], {"retries": 3})
+
+    def test_response_cache(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = ResponseCache(os.path.join(folder, "cache.sqlite"), max_bytes=1000)
+
+            key = ResponseCache.make_key(
+                "https://api.openrouteservice.org/", "/v2/matrix/driving-car?", {"id": 1, "a": 1}
+            )
+            # the request id is not part of the key
+            self.assertEqual(
+                key,
+                ResponseCache.make_key(
+                    "https://api.openrouteservice.org", "/v2/matrix/driving-car?", {"a": 1, "id": 2}
+                ),
+            )
+
+            self.assertIsNone(cache.get(key))
+            cache.put(key, "https://api.openrouteservice.org", {"durations": [[0.0]]})
+            self.assertEqual(cache.get(key), {"durations": [[0.0]]})
+
+            # least recently used responses are evicted
+            for i in range(20):
+                cache.put(str(i), "http://localhost:8082/ors", {"value": os.urandom(20 * i).hex()})
+            stats = cache.stats()
+            self.assertLessEqual(stats["bytes"], 1000)
+            self.assertIsNone(cache.get("0"))
+            self.assertIsNotNone(cache.get("19"))
+
+            cache.clear("http://localhost:8082/ors")
+            self.assertEqual(cache.stats()["entries"], 0)
+
     def test_client_request_geometry(self):
         test_response = {
             "type": "FeatureCollection",
@@ -431,3 +599,305 @@ class TestCommon(unittest.TestCase):
 
         feats = isochrones.get_features(response, id_field_value)
         self.assertAlmostEqual(next(feats).geometry().area(), 3.176372365487623e-05)
+
+    def test_isochrones_multiple_locations(self):
+        def feature(group_index, value, offset):
+            ring = [[offset, 0], [offset + 1, 0], [offset + 1, 1], [offset, 1], [offset, 0]]
+            return {
+                "type": "Feature",
+                "properties": {"group_index": group_index, "value": value, "center": [offset, 0]},
+                "geometry": {"coordinates": [ring], "type": "Polygon"},
+            }
+
+        response = {
+            "type": "FeatureCollection",
+            "features": [feature(0, 60.0, 0), feature(1, 60.0, 10), feature(1, 120.0, 10)],
+        }
+        isochrones = isochrones_core.Isochrones()
+        isochrones.set_parameters("driving-car", "time", 60)
+
+        feats = list(isochrones.get_features(response, None, ["first", "second"]))
+        self.assertEqual(
+            [(feat.attributes()[0], feat.attributes()[3]) for feat in feats],
+            [("second", 2), ("first", 1), ("second", 1)],
+        )
+
+        # co-located features share a location of the request
+        feats = list(isochrones.get_features(response, None, [["first"], ["second", "third"]]))
+        self.assertEqual(
+            [(feat.attributes()[0], feat.attributes()[3]) for feat in feats],
+            [("second", 2), ("third", 2), ("first", 1), ("second", 1), ("third", 1)],
+        )
+
+    def test_export_network_merger(self):
+        def node(node_id, x):
+            return {"nodeId": node_id, "location": [x, 0.5]}
+
+        def edge(from_id, to_id):
+            return {"fromId": from_id, "toId": to_id, "weight": 1.0}
+
+        # node 2 lies on the border of both tiles, node 3 beyond the border of the first,
+        # the edge between 1 and 5 inside the first is exported with the second as well
+        west = {
+            "nodes": [node(1, 0.5), node(5, 0.8), node(2, 1.0), node(3, 1.5)],
+            "edges": [edge(1, 5), edge(1, 2), edge(2, 3), edge(1, 4)],
+        }
+        east = {
+            "nodes": [node(1, 0.5), node(5, 0.8), node(2, 1.0), node(3, 1.5), node(4, 1.8)],
+            "edges": [edge(1, 5), edge(2, 3), edge(3, 4)],
+        }
+
+        merger = export_core.NetworkMerger()
+        nodes, edges = merger.add_tile([[0.0, 0.0], [1.0, 1.0]], west)
+        self.assertEqual([node_id for node_id, _ in nodes], [1, 5, 2, 3])
+        self.assertEqual([edge[:2] for edge in edges], [(1, 5), (1, 2), (2, 3)])
+        # node 4 is unknown yet
+        self.assertEqual(merger.pending_edges, [(1, 4, 1.0, [0.5, 0.5], None)])
+
+        nodes, edges = merger.add_tile([[1.0, 0.0], [2.0, 1.0]], east)
+        self.assertEqual([node_id for node_id, _ in nodes], [4])
+        self.assertEqual([edge[:2] for edge in edges], [(1, 4), (3, 4)])
+        self.assertEqual(edges[0][3:], ([0.5, 0.5], [1.8, 0.5]))
+        self.assertEqual(merger.pending_edges, [])
+
+    def test_graph(self):
+        # a -> b -> c is cheaper than a -> c, d is only reachable from c
+        nodes = [(30, [0.0, 0.0]), (10, [1.0, 0.0]), (20, [2.0, 0.0]), (40, [3.0, 0.0])]
+        edges = [(30, 10, 1.0), (10, 20, 2.0), (30, 20, 5.0), (20, 40, 1.0), (20, 30, 1.0)]
+        graph = graph_core.Graph.from_network(nodes, edges)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "graph.npz")
+            graph.save(path)
+            graph = graph_core.Graph.load(path)
+
+        self.assertEqual(graph.offsets.tolist(), [0, 2, 3, 5, 5])
+        self.assertEqual(graph.nearest_node(2.1, 0.1), 2)
+
+        costs, predecessors = graph.cost_tree(0)
+        self.assertEqual(costs, {0: 0.0, 1: 1.0, 2: 3.0, 3: 4.0})
+        self.assertEqual(graph.get_path(predecessors, 3), [0, 1, 2, 3])
+        self.assertEqual(graph.cost_tree(0, max_cost=3.5)[0], {0: 0.0, 1: 1.0, 2: 3.0})
+
+        self.assertEqual(graph.shortest_path(0, 3), (4.0, [0, 1, 2, 3]))
+        self.assertEqual(graph.shortest_path(3, 0), (None, []))
+
+        with self.assertRaises(ValueError):
+            graph_core.Graph.from_network(nodes, [(30, 50, 1.0)])
+
+    def test_matrix_tiles(self):
+        tiles = matrix_core.get_tiles(120, 70, 3500)
+        self.assertTrue(all(len(rows) * len(columns) <= 3500 for rows, columns in tiles))
+
+        # every cell is covered exactly once
+        cells = [(s, d) for rows, columns in tiles for s in rows for d in columns]
+        self.assertEqual(len(cells), 120 * 70)
+        self.assertEqual(len(set(cells)), 120 * 70)
+
+        # narrow matrices get wide tiles
+        self.assertEqual(matrix_core.get_tiles(10000, 2, 3500)[0], (range(0, 1750), range(0, 2)))
+
+        params = matrix_core.get_tile_params(
+            (range(1, 3), range(0, 1)), [[0, 0], [1, 1], [2, 2]], [[5, 5]]
+        )
+        self.assertEqual(params["locations"], [[1, 1], [2, 2], [5, 5]])
+        self.assertEqual(params["sources"], [0, 1])
+        self.assertEqual(params["destinations"], [2])
+
+    def test_matrix_features(self):
+        durations = matrix_core._empty_block(2, 2)
+        distances = matrix_core._empty_block(2, 2)
+        durations[0][0] = 3600
+        distances[0][0] = 1000
+
+        chunks = list(
+            matrix_core.get_features(range(2), durations, distances, ["a", "b"], ["x", "y"])
+        )
+        feats = [feat for chunk in chunks for feat in chunk]
+        self.assertEqual(len(feats), 4)
+        self.assertEqual(feats[0].attributes(), ["a", "x", 1.0, 1.0])
+        self.assertEqual(feats[3].attributes()[:2], ["b", "y"])
+        self.assertFalse(feats[3].attributes()[2])
+
+    def test_matrix_symmetric(self):
+        tiles = matrix_core.get_tiles(100, 100, 900, symmetric=True)
+        # upper triangle of a 4 x 4 grid of 30 x 30 tiles
+        self.assertEqual(len(tiles), 10)
+        self.assertTrue(all(columns.start >= rows.start for rows, columns in tiles))
+        cells = {(s, d) for rows, columns in tiles for s in rows for d in columns}
+        self.assertTrue(all((s, d) in cells for s in range(100) for d in range(s + 1, 100)))
+
+        points = [[0, 0], [1, 1]]
+        params = matrix_core.get_tile_params((range(0, 2), range(0, 2)), points, points)
+        self.assertEqual(params["locations"], points)
+        self.assertEqual(params["destinations"], [0, 1])
+
+        durations = matrix_core._empty_block(2, 2)
+        distances = matrix_core._empty_block(2, 2)
+        durations[0][1] = 3600
+        distances[0][1] = 1000
+        for mode, expected in (
+            ("Unique pairs only", [["a", "y"]]),
+            ("Mirror upper triangle", [["a", "y"], ["b", "x"]]),
+        ):
+            chunks = matrix_core.get_features(
+                range(2), durations, distances, ["a", "b"], ["x", "y"], mode
+            )
+            feats = [feat for chunk in chunks for feat in chunk]
+            self.assertEqual([feat.attributes()[:2] for feat in feats], expected)
+            self.assertEqual(feats[-1].attributes()[2:], [1.0, 1.0])
+
+    def test_matrix_array_writer(self):
+        import numpy as np
+
+        durations = np.array([[0.0, 60.0], [90.0, 0.0]])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "matrix.npy")
+            writer = matrix_core.ArrayWriter(path, ["a", "b"], ["x", "y"])
+            writer.write(range(2), durations, durations * 10)
+            writer.close()
+
+            arrays = np.load(path)
+            self.assertEqual(arrays.shape, (2, 2, 2))
+            self.assertEqual(arrays[0, 1, 0], 90.0)
+            self.assertEqual(arrays[1, 0, 1], 600.0)
+            with open(matrix_core.ArrayWriter.get_ids_path(path)) as f:
+                self.assertEqual(json.load(f)["destinations_ids"], ["x", "y"])
+
+    def test_matrix_nearest_tiles(self):
+        nearest = [[0, 1], [1, 2], [7, 8], [8, 9]]
+        tiles = matrix_core.get_nearest_tiles(nearest, 6)
+        self.assertEqual(tiles, [(range(0, 2), [0, 1, 2]), (range(2, 4), [7, 8, 9])])
+
+    def test_request_point_features_filters(self):
+        points = [QgsPointXY(8.68, 49.41), QgsPointXY(8.69, 49.41), QgsPointXY(8.70, 49.41)]
+        route_dict = {
+            "start": {"geometries": points, "values": ["a", "b", "c"]},
+            "end": {"geometries": points, "values": ["a", "b", "c"]},
+        }
+
+        # pairs with the same location are skipped
+        self.assertEqual(directions_core.count_request_point_features(route_dict, "All-by-All"), 6)
+
+        pair_filter = directions_core.get_pair_filter(
+            route_dict, "All-by-All", skip_reverse=True, max_distance=1000
+        )
+        features = list(
+            directions_core.get_request_point_features(route_dict, "All-by-All", None, pair_filter)
+        )
+        self.assertEqual([values for _, values in features], [("a", "b"), ("b", "c")])
+        self.assertEqual(features[0][0], [[8.68, 49.41], [8.69, 49.41]])
+        self.assertEqual(
+            directions_core.count_request_point_features(
+                route_dict, "All-by-All", None, pair_filter
+            ),
+            2,
+        )
+
+    def test_unique_request_point_features(self):
+        a, b, c = QgsPointXY(8.68, 49.41), QgsPointXY(8.69, 49.41), QgsPointXY(8.70, 49.41)
+        route_dict = {
+            "start": {"geometries": [a, QgsPointXY(8.6800001, 49.41), b], "values": [1, 2, 3]},
+            "end": {"geometries": [b, b, c, QgsPointXY(8.6800002, 49.41)], "values": [4, 5, 6, 7]},
+        }
+
+        # routes starting and ending at the same rounded location are skipped
+        features = list(directions_core.get_unique_request_point_features(route_dict, "All-by-All"))
+        self.assertEqual(
+            features,
+            [
+                ([[8.68, 49.41], [8.69, 49.41]], [(1, 4), (1, 5), (2, 4), (2, 5)]),
+                ([[8.68, 49.41], [8.7, 49.41]], [(1, 6), (2, 6)]),
+                ([[8.69, 49.41], [8.7, 49.41]], [(3, 6)]),
+                ([[8.69, 49.41], [8.68, 49.41]], [(3, 7)]),
+            ],
+        )
+        self.assertEqual(
+            sum(len(values) for _, values in features),
+            directions_core.count_request_point_features(route_dict, "All-by-All"),
+        )
+
+        features = list(directions_core.get_unique_request_point_features(route_dict, "Row-by-Row"))
+        self.assertEqual(
+            features,
+            [
+                ([[8.68, 49.41], [8.69, 49.41]], [(1, 4), (2, 5)]),
+                ([[8.69, 49.41], [8.7, 49.41]], [(3, 6)]),
+            ],
+        )
+
+    def test_request_journal(self):
+        feature = QgsFeature()
+        feature.setGeometry(
+            QgsGeometry.fromPolylineXY([QgsPointXY(8.68, 49.41), QgsPointXY(8.69, 49.42)])
+        )
+        feature.setAttributes(["a", 1.5])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "routes.journal.jsonl")
+            key = RequestJournal.make_key("/v2/directions/driving-car", {"id": None}, ["a"])
+            self.assertNotEqual(
+                key, RequestJournal.make_key("/v2/directions/driving-car", {"id": None}, ["b"])
+            )
+
+            journal = RequestJournal(path, "directions_from_points_2_layers")
+            journal.write(key, [feature])
+            journal.close()
+
+            resumed = RequestJournal(path, "directions_from_points_2_layers", resume=True)
+            self.assertIn(key, resumed)
+            replayed = list(resumed.replay())
+            resumed.close()
+            self.assertEqual(len(replayed), 1)
+            self.assertEqual(replayed[0].attributes(), ["a", 1.5])
+            self.assertTrue(replayed[0].geometry().equals(feature.geometry()))
+
+            with self.assertRaises(ValueError):
+                RequestJournal(path, "isochrones_from_layer", resume=True)
+
+            # a completed run removes its journal
+            RequestJournal(path, "directions_from_points_2_layers", resume=True).remove()
+            self.assertFalse(os.path.exists(path))
+
+        self.assertIsNone(get_journal_path("memory:Routes"))
+        self.assertEqual(
+            get_journal_path(os.path.abspath("routes.gpkg|layername=routes")),
+            os.path.abspath("routes.journal.jsonl"),
+        )
+
+    def test_extra_info_features_merged_runs(self):
+        response = {
+            "features": [
+                {
+                    "geometry": {
+                        "coordinates": [
+                            [8.68, 49.41, 100.0],
+                            [8.69, 49.41, 101.0],
+                            [8.70, 49.41, 102.0],
+                            [8.71, 49.41, 103.0],
+                        ]
+                    },
+                    "properties": {
+                        "extras": {
+                            "surface": {"values": [[0, 2, 3], [2, 3, 1]]},
+                            "steepness": {"values": [[0, 3, 0]]},
+                        }
+                    },
+                }
+            ]
+        }
+
+        feats = directions_core.get_extra_info_features_directions(
+            response, ["surface", "steepness"]
+        )
+        self.assertEqual(len(feats), 3)
+        self.assertEqual(feats[1].attributes(), ["Asphalt", "0% - <1% decline"])
+
+        merged = directions_core.get_extra_info_features_directions(
+            response, ["surface", "steepness"], ["a", "b"], merge_runs=True
+        )
+        self.assertEqual(len(merged), 2)
+        self.assertEqual(merged[0].geometry().constGet().numPoints(), 3)
+        self.assertEqual(merged[0].attributes()[:4], ["a", "b", "Asphalt", "0% - <1% decline"])
+        self.assertAlmostEqual(merged[0].attributes()[4], 1.447, places=2)
+        self.assertEqual(merged[1].attributes()[2], "Paved")
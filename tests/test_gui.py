@@ -871,3 +871,33 @@ class TestGui(unittest.TestCase):
 
         # Should not crash and list should be empty
         self.assertEqual(dialog_main.dlg.routing_fromline_list.count(), 0)
+
+    def test_get_avoid_polygons(self):
+        from ORStools.gui.directions_gui import _get_avoid_polygons
+
+        polygon_layer = QgsVectorLayer("Polygon?crs=EPSG:4326", "test_polygons", "memory")
+        for x in (0, 1):
+            feat = QgsFeature()
+            feat.setGeometry(QgsGeometry.fromRect(QgsRectangle(x, 0, x + 1, 1)))
+            polygon_layer.dataProvider().addFeature(feat)
+
+        polygons = _get_avoid_polygons(polygon_layer)
+        self.assertEqual(polygons["type"], "Polygon")
+        self.assertIs(_get_avoid_polygons(polygon_layer), polygons)
+
+        feat = QgsFeature()
+        feat.setGeometry(QgsGeometry.fromRect(QgsRectangle(5, 5, 6, 6)))
+        polygon_layer.dataProvider().addFeature(feat)
+        polygon_layer.updateExtents()
+
+        polygons = _get_avoid_polygons(polygon_layer)
+        self.assertEqual(polygons["type"], "MultiPolygon")
+        self.assertEqual(len(polygons["coordinates"]), 2)
+
+        polygon_layer.startEditing()
+        feat_id = next(polygon_layer.getFeatures()).id()
+        polygon_layer.changeGeometry(feat_id, QgsGeometry.fromRect(QgsRectangle(10, 10, 11, 11)))
+
+        polygons = _get_avoid_polygons(polygon_layer)
+        self.assertEqual(len(polygons["coordinates"]), 3)
+        polygon_layer.rollBack()
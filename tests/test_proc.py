@@ -3,6 +3,7 @@ from qgis.core import (
     QgsProcessingFeedback,
     QgsProcessingContext,
     QgsProcessingUtils,
+    QgsProject,
     QgsVectorLayer,
     QgsFeature,
     QgsGeometry,
@@ -11,15 +12,23 @@ from qgis.core import (
 from qgis.testing import unittest
 from qgis.PyQt.QtCore import QMetaType
 
+import os
+import tempfile
+
+from ORStools.common import graph_core
+from ORStools.utils import configmanager
 from ORStools.utils.wrapper import create_qgs_field
+from ORStools.proc.base_processing_algorithm import BufferedSink
 from ORStools.proc.directions_lines_proc import ORSDirectionsLinesAlgo
 from ORStools.proc.directions_points_layer_proc import ORSDirectionsPointsLayerAlgo
 from ORStools.proc.directions_points_layers_proc import ORSDirectionsPointsLayersAlgo
+from ORStools.proc.graph_routing_proc import ORSGraphRoutingAlgo
 from ORStools.proc.isochrones_layer_proc import ORSIsochronesLayerAlgo
 from ORStools.proc.isochrones_point_proc import ORSIsochronesPointAlgo
 from ORStools.proc.matrix_proc import ORSMatrixAlgo
 from ORStools.proc.snap_layer_proc import ORSSnapLayerAlgo
 from ORStools.proc.snap_point_proc import ORSSnapPointAlgo
+from benchmarks.mock_server import MockOrsServer
 
 
 class TestProc(unittest.TestCase):
@@ -347,3 +356,149 @@ class TestProc(unittest.TestCase):
         self.assertRaises(
             Exception, lambda: snap_points.processAlgorithm(parameters, self.context, self.feedback)
         )
+
+    def test_snapping_chunks(self):
+        layer = QgsVectorLayer("point?crs=epsg:4326", "Scratch point layer", "memory")
+        points = [(8.68, 49.41), (8.68, 49.41), (8.69, 49.41), (8.70, 49.41), (8.71, 49.41)]
+        for x, y in points:
+            feature = QgsFeature()
+            feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+            layer.dataProvider().addFeature(feature)
+
+        config = configmanager.read_config()
+        with MockOrsServer() as server:
+            provider = server.provider(concurrent_requests=2)
+            provider["limits"] = {**provider["limits"], "snap_locations": 2}
+            configmanager.write_config({**config, "providers": config["providers"] + [provider]})
+            try:
+                parameters = {
+                    "INPUT_PROFILE": 0,
+                    "INPUT_PROVIDER": len(config["providers"]),
+                    "IN_POINTS": layer,
+                    "OUTPUT": "TEMPORARY_OUTPUT",
+                    "RADIUS": 300,
+                }
+                snap_points = ORSSnapLayerAlgo().create()
+                dest_id = snap_points.processAlgorithm(parameters, self.context, self.feedback)
+            finally:
+                configmanager.write_config(config)
+
+            # three chunks of at most two points
+            self.assertEqual(server.requests, {"snapping": 3})
+
+        processed_layer = QgsProcessingUtils.mapLayerFromString(dest_id["OUTPUT"], self.context)
+        self.assertEqual(
+            [feat.geometry().asPoint() for feat in processed_layer.getFeatures()],
+            [QgsPointXY(x, y) for x, y in points],
+        )
+
+    def test_graph_routing(self):
+        # a line of nodes from the first to the second point, twice as expensive backwards
+        nodes = [(i, [8.6724 + 0.0046 * i, 49.3988 + 0.00265 * i]) for i in range(5)]
+        edges = [(i, i + 1, 1.0) for i in range(4)] + [(i + 1, i, 2.0) for i in range(4)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            graph_path = os.path.join(directory, "graph.npz")
+            graph_core.Graph.from_network(nodes, edges).save(graph_path)
+
+            parameters = {
+                "INPUT_GRAPH": graph_path,
+                "INPUT_START_LAYER": self.point_layer_1,
+                "INPUT_START_FIELD": None,
+                "INPUT_END_LAYER": self.point_layer_1,
+                "INPUT_END_FIELD": None,
+                "INPUT_MODE": 0,
+                "INPUT_MAX_COST": 0,
+                "OUTPUT": "TEMPORARY_OUTPUT",
+            }
+            costs = {}
+            for mode in [0, 1]:
+                routing = ORSGraphRoutingAlgo().create()
+                dest_id = routing.processAlgorithm(
+                    {**parameters, "INPUT_MODE": mode}, self.context, self.feedback
+                )
+                processed_layer = QgsProcessingUtils.mapLayerFromString(
+                    dest_id["OUTPUT"], self.context
+                )
+                costs[mode] = [feat.attributes()[2] for feat in processed_layer.getFeatures()]
+            self.assertEqual(costs[0], [0.0, 4.0, 8.0, 0.0])
+            self.assertEqual(costs[0], costs[1])
+
+            routing = ORSGraphRoutingAlgo().create()
+            dest_id = routing.processAlgorithm(
+                {**parameters, "INPUT_MODE": 2, "INPUT_MAX_COST": 2}, self.context, self.feedback
+            )
+            processed_layer = QgsProcessingUtils.mapLayerFromString(dest_id["OUTPUT"], self.context)
+            self.assertEqual(
+                sorted(feat.attributes()[1] for feat in processed_layer.getFeatures()),
+                [0, 1, 2, 3, 4],
+            )
+
+    def test_live_output(self):
+        nodes = [(i, [8.6724 + 0.0046 * i, 49.3988 + 0.00265 * i]) for i in range(5)]
+        edges = [(i, i + 1, 1.0) for i in range(4)]
+        project = QgsProject.instance()
+        context = QgsProcessingContext()
+        context.setProject(project)
+
+        with tempfile.TemporaryDirectory() as directory:
+            graph_path = os.path.join(directory, "graph.npz")
+            graph_core.Graph.from_network(nodes, edges).save(graph_path)
+
+            parameters = {
+                "INPUT_GRAPH": graph_path,
+                "INPUT_START_LAYER": self.point_layer_1,
+                "INPUT_START_FIELD": None,
+                "INPUT_END_LAYER": None,
+                "INPUT_END_FIELD": None,
+                "INPUT_MODE": 2,
+                "INPUT_MAX_COST": 0,
+                "INPUT_LIVE_OUTPUT": True,
+                "OUTPUT": "TEMPORARY_OUTPUT",
+                "OUTPUT_METRICS": os.path.join(directory, "metrics.json"),
+            }
+            routing = ORSGraphRoutingAlgo().create()
+            self.assertTrue(routing.prepareAlgorithm(parameters, context, self.feedback))
+            dest_id = routing.processAlgorithm(parameters, context, self.feedback)
+
+            live_layers = [
+                layer
+                for layer in project.mapLayers().values()
+                if layer.name().startswith("Graph_Routes")
+            ]
+            self.assertEqual(len(live_layers), 1)
+            # all nodes are reached from the first point, only itself from the second
+            self.assertEqual(live_layers[0].featureCount(), 6)
+            live_layer_id = live_layers[0].id()
+
+            # the live layer makes way for the output once it is loaded
+            context.addLayerToLoadOnCompletion(
+                dest_id["OUTPUT"], QgsProcessingContext.LayerDetails("Graph routes", project)
+            )
+            results = routing.postProcessAlgorithm(context, self.feedback)
+            self.assertTrue(os.path.exists(parameters["OUTPUT_METRICS"]))
+        self.assertNotIn(live_layer_id, project.mapLayers())
+        # the results of processAlgorithm are kept next to the metrics file
+        self.assertEqual(results["OUTPUT"], dest_id["OUTPUT"])
+        self.assertEqual(results["OUTPUT_METRICS"], parameters["OUTPUT_METRICS"])
+
+    def test_buffered_sink(self):
+        layer = QgsVectorLayer("point?crs=epsg:4326", "Scratch point layer", "memory")
+        sink = BufferedSink(layer.dataProvider(), batch_size=2)
+
+        features = list(self.point_layer_1.getFeatures()) + list(self.point_layer_2.getFeatures())
+        sink.addFeature(features[0])
+        self.assertEqual(layer.featureCount(), 0)
+
+        sink.addFeatures(features[1:])
+        self.assertEqual(layer.featureCount(), 4)
+
+        sink.addFeature(features[0])
+        sink.flush()
+        self.assertEqual(layer.featureCount(), 5)
+        self.assertEqual(sink.count, 5)
+
+        # features are written once the interval passed, even if the batch isn't full
+        sink = BufferedSink(layer.dataProvider(), batch_size=100, interval=0)
+        sink.addFeature(features[0])
+        self.assertEqual(layer.featureCount(), 6)
@@ -1,10 +1,19 @@
 from qgis.testing import unittest
 
-from qgis.core import QgsCoordinateReferenceSystem, QgsPointXY
+from qgis.core import QgsCoordinateReferenceSystem, QgsGeometry, QgsPointXY, QgsWkbTypes
 
+from ORStools.utils import configmanager
 from ORStools.utils.transform import transformToWGS
-from ORStools.utils.convert import decode_polyline
+from ORStools.utils.convert import (
+    decode_extrainfo,
+    decode_extrainfo_values,
+    decode_polyline,
+    decode_polylines,
+    polylines_to_wkb,
+)
+from ORStools.utils.geometry import line_from_coordinates, polygon_from_rings
 from ORStools.utils.processing import get_params_optimize
+from ORStools.utils.spatial import get_nearest, group_by_location, haversine, split_extent
 
 
 class TestUtils(unittest.TestCase):
@@ -36,6 +45,47 @@ class TestUtils(unittest.TestCase):
             ],
         )
 
+    def test_polylines_convert(self):
+        polylines = ["psvcBxg}~KAGUoBMo@Ln@TnB@F", "", "_p~iF~ps|U_ulLnnqC"]
+        decoded = decode_polylines(polylines)
+        self.assertEqual(
+            [[list(point) for point in coordinates] for coordinates in decoded],
+            [decode_polyline(polyline) for polyline in polylines],
+        )
+
+        geometry = QgsGeometry()
+        geometry.fromWkb(polylines_to_wkb(polylines[2:])[0])
+        self.assertEqual(geometry.asWkt(5), "LineString (-120.2 38.5, -120.95 40.7)")
+
+    def test_geometry_from_coordinates(self):
+        line = line_from_coordinates([[8.68, 49.41, 110.5], [8.69, 49.42, 112.0]])
+        self.assertEqual(line.wkbType(), QgsWkbTypes.Type.LineStringZ)
+        self.assertEqual(line.asWkt(2), "LineStringZ (8.68 49.41 110.5, 8.69 49.42 112)")
+
+        polygon = polygon_from_rings(
+            [
+                [[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]],
+                [[1, 1], [2, 1], [2, 2], [1, 1]],
+            ]
+        )
+        self.assertEqual(polygon.wkbType(), QgsWkbTypes.Type.Polygon)
+        self.assertEqual(polygon.constGet().numInteriorRings(), 1)
+        self.assertEqual(polygon.area(), 15.5)
+
+    def test_decode_extrainfo(self):
+        self.assertEqual(decode_extrainfo("surface", 3), "Asphalt")
+        self.assertEqual(decode_extrainfo("surface", 99), "Unknown")
+        self.assertEqual(decode_extrainfo("steepness", -5), ">=16% decline")
+        self.assertEqual(decode_extrainfo("waycategory", 0), "No category")
+        self.assertEqual(decode_extrainfo("waycategory", 3), "TollwaysHighway")
+        self.assertEqual(decode_extrainfo("roadaccessrestrictions", 2), "Customers ")
+        self.assertEqual(decode_extrainfo("traildifficulty", 4), 4)
+
+        self.assertEqual(
+            decode_extrainfo_values("waycategory", [16, 1, 16]), ["Ford", "Highway", "Ford"]
+        )
+        self.assertEqual(decode_extrainfo_values("green", [1, 2]), [1, 2])
+
     def test_get_params_optimize(self):
         points = [
             QgsPointXY(-68.14860459410432725, -16.5050554680791457),
@@ -57,3 +107,47 @@ class TestUtils(unittest.TestCase):
             "options": {"g": True},
         }
         self.assertEqual(get_params_optimize(points, profile, mode), params)
+
+    def test_get_nearest(self):
+        # one degree of longitude is much shorter than one degree of latitude at 60° north
+        origins = [[10.0, 60.0]]
+        destinations = [[10.0, 61.0], [11.5, 60.0], [12.0, 60.0], [10.0, 58.0]]
+
+        self.assertAlmostEqual(haversine(10.0, 60.0, 11.0, 60.0), 55597, delta=1)
+        self.assertEqual(get_nearest(origins, destinations, 2), [[1, 2]])
+        self.assertEqual(get_nearest(origins, destinations, 10), [[1, 2, 0, 3]])
+        self.assertEqual(get_nearest(origins, destinations, 3, max_distance=100000), [[1]])
+
+    def test_group_by_location(self):
+        items = [([8.6800001, 49.41], "a"), ([8.69, 49.41], "b"), ([8.68, 49.4100004], "c")]
+        self.assertEqual(
+            group_by_location(items),
+            {(8.68, 49.41): ["a", "c"], (8.69, 49.41): ["b"]},
+        )
+
+    def test_split_extent(self):
+        # about 111 x 111 km at the equator
+        self.assertEqual(split_extent(0.0, 0.0, 1.0, 1.0, 20000), [[[0.0, 0.0], [1.0, 1.0]]])
+
+        tiles = split_extent(0.0, 0.0, 1.0, 1.0, 4000)
+        self.assertEqual(len(tiles), 4)
+        self.assertEqual(tiles[0], [[0.0, 0.0], [0.5, 0.5]])
+        self.assertEqual(tiles[3], [[0.5, 0.5], [1.0, 1.0]])
+
+        # a degree of longitude is half as long at 60° north
+        self.assertEqual(len(split_extent(0.0, 60.0, 1.0, 61.0, 4000)), 2)
+
+    def test_config_snapshot(self):
+        config = configmanager.read_config()
+        config["providers"][0]["timeout"] = -1
+        self.assertNotEqual(configmanager.read_config()["providers"][0]["timeout"], -1)
+
+        changes = []
+        configmanager.notifier.configChanged.connect(lambda: changes.append(True))
+        original = configmanager.read_config()
+        try:
+            configmanager.write_config(config)
+            self.assertEqual(changes, [True])
+            self.assertEqual(configmanager.read_config()["providers"][0]["timeout"], -1)
+        finally:
+            configmanager.write_config(original)